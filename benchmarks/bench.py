@@ -0,0 +1,304 @@
+#
+# Copyright The NOMAD Authors.
+#
+# This file is part of NOMAD. See https://nomad-lab.eu for further info.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Benchmarks of the phases of the conversions in both directions.
+
+    python benchmarks/bench.py [INPUTS]... [--repeat N] [--synthetic SIZE]...
+                               [--output results.json] [--compare baseline.json]
+
+Each yaml input is timed through the phases of the yaml -> nxdl conversion
+(footer_split, yaml_load, comment_extraction, recursive_build,
+pretty_format_xml), each nxdl input through the phases of the nxdl -> yaml
+conversion (nxdl_parse, xmlparse). Without inputs, some definitions of the
+tests next to the benchmarks are used, so that the suite runs from a checkout
+of the nyaml repository. Synthetic definitions with SIZE groups are converted in
+both directions.
+
+The results are written as json, which a later run can be compared with.
+"""
+
+import contextlib
+import io
+import json
+import platform
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import click
+
+from nyaml.comment_collector import CommentCollector
+from nyaml.generator import generate_yaml
+from nyaml.helper import LineLoader, split_lines, split_yaml_and_nxdl_lines
+from nyaml.manifest import get_nyaml_version
+from nyaml.nxdl2nyaml import nxdl_tree_to_yaml, parse
+from nyaml.nyaml2nxdl import (
+    build_nxdl_tree,
+    get_nxdl_copyright_license_from_text,
+    new_conversion_context,
+    pretty_format_xml,
+    set_copyright_text,
+    yaml_to_nxdl,
+)
+
+__all__ = ["BENCH_FORMAT_VERSION", "run_benchmarks"]
+
+BENCH_FORMAT_VERSION = 1
+# Definitions of the tests of the nyaml repository, used without inputs
+TEST_DATA = Path(__file__).resolve().parents[1] / "tests" / "data"
+DEFAULT_INPUTS = (
+    "NXcanSAS.yaml",
+    "Ref_NXellipsometry.yaml",
+    "Ref_NXentry.yaml",
+    "Ref_NXcanSAS.nxdl.xml",
+    "Ref_NXellips.nxdl.xml",
+    "NXentry.nxdl.xml",
+)
+# Number of groups of the synthetic definitions, see nyaml.generator
+DEFAULT_SYNTHETIC_SIZES = (100, 1000)
+
+
+def time_phase(func: Callable, repeat: int):
+    """Call func repeat times and return its last result and the run times."""
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return result, times
+
+
+def summarize_times(times: List[float]) -> Dict[str, float]:
+    """Return the statistics of the run times of a phase, in seconds."""
+    return {
+        "min": min(times),
+        "median": statistics.median(times),
+        "mean": statistics.mean(times),
+    }
+
+
+def bench_yaml_to_nxdl(yaml_text, repeat):
+    """Time the phases of the yaml -> nxdl conversion of a yaml text."""
+    times = {}
+    (yaml_lines, _, nxdl_lines), times["footer_split"] = time_phase(
+        lambda: split_yaml_and_nxdl_lines(split_lines(yaml_text)), repeat
+    )
+    yaml_part = "".join(yaml_lines)
+    yml_appdef, times["yaml_load"] = time_phase(
+        lambda: LineLoader(yaml_part).get_single_data(), repeat
+    )
+
+    def extract_comments():
+        comment_blocks = CommentCollector(
+            loaded_obj=yml_appdef, input_text=yaml_part, input_lines=yaml_lines
+        )
+        comment_blocks.extract_all_comment_blocks()
+        return comment_blocks
+
+    comment_blocks, times["comment_extraction"] = time_phase(extract_comments, repeat)
+
+    with new_conversion_context() as context:
+        context.comment_blocks = comment_blocks
+        context.category = yml_appdef["category"]
+        set_copyright_text(get_nxdl_copyright_license_from_text("".join(nxdl_lines)))
+        # Formatting changes the tree, so that each run formats a new one
+        times["recursive_build"] = []
+        times["pretty_format_xml"] = []
+        for _ in range(repeat):
+            tree, build_times = time_phase(lambda: build_nxdl_tree(yml_appdef), 1)
+            _, format_times = time_phase(lambda: pretty_format_xml(*tree), 1)
+            times["recursive_build"] += build_times
+            times["pretty_format_xml"] += format_times
+    return times
+
+
+def bench_nxdl_to_yaml(nxdl_text, repeat):
+    """Time the phases of the nxdl -> yaml conversion of a nxdl text."""
+    times = {}
+    nxdl_bytes = nxdl_text.encode("utf-8")
+    (pi_comments, root), times["nxdl_parse"] = time_phase(
+        lambda: parse(io.BytesIO(nxdl_bytes)), repeat
+    )
+    _, times["xmlparse"] = time_phase(
+        lambda: nxdl_tree_to_yaml(root, pi_comments), repeat
+    )
+    return times
+
+
+def bench_entry(name, direction, text, repeat):
+    """Run the benchmark of a single input and return its json entry."""
+    if direction == "yaml2nxdl":
+        times = bench_yaml_to_nxdl(text, repeat)
+    else:
+        times = bench_nxdl_to_yaml(text, repeat)
+    return {
+        "name": name,
+        "direction": direction,
+        "size": len(text.encode("utf-8")),
+        "lines": text.count("\n"),
+        "phases": {
+            phase: summarize_times(phase_times) for phase, phase_times in times.items()
+        },
+    }
+
+
+def collect_inputs(inputs):
+    """Expand the input files and directories into (yaml or nxdl) files."""
+    files = []
+    for input_path in map(Path, inputs):
+        if input_path.is_dir():
+            files += sorted(input_path.glob("*.yaml")) + sorted(
+                input_path.glob("*.nxdl.xml")
+            )
+        else:
+            files.append(input_path)
+    return files
+
+
+def run_benchmarks(inputs=(), synthetic_sizes=(), repeat=5):
+    """
+    Benchmark the conversion of the input files and of synthetic definitions of
+    the given sizes. Return the results as json compatible dict.
+    """
+    benchmarks = []
+    for input_file in collect_inputs(inputs):
+        direction = (
+            "nxdl2yaml" if input_file.name.endswith(".nxdl.xml") else "yaml2nxdl"
+        )
+        text = input_file.read_text(encoding="utf-8")
+        benchmarks.append(bench_entry(input_file.name, direction, text, repeat))
+    for size in synthetic_sizes:
+        yaml_text = generate_yaml(width=size)
+        benchmarks.append(
+            bench_entry(f"synthetic-{size}.yaml", "yaml2nxdl", yaml_text, repeat)
+        )
+        benchmarks.append(
+            bench_entry(
+                f"synthetic-{size}.nxdl.xml",
+                "nxdl2yaml",
+                yaml_to_nxdl(yaml_text),
+                repeat,
+            )
+        )
+    return {
+        "format_version": BENCH_FORMAT_VERSION,
+        "nyaml_version": get_nyaml_version(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": repeat,
+        "benchmarks": benchmarks,
+    }
+
+
+def format_results(results, baseline=None):
+    """
+    Format the median times of the results as table. With the results of a
+    baseline run, the ratio of the times to the baseline ones is shown as well.
+    """
+    baseline_times = {}
+    if baseline is not None:
+        for entry in baseline["benchmarks"]:
+            for phase, phase_times in entry["phases"].items():
+                baseline_times[(entry["name"], phase)] = phase_times["median"]
+
+    lines = [f"{'input':<32} {'phase':<20} {'median [ms]':>12}"]
+    if baseline is not None:
+        lines[0] += f" {'baseline [ms]':>14} {'ratio':>7}"
+    for entry in results["benchmarks"]:
+        for phase, phase_times in entry["phases"].items():
+            median = phase_times["median"]
+            line = f"{entry['name']:<32} {phase:<20} {median * 1e3:>12.3f}"
+            base = baseline_times.get((entry["name"], phase))
+            if base is not None:
+                ratio = median / base if base else float("inf")
+                line += f" {base * 1e3:>14.3f} {ratio:>7.2f}"
+            lines.append(line)
+    return "\n".join(lines)
+
+
+@click.command()
+@click.argument(
+    "inputs",
+    nargs=-1,
+    type=click.Path(exists=True),
+)
+@click.option(
+    "--repeat",
+    default=5,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Number of runs of each phase.",
+)
+@click.option(
+    "--synthetic",
+    "synthetic_sizes",
+    multiple=True,
+    type=click.IntRange(min=1),
+    help=(
+        "Number of groups of a synthetic definition to benchmark as well, can be "
+        f"given several times. [default: {', '.join(map(str, DEFAULT_SYNTHETIC_SIZES))}]"
+    ),
+)
+@click.option(
+    "--output",
+    type=click.Path(dir_okay=False),
+    help="Write the results as json into this file.",
+)
+@click.option(
+    "--compare",
+    type=click.Path(exists=True, dir_okay=False),
+    help="Compare the results with the json results of an earlier run.",
+)
+def main(inputs, repeat, synthetic_sizes, output, compare):
+    """Benchmark the phases of the nyaml <-> nxdl conversions."""
+    if not inputs:
+        inputs = [TEST_DATA / name for name in DEFAULT_INPUTS]
+        missing = [str(input_file) for input_file in inputs if not input_file.is_file()]
+        if missing:
+            raise click.UsageError(
+                f"The default inputs {', '.join(missing)} are missing, give the "
+                "files to benchmark as arguments."
+            )
+    inputs = collect_inputs(inputs)
+    if not inputs:
+        raise click.UsageError("No yaml or nxdl files found in the given inputs.")
+    if not synthetic_sizes:
+        synthetic_sizes = DEFAULT_SYNTHETIC_SIZES
+    # The messages of the converters would mix with the json output
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = run_benchmarks(inputs, synthetic_sizes, repeat)
+    baseline = None
+    if compare:
+        with open(compare, encoding="utf-8") as baseline_file:
+            baseline = json.load(baseline_file)
+    click.echo(format_results(results, baseline), err=output is None)
+    if output:
+        with open(output, "w", encoding="utf-8") as output_file:
+            json.dump(results, output_file, indent=2)
+            output_file.write("\n")
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()  # pylint: disable=no-value-for-parameter
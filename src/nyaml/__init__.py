@@ -19,3 +19,20 @@
 """
 nyaml is a tool to convert nyaml to nxdl and vice versa.
 """
+
+__all__ = ["nxdl_to_yaml", "yaml_to_nxdl"]
+
+
+def __getattr__(name):
+    # The converters, and with them lxml and yaml, are only imported when used,
+    # so that the client of the conversion server (nyaml.client) starts fast
+    # pylint: disable=import-outside-toplevel
+    if name == "nxdl_to_yaml":
+        from nyaml.nxdl2nyaml import nxdl_to_yaml
+
+        return nxdl_to_yaml
+    if name == "yaml_to_nxdl":
+        from nyaml.nyaml2nxdl import yaml_to_nxdl
+
+        return yaml_to_nxdl
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
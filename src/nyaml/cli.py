@@ -24,46 +24,41 @@ file which details a hierarchy of data/metadata elements. It also allows both wa
 conversion beteen YAML and nxdl.xml files that follows rules of NeXus ontology or data format.
 """
 
+import glob
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from pathlib import Path
 
 import click
 
-from nyaml.helper import (
-    extend_yamlfile_by_nxdl_as_comment,
-    get_sha256_hash,
-    separate_hash_yaml_and_nxdl,
+from nyaml.helper import write_text_if_changed
+from nyaml.manifest import BuildManifest
+from nyaml.nxdl2nyaml import nxdl_to_yaml
+from nyaml.nyaml2nxdl import yaml_to_nxdl
+from nyaml.profiling import cpu_profile, profile_conversions
+from nyaml.server import (
+    DEFAULT_SOCKET_PATH,
+    ServerUnavailableError,
+    is_server_running,
+    request_conversion,
+    serve,
 )
-from nyaml.nxdl2nyaml import Nxdl2yaml
-from nyaml.nyaml2nxdl import nyaml2nxdl
 
 DEPTH_SIZE = 4 * " "
 NXDL_SUFFIX = ".nxdl.xml"
+# Extensions (as returned by split_name_and_extension) the converter accepts
+SUPPORTED_EXTENSIONS = ("yaml", "nxdl.xml")
+GLOB_CHARS = ("*", "?", "[")
 
 # NOTE: Some handful links for nyaml2nxdl converter:
 # https://manual.nexusformat.org/nxdl_desc.html?highlight=optional
 
 
-def generate_nxdl_or_retrieve_nxdl(yaml_file, out_xml_file, verbose):
-    """
-    Generate yaml, nxdl and hash.
-
-    If the extracted hash is exactly the same as produced from generated yaml then
-    retrieve the nxdl part from provided yaml.
-    Else, generate nxdl from separated yaml with the help of nyaml2nxdl function
-    """
-    file_path = Path(yaml_file)
-    pa_path, rel_file = file_path.parent, file_path.name
-    sep_yaml = (pa_path / f"temp_{rel_file}").as_posix()
-    hash_found = separate_hash_yaml_and_nxdl(yaml_file, sep_yaml, out_xml_file)
-
-    if hash_found:
-        gen_hash = get_sha256_hash(sep_yaml)
-        if hash_found == gen_hash:
-            Path(sep_yaml).unlink()
-            return
-
-    nyaml2nxdl(sep_yaml, out_xml_file, verbose)
-    Path(sep_yaml).unlink()
+def read_text(file_path):
+    """Read a (utf-8) text file."""
+    with open(file_path, encoding="utf-8") as file_obj:
+        return file_obj.read()
 
 
 def split_name_and_extension(file_path):
@@ -80,8 +75,375 @@ def split_name_and_extension(file_path):
     return full_path_stem, ext[1:]
 
 
+def convert_file(
+    input_file,
+    output_file=None,
+    verbose=False,
+    do_not_store_nxdl=False,
+    check_consistency=False,
+):
+    """
+    Convert a single nyaml or nxdl.xml file, dispatching on its extension.
+
+    Return the path of the generated output file.
+    """
+    if Path(input_file).is_file():
+        raw_name, ext = split_name_and_extension(input_file)
+    else:
+        raise ValueError("Need a valid input file.")
+    if ext == "yaml":
+        nxdl_text = yaml_to_nxdl(read_text(input_file), verbose, name=input_file)
+
+        # For consistency running
+        if check_consistency:
+            yaml_out_file = f"{raw_name}_consistency.{ext}"
+            write_text_if_changed(
+                yaml_out_file, nxdl_to_yaml(nxdl_text, verbose, store_nxdl=False)
+            )
+            return yaml_out_file
+        xml_out_file = (
+            f"{raw_name}{NXDL_SUFFIX}" if output_file is None else output_file
+        )
+        write_text_if_changed(xml_out_file, nxdl_text)
+        return xml_out_file
+    if ext == "nxdl.xml":
+        # Store nxdl.xml file in output yaml file under SHA HASH
+        yaml_text = nxdl_to_yaml(
+            read_text(input_file), verbose, store_nxdl=not do_not_store_nxdl
+        )
+
+        # Taking care of consistency running
+        if check_consistency:
+            xml_out_file = f"{raw_name}_consistency.{ext}"
+            write_text_if_changed(xml_out_file, yaml_to_nxdl(yaml_text, verbose))
+            return xml_out_file
+        yaml_out_file = (
+            f"{raw_name}_parsed.yaml" if output_file is None else output_file
+        )
+        write_text_if_changed(yaml_out_file, yaml_text)
+        return yaml_out_file
+    raise ValueError("Provide correct file with extension '.yaml or '.nxdl.xml")
+
+
+def convert_file_with_server(socket_path, input_file, output_file=None, **options):
+    """
+    Convert a single file through the conversion server listening on socket_path.
+
+    Fall back to converting in the current process if no server accepts the
+    connection. Return the path of the generated output file.
+    """
+    try:
+        response = request_conversion(
+            socket_path, input_file, output_file=output_file, **options
+        )
+    except ServerUnavailableError:
+        return convert_file(input_file, output_file, **options)
+    if response["stdout"]:
+        click.echo(response["stdout"], nl=False)
+    if not response["ok"]:
+        raise ValueError(response["error"])
+    return get_output_file(input_file, output_file, options.get("check_consistency"))
+
+
+def get_output_file(input_file, output_file=None, check_consistency=False):
+    """Return the path of the file that convert_file generates for input_file."""
+    raw_name, ext = split_name_and_extension(input_file)
+    if ext not in SUPPORTED_EXTENSIONS:
+        raise ValueError("Provide correct file with extension '.yaml or '.nxdl.xml")
+    if check_consistency:
+        return f"{raw_name}_consistency.{ext}"
+    if output_file is not None:
+        return output_file
+    if ext == "yaml":
+        return f"{raw_name}{NXDL_SUFFIX}"
+    return f"{raw_name}_parsed.yaml"
+
+
+def get_manifest_options(options):
+    """Return the conversion options that influence the generated files."""
+    return {
+        "do_not_store_nxdl": options["do_not_store_nxdl"],
+        "check_consistency": options["check_consistency"],
+    }
+
+
+def get_manifest(output_file, manifests):
+    """Return (and cache in manifests) the manifest next to output_file."""
+    directory = Path(output_file).parent
+    if directory not in manifests:
+        manifests[directory] = BuildManifest(directory)
+    return manifests[directory]
+
+
+def split_up_to_date_files(input_files, manifests, output_file=None, **options):
+    """
+    Separate the input files whose outputs are still valid according to the build
+    manifests from the ones that need to be converted.
+    """
+    up_to_date, to_convert = [], []
+    for input_file in input_files:
+        try:
+            out_file = get_output_file(
+                input_file, output_file, options["check_consistency"]
+            )
+        except ValueError:
+            # convert_file reports the problem
+            to_convert.append(input_file)
+            continue
+        manifest = get_manifest(out_file, manifests)
+        if manifest.is_up_to_date(
+            input_file, [out_file], get_manifest_options(options)
+        ):
+            up_to_date.append(input_file)
+        else:
+            to_convert.append(input_file)
+    return up_to_date, to_convert
+
+
+def has_supported_extension(file_path):
+    """Check whether the converter knows how to handle the given file."""
+    _, ext = split_name_and_extension(file_path)
+    return ext in SUPPORTED_EXTENSIONS
+
+
+def expand_input_files(inputs):
+    """
+    Expand directories and glob patterns into a list of files to be converted.
+
+    Plain file paths are kept as they are, directories contribute all their
+    (non-recursive) nyaml and nxdl.xml files and glob patterns (with '**' support)
+    contribute their matching nyaml and nxdl.xml files. Duplicates are removed
+    while the order of appearance is kept.
+    """
+    files = []
+    for inp in inputs:
+        if Path(inp).is_dir():
+            files.extend(
+                path.as_posix()
+                for path in sorted(Path(inp).iterdir())
+                if path.is_file() and has_supported_extension(path.as_posix())
+            )
+        elif any(char in inp for char in GLOB_CHARS) and not Path(inp).exists():
+            files.extend(
+                path
+                for path in sorted(glob.glob(inp, recursive=True))
+                if Path(path).is_file() and has_supported_extension(path)
+            )
+        else:
+            files.append(inp)
+    return list(dict.fromkeys(files))
+
+
+def get_cpu_profile_file(cpu_profile_dir, input_file):
+    """Return the path of the pstats dump of an input file in cpu_profile_dir."""
+    return Path(cpu_profile_dir) / f"{Path(input_file).name}.prof"
+
+
+def _convert_file_in_worker(
+    input_file, options, socket_path=None, cpu_profile_dir=None, speedscope=False
+):
+    """
+    Run convert_file in a (worker) process or send it to the conversion server.
+
+    Returns a tuple (input_file, output_file, error) where error is None on
+    success. Exceptions are turned into a message, so that a single broken
+    file does not abort the whole batch. With cpu_profile_dir, the conversion
+    runs under cProfile (see get_cpu_profile_file and cpu_profile).
+    """
+    try:
+        if cpu_profile_dir is not None:
+            with cpu_profile(
+                get_cpu_profile_file(cpu_profile_dir, input_file), speedscope
+            ):
+                output_file = convert_file(input_file, **options)
+        elif socket_path is None:
+            output_file = convert_file(input_file, **options)
+        else:
+            response = request_conversion(socket_path, input_file, **options)
+            if not response["ok"]:
+                return (
+                    input_file,
+                    None,
+                    f"{response['error_type']}: {response['error']}",
+                )
+            output_file = get_output_file(
+                input_file, check_consistency=options["check_consistency"]
+            )
+    except Exception as exc:  # pylint: disable=broad-exception-caught
+        return input_file, None, f"{type(exc).__name__}: {exc}"
+    return input_file, output_file, None
+
+
+def convert_files_in_parallel(
+    input_files,
+    jobs=None,
+    socket_path=None,
+    cpu_profile_dir=None,
+    speedscope=False,
+    **options,
+):
+    """
+    Convert many files through a pool of worker processes.
+
+    Results are yielded as (input_file, output_file, error) tuples in the order
+    the conversions finish. With a single job the files are converted one after
+    another in the current process. If a conversion server is running on
+    socket_path, the files are sent to it instead (jobs requests at a time).
+    With cpu_profile_dir, each conversion is profiled in its worker process and
+    no server is used.
+    """
+    jobs = jobs or os.cpu_count() or 1
+    jobs = min(jobs, len(input_files))
+    if cpu_profile_dir is not None or (
+        socket_path is not None and not is_server_running(socket_path)
+    ):
+        socket_path = None
+    profile_args = (cpu_profile_dir, speedscope)
+    if jobs <= 1:
+        for input_file in input_files:
+            yield _convert_file_in_worker(
+                input_file, options, socket_path, *profile_args
+            )
+        return
+
+    executor_class = ProcessPoolExecutor if socket_path is None else ThreadPoolExecutor
+    with executor_class(max_workers=jobs) as executor:
+        futures = [
+            executor.submit(
+                _convert_file_in_worker, input_file, options, socket_path, *profile_args
+            )
+            for input_file in input_files
+        ]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def run_batch(
+    input_files,
+    jobs,
+    incremental=False,
+    socket_path=None,
+    cpu_profile_dir=None,
+    speedscope=False,
+    **options,
+):
+    """
+    Convert all input files in parallel and report progress on the fly.
+
+    With incremental, files that are up to date according to the build manifests
+    are skipped. With cpu_profile_dir, a pstats dump (and with speedscope a
+    speedscope file) of each conversion is written into it. Return the number of
+    files that failed to be converted.
+    """
+    manifests = {}
+    to_convert = input_files
+    if incremental:
+        up_to_date, to_convert = split_up_to_date_files(
+            input_files, manifests, **options
+        )
+        for input_file in up_to_date:
+            click.echo(f"Up to date {input_file}")
+
+    failures = []
+    for input_file, output_file, error in convert_files_in_parallel(
+        to_convert, jobs, socket_path, cpu_profile_dir, speedscope, **options
+    ):
+        if error is None:
+            click.echo(f"Converted {input_file} -> {output_file}")
+            if incremental:
+                get_manifest(output_file, manifests).record(
+                    input_file, [output_file], get_manifest_options(options)
+                )
+        else:
+            click.echo(f"Failed {input_file}: {error}", err=True)
+            failures.append((input_file, error))
+    for manifest in manifests.values():
+        manifest.save()
+
+    if failures:
+        click.echo(
+            f"\n{len(failures)} of {len(input_files)} file(s) failed to convert:",
+            err=True,
+        )
+        for input_file, error in failures:
+            click.echo(f"  {input_file}: {error}", err=True)
+    return len(failures)
+
+
+def print_profile(profile):
+    """Print the table of a ConversionProfile on stderr."""
+    click.echo(profile.format_table(), err=True)
+
+
+def convert_inputs(
+    input_files,
+    output_file,
+    jobs,
+    incremental,
+    socket_path,
+    cpu_profile_file=None,
+    cpu_profile_dir=None,
+    speedscope=False,
+    **options,
+):
+    """
+    Convert the input files, directories or glob patterns of launch_tool. Return
+    the number of files that failed to be converted.
+
+    A single input file is profiled into cpu_profile_file or cpu_profile_dir,
+    several ones into cpu_profile_dir only (see cpu_profile).
+    """
+    if len(input_files) == 1 and Path(input_files[0]).is_file():
+        input_file = input_files[0]
+        manifests = {}
+        if incremental:
+            up_to_date, _ = split_up_to_date_files(
+                [input_file], manifests, output_file, **options
+            )
+            if up_to_date:
+                click.echo(f"Up to date {input_file}")
+                return 0
+        if cpu_profile_file is not None or cpu_profile_dir is not None:
+            with cpu_profile(
+                cpu_profile_file or get_cpu_profile_file(cpu_profile_dir, input_file),
+                speedscope,
+            ):
+                out_file = convert_file(input_file, output_file=output_file, **options)
+        elif socket_path is None:
+            out_file = convert_file(input_file, output_file=output_file, **options)
+        else:
+            out_file = convert_file_with_server(
+                socket_path, input_file, output_file=output_file, **options
+            )
+        if incremental:
+            manifest = get_manifest(out_file, manifests)
+            manifest.record(input_file, [out_file], get_manifest_options(options))
+            manifest.save()
+        return 0
+
+    files = expand_input_files(input_files)
+    if len(files) == 1 and files[0] == input_files[0]:
+        # A single path which is neither a file, a directory nor a glob pattern
+        raise ValueError("Need a valid input file.")
+    if output_file is not None:
+        raise click.UsageError(
+            "--output-file can only be used together with a single input file."
+        )
+    if cpu_profile_file is not None:
+        raise click.UsageError(
+            "--cpu-profile can only be used together with a single input file, "
+            "use --cpu-profile-dir for several files."
+        )
+    if not files:
+        raise click.UsageError(f"No nyaml or nxdl.xml files found in {input_files}.")
+
+    return run_batch(
+        files, jobs, incremental, socket_path, cpu_profile_dir, speedscope, **options
+    )
+
+
 @click.command()
-@click.argument("input-file")
+@click.argument("input-files", nargs=-1)
 @click.option(
     "--output-file",
     required=False,
@@ -114,59 +476,154 @@ def split_name_and_extension(file_path):
         "to assist in identifying issues in YAML files."
     ),
 )
-# def launch_tool(input_file, verbose, check_consistency):
-def launch_tool(input_file, verbose, do_not_store_nxdl, check_consistency, output_file):
+@click.option(
+    "--jobs",
+    "-j",
+    type=click.IntRange(min=1),
+    default=None,
+    help=(
+        "Number of worker processes used when converting several files "
+        "(default: number of CPU cores)."
+    ),
+)
+@click.option(
+    "--incremental",
+    is_flag=True,
+    default=False,
+    help=(
+        "Skip files whose input, options and nyaml version are unchanged since "
+        "the last conversion, according to a build manifest stored next to the "
+        "output files."
+    ),
+)
+@click.option(
+    "--serve",
+    "run_server",
+    is_flag=True,
+    default=False,
+    help=(
+        "Run a long-lived conversion server listening on the --socket path "
+        "(default: nyaml2nxdl.sock in $XDG_RUNTIME_DIR, or in a private "
+        "directory of the user in the temporary directory) instead of "
+        "converting files."
+    ),
+)
+@click.option(
+    "--socket",
+    "socket_path",
+    envvar="NYAML_SOCKET",
+    default=None,
+    help=(
+        "Unix socket of a conversion server to send the conversions to. Files are "
+        "converted in-process if no server is running. Can also be set through the "
+        "NYAML_SOCKET environment variable."
+    ),
+)
+@click.option(
+    "--profile",
+    is_flag=True,
+    default=False,
+    help=(
+        "Print the time spent in each phase of the conversions and the number of "
+        "calls of each handler on stderr. The files are converted one after "
+        "another in this process."
+    ),
+)
+@click.option(
+    "--cpu-profile",
+    "cpu_profile_file",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help=(
+        "Run the conversion of a single input file under cProfile and write the "
+        "pstats dump into this file."
+    ),
+)
+@click.option(
+    "--cpu-profile-dir",
+    type=click.Path(file_okay=False),
+    default=None,
+    help=(
+        "Run each conversion under cProfile and write the pstats dumps into this "
+        "directory, as <input file name>.prof."
+    ),
+)
+@click.option(
+    "--speedscope",
+    is_flag=True,
+    default=False,
+    help=(
+        "Also write a flame graph for https://www.speedscope.app next to each "
+        "pstats dump, as <name>.speedscope.json."
+    ),
+)
+def launch_tool(
+    input_files,
+    verbose,
+    do_not_store_nxdl,
+    check_consistency,
+    output_file,
+    jobs,
+    incremental,
+    run_server,
+    socket_path,
+    profile,
+    cpu_profile_file,
+    cpu_profile_dir,
+    speedscope,
+):
     """
     Main function that distinguishes the input file format and launches the tools.
-    """
 
-    if Path(input_file).is_file():
-        raw_name, ext = split_name_and_extension(input_file)
-    else:
-        raise ValueError("Need a valid input file.")
-    if ext == "yaml":
-        xml_out_file = (
-            f"{raw_name}{NXDL_SUFFIX}" if output_file is None else output_file
+    INPUT_FILES can be one or more nyaml or nxdl.xml files, directories or glob
+    patterns. Several files are converted in parallel.
+    """
+    if run_server:
+        serve(socket_path or DEFAULT_SOCKET_PATH, jobs)
+        return
+    if not input_files:
+        raise click.UsageError("Missing argument 'INPUT_FILES...'.")
+    if speedscope and cpu_profile_file is None and cpu_profile_dir is None:
+        raise click.UsageError(
+            "--speedscope can only be used together with --cpu-profile or "
+            "--cpu-profile-dir."
         )
-        generate_nxdl_or_retrieve_nxdl(input_file, xml_out_file, verbose)
-
-        # For consistency running
-        if check_consistency:
-            yaml_out_file = f"{raw_name}_consistency.{ext}"
-            converter = Nxdl2yaml([], [])
-            converter.print_yml(xml_out_file, yaml_out_file, verbose)
-            Path(xml_out_file).unlink()
-    elif ext == "nxdl.xml":
-        # if not append:
-        yaml_out_file = (
-            f"{raw_name}_parsed.yaml" if output_file is None else output_file
+    if cpu_profile_dir is not None:
+        Path(cpu_profile_dir).mkdir(parents=True, exist_ok=True)
+    options = {
+        "verbose": verbose,
+        "do_not_store_nxdl": do_not_store_nxdl,
+        "check_consistency": check_consistency,
+    }
+    profile_options = {
+        "cpu_profile_file": cpu_profile_file,
+        "cpu_profile_dir": cpu_profile_dir,
+        "speedscope": speedscope,
+    }
+    if not profile:
+        failures = convert_inputs(
+            input_files,
+            output_file,
+            jobs,
+            incremental,
+            socket_path,
+            **profile_options,
+            **options,
         )
-        converter = Nxdl2yaml([], [])
-        converter.print_yml(input_file, yaml_out_file, verbose)
-        # Store nxdl.xml file in output yaml file under SHA HASH
-        yaml_hash = get_sha256_hash(yaml_out_file)
-        # Lines as divider between yaml and nxdl
-        top_lines = [
-            (
-                "\n# ++++++++++++++++++++++++++++++++++ SHA HASH"
-                " ++++++++++++++++++++++++++++++++++\n"
-            ),
-            f"# {yaml_hash}\n",
-        ]
-        if not do_not_store_nxdl:
-            extend_yamlfile_by_nxdl_as_comment(
-                yaml_file=yaml_out_file,
-                file_to_be_appended=input_file,
-                top_lines_list=top_lines,
-            )
-
-        # Taking care of consistency running
-        if check_consistency:
-            xml_out_file = f"{raw_name}_consistency.{ext}"
-            generate_nxdl_or_retrieve_nxdl(yaml_out_file, xml_out_file, verbose)
-            Path.unlink(yaml_out_file)
     else:
-        raise ValueError("Provide correct file with extension '.yaml or '.nxdl.xml")
+        # The conversions have to run in this process to be profiled
+        with profile_conversions(callback=print_profile):
+            failures = convert_inputs(
+                input_files,
+                output_file,
+                1,
+                incremental,
+                None,
+                **profile_options,
+                **options,
+            )
+    if failures:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
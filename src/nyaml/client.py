@@ -0,0 +1,103 @@
+#
+# Copyright The NOMAD Authors.
+#
+# This file is part of NOMAD. See https://nomad-lab.eu for further info.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Entry point of the nyaml2nxdl command line tool.
+
+The conversion of a single file by a running conversion server (--socket or
+NYAML_SOCKET) is sent from here, with nothing but the standard library and
+nyaml.server imported, so that the client starts within milliseconds. All other
+command lines, and the conversion when no server is running, go to
+nyaml.cli.launch_tool, which imports click and the converters.
+"""
+
+import os
+import sys
+
+from nyaml.server import ServerUnavailableError, request_conversion
+
+__all__ = ["main", "parse_server_request"]
+
+# Flags of launch_tool that are passed on to the server
+REQUEST_FLAGS = {
+    "--verbose": "verbose",
+    "--do-not-store-nxdl": "do_not_store_nxdl",
+    "--check-consistency": "check_consistency",
+}
+# Options of launch_tool with a value that are understood here
+VALUE_OPTIONS = {"--output-file": "output_file", "--socket": "socket_path"}
+
+
+def parse_server_request(args):
+    """
+    Return the socket path, the input file and the options of a command line
+    that converts a single file through a conversion server, None for any other
+    command line (see launch_tool).
+    """
+    values = {"socket_path": os.environ.get("NYAML_SOCKET") or None}
+    options = {option: False for option in REQUEST_FLAGS.values()}
+    input_files = []
+    args = iter(args)
+    for arg in args:
+        name, sep, value = arg.partition("=")
+        if arg in REQUEST_FLAGS:
+            options[REQUEST_FLAGS[arg]] = True
+        elif name in VALUE_OPTIONS:
+            if not sep:
+                value = next(args, None)
+                if value is None:
+                    return None
+            values[VALUE_OPTIONS[name]] = value
+        elif arg.startswith("-"):
+            return None
+        else:
+            input_files.append(arg)
+    if (
+        values["socket_path"] is None
+        or len(input_files) != 1
+        or not os.path.isfile(input_files[0])
+    ):
+        return None
+    options["output_file"] = values.get("output_file")
+    return values["socket_path"], input_files[0], options
+
+
+def main(args=None):
+    """Run nyaml2nxdl, converting through the conversion server if possible."""
+    args = sys.argv[1:] if args is None else list(args)
+    request = parse_server_request(args)
+    if request is not None:
+        socket_path, input_file, options = request
+        try:
+            response = request_conversion(socket_path, input_file, **options)
+        except ServerUnavailableError:
+            pass
+        else:
+            sys.stdout.write(response["stdout"])
+            if not response["ok"]:
+                raise ValueError(response["error"])
+            return 0
+
+    # pylint: disable=import-outside-toplevel
+    from nyaml.cli import launch_tool
+
+    return launch_tool(args)  # pylint: disable=no-value-for-parameter
+
+
+if __name__ == "__main__":
+    sys.exit(main())
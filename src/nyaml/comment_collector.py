@@ -27,7 +27,7 @@ XMLComment and YAMLComment class.
 
 from typing import Any, Dict, List, Tuple, Type, Union
 
-from nyaml.helper import LineLoader
+from nyaml.helper import LineLoader, split_lines
 
 __all__ = ["Comment", "CommentCollector", "XMLComment", "YAMLComment"]
 
@@ -38,32 +38,53 @@ class CommentCollector:
     _comment_chain.
     """
 
-    def __init__(self, input_file: str = None, loaded_obj: Union[object, Dict] = None):
+    def __init__(
+        self,
+        input_file: str = None,
+        loaded_obj: Union[object, Dict] = None,
+        input_text: str = None,
+        input_lines: List[str] = None,
+    ):
         """
         Initialise CommentCollector
         parameters:
             input_file: raw input file (xml, yml)
             loaded_obj: file loaded by third party library
+            input_text: raw yaml text, used instead of reading input_file
+            input_lines: lines of input_text, if they have been split already
         """
         self._comment_chain: List = []
         self.file = input_file
+        self.text = input_text
+        self._lines = input_lines
         self._comment_tracker = 0
-        self._comment_hash: Dict[Tuple, Type[Comment]] = {}
+        # (line annotation, line number) -> comment, see _build_comment_index
+        self._comment_index: Dict[Tuple, Comment] = {}
+        # Loaded yaml dictionary, for yaml comments only
+        self._yaml_dict: Dict = None
         self.comment: Type[Comment]
-        if self.file and not loaded_obj:
+        if self.text is not None:
+            self.comment = YAMLComment
+            if loaded_obj is None:
+                loaded_obj = LineLoader(self.text).get_single_data()
+            if not isinstance(loaded_obj, dict):
+                raise ValueError("Incorrect inputs for CommentCollector")
+            self._yaml_dict = loaded_obj
+        elif self.file and not loaded_obj:
             if self.file.endswith(".xml"):
                 self.comment = XMLComment
             elif self.file.split(".")[-1] == "yaml":
                 self.comment = YAMLComment
+                # Read the file once, for the loader and the comments
                 with open(self.file, encoding="utf-8") as plain_text_yaml:
-                    loader = LineLoader(plain_text_yaml)
-                    self.comment.__yaml_dict__ = loader.get_single_data()
+                    self.text = plain_text_yaml.read()
+                self._yaml_dict = LineLoader(self.text).get_single_data()
             else:
                 raise ValueError("Input file must be a 'yaml' or 'nxdl.xml' type.")
         elif self.file and loaded_obj:
             if self.file.split(".")[-1] == "yaml" and isinstance(loaded_obj, dict):
                 self.comment = YAMLComment
-                self.comment.__yaml_dict__ = loaded_obj
+                self._yaml_dict = loaded_obj
             else:
                 raise ValueError(
                     "Incorrect inputs for CommentCollector e.g. Wrong file extension."
@@ -79,34 +100,58 @@ class CommentCollector:
         intended for comment.
         """
         id_ = 0
-        single_comment = self.comment(comment_id=id_)
-        with open(self.file, encoding="UTF-8") as enc_f:
-            lines = enc_f.readlines()
-            # Make an empty line for last comment if no empty lines in original file
-            if lines[-1] != "":
-                lines.append("")
-            end_line_num = len(lines) - 1
-            for line_num, line in enumerate(lines):
-                if single_comment.is_storing_single_comment():
-                    # If the last comment comes without post nxdl fields, groups and attributes
-                    if "++ SHA HASH ++" in line:
-                        # Handle with stored nxdl.xml file that is not part of yaml
-                        single_comment.process_each_line("post_comment", (line_num + 1))
-                        self._comment_chain.append(single_comment)
-                        break
-                    if line_num < end_line_num:
-                        # Processing file from Line number 1
-                        single_comment.process_each_line(line, (line_num + 1))
-                    else:
-                        # For processing last line of file
-                        single_comment.process_each_line(
-                            line + "post_comment", (line_num + 1)
-                        )
-                        self._comment_chain.append(single_comment)
-                else:
+        if self.comment is YAMLComment:
+            # The following comments share the line info of the first one
+            single_comment = YAMLComment(
+                comment_id=id_, line_info=collect_yaml_line_info(self._yaml_dict)
+            )
+        else:
+            single_comment = self.comment(comment_id=id_)
+        if self._lines is not None:
+            lines = list(self._lines)
+        elif self.text is not None:
+            lines = split_lines(self.text)
+        else:
+            with open(self.file, encoding="UTF-8") as enc_f:
+                lines = enc_f.readlines()
+        # Make an empty line for last comment if no empty lines in original file
+        if lines[-1] != "":
+            lines.append("")
+        end_line_num = len(lines) - 1
+        for line_num, line in enumerate(lines):
+            if single_comment.is_storing_single_comment():
+                # If the last comment comes without post nxdl fields, groups and attributes
+                if "++ SHA HASH ++" in line:
+                    # Handle with stored nxdl.xml file that is not part of yaml
+                    single_comment.process_each_line("post_comment", (line_num + 1))
                     self._comment_chain.append(single_comment)
-                    single_comment = self.comment(last_comment=single_comment)
+                    break
+                if line_num < end_line_num:
+                    # Processing file from Line number 1
                     single_comment.process_each_line(line, (line_num + 1))
+                else:
+                    # For processing last line of file
+                    single_comment.process_each_line(
+                        line + "post_comment", (line_num + 1)
+                    )
+                    self._comment_chain.append(single_comment)
+            else:
+                self._comment_chain.append(single_comment)
+                single_comment = self.comment(last_comment=single_comment)
+                single_comment.process_each_line(line, (line_num + 1))
+        self._build_comment_index()
+
+    def _build_comment_index(self):
+        """
+        Index the comments by their line info (e.g. ('__line__doc', 35)), so
+        that a comment is found in constant time. If several comments share the
+        same line info, the first one in the chain wins.
+        """
+        self._comment_index = {}
+        for cmnt in self._comment_chain:
+            line_info = cmnt.get_line_info()
+            if line_info is not None:
+                self._comment_index.setdefault(line_info, cmnt)
 
     def get_next_comment(self):
         """
@@ -118,21 +163,13 @@ class CommentCollector:
         """
         Get comment using line information.
         """
-        if comment_locs in self._comment_hash:
-            return self._comment_hash[comment_locs]
-
-        line_annot, line_loc = comment_locs
-        for cmnt in self._comment_chain:
-            if line_annot in cmnt:
-                line_loc_ = cmnt.get_line_number(line_annot)
-                if line_loc == line_loc_:
-                    self._comment_hash[comment_locs] = cmnt
-                    return cmnt
+        return self._comment_index.get(comment_locs)
 
     def remove_comment(self, ind):
         """Remove a comment from comment list."""
         if ind < len(self._comment_chain):
             del self._comment_chain[ind]
+            self._build_comment_index()
         else:
             raise ValueError("Oops! Index is out of range.")
 
@@ -154,14 +191,7 @@ class CommentCollector:
                 "Comment_locs should be 'tuple' containing line annotation "
                 "(e.g.__line__doc) and line_loc (e.g. 35)."
             )
-        line_annot, line_loc = comment_locs
-        for cmnt in self._comment_chain:
-            if line_annot in cmnt:
-                line_loc_ = cmnt.get_line_number(line_annot)
-                if line_loc == line_loc_:
-                    self._comment_hash[comment_locs] = cmnt
-                    return True
-        return False
+        return comment_locs in self._comment_index
 
     def __getitem__(self, ind):
         """Get comment from  self.obj._comment_chain by index."""
@@ -234,6 +264,12 @@ class Comment:
         Strore comment text and line or element that is intended for comment.
         """
 
+    def get_line_info(self) -> Union[Tuple[str, int], None]:
+        """
+        Return line annotation and line number of the element that is intended
+        for the comment, if the comment is located by line info.
+        """
+
 
 class XMLComment(Comment):
     """
@@ -354,18 +390,24 @@ class YAMLComment(Comment):
     # Make this class unhashable (needed since we are overwriting __eq__)
     __hash__ = None
 
-    # Class level variable. The main reason behind that to follow structure of
-    # abstract class 'Comment'
-    __yaml_dict__: dict = {}
-    __yaml_line_info: dict = {}
     __comment_escape_char = {"--": "-\\-"}
 
-    def __init__(self, comment_id: int = -1, last_comment: "Comment" = None) -> None:
-        """Initialization of YAMLComment follow Comment class."""
+    def __init__(
+        self,
+        comment_id: int = -1,
+        last_comment: "Comment" = None,
+        line_info: Dict[int, str] = None,
+    ) -> None:
+        """Initialization of YAMLComment follow Comment class.
+
+        The line info table (line number -> '__line__<key>') of the yaml
+        dictionary (see collect_yaml_line_info) is inherited from the last
+        comment if not given.
+        """
         super().__init__(comment_id, last_comment)
-        self.collect_yaml_line_info(
-            YAMLComment.__yaml_dict__, YAMLComment.__yaml_line_info
-        )
+        if line_info is None:
+            line_info = last_comment.line_info if last_comment is not None else {}
+        self.line_info = line_info
 
     def process_each_line(self, text, line_num):
         """Process each line.
@@ -386,14 +428,12 @@ class YAMLComment(Comment):
             if ind > 0:
                 line_key = "__line__" + text[0:ind]
 
-            for l_num, l_key in self.__yaml_line_info.items():
-                if line_num == int(l_num) and line_key == l_key:
-                    self.store_element(line_key, line_num)
-                    break
-                # Comment comes very end of the file
-                if text == "post_comment" and line_key == "":
-                    line_key = "__line__post_comment"
-                    self.store_element(line_key, line_num)
+            if line_key and self.line_info.get(line_num) == line_key:
+                self.store_element(line_key, line_num)
+            # Comment comes very end of the file
+            elif text == "post_comment" and line_key == "" and self.line_info:
+                line_key = "__line__post_comment"
+                self.store_element(line_key, line_num)
 
     def has_post_comment(self):
         """Ensure if this is a post comment or not.
@@ -480,18 +520,6 @@ class YAMLComment(Comment):
             )
         return next(self._elemt.items())
 
-    def collect_yaml_line_info(self, yaml_dict, line_info_dict):
-        """Collect __line__key and corresponding value from
-        a yaml file dictonary in another dictionary.
-        """
-        for line_key, line_n in yaml_dict.items():
-            if "__line__" in str(line_key):
-                line_info_dict[line_n] = str(line_key)
-
-        for _, val in yaml_dict.items():
-            if isinstance(val, dict):
-                self.collect_yaml_line_info(val, line_info_dict)
-
     def __contains__(self, line_key):
         """For checking whether __line__<NAME> is in _elemt dict or not."""
         return line_key in self._elemt
@@ -509,3 +537,21 @@ class YAMLComment(Comment):
                 if left_line.strip() != right_line.strip():
                     return False
         return True
+
+
+def collect_yaml_line_info(yaml_dict, line_info_dict=None):
+    """Collect the lines of the keys of a yaml file dictonary (see LineDict) in
+    another dictionary (line number -> __line__key).
+    """
+    if line_info_dict is None:
+        line_info_dict = {}
+    # Depth first, with an explicit stack for deeply nested yaml files
+    stack = [yaml_dict]
+    while stack:
+        yaml_dict = stack.pop()
+        for key, line_n in yaml_dict.lines.items():
+            line_info_dict[line_n] = f"__line__{key}"
+        stack.extend(
+            reversed([val for val in yaml_dict.values() if isinstance(val, dict)])
+        )
+    return line_info_dict
@@ -0,0 +1,231 @@
+#
+# Copyright The NOMAD Authors.
+#
+# This file is part of NOMAD. See https://nomad-lab.eu for further info.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Generator of synthetic NeXus definitions for scaling and stress tests.
+
+The definitions are built from a seed, so that the same arguments give the same
+definition, and are valid nyaml, which converts to valid nxdl:
+
+    yaml_text = generate_yaml(width=100, depth=2, seed=1)
+    nxdl_text = generate_nxdl(width=100, depth=2, seed=1)
+"""
+
+import random
+from typing import List
+
+from nyaml.nyaml2nxdl import yaml_to_nxdl
+
+__all__ = ["count_groups", "generate_nxdl", "generate_yaml"]
+
+NX_TYPES = ("NX_CHAR", "NX_FLOAT", "NX_INT", "NX_NUMBER", "NX_BOOLEAN", "NX_POSINT")
+NX_UNITS = ("NX_ANY", "NX_LENGTH", "NX_ENERGY", "NX_TIME", "NX_TEMPERATURE")
+# Unit categories only fit numeric fields
+NUMERIC_TYPES = ("NX_FLOAT", "NX_INT", "NX_NUMBER", "NX_POSINT")
+GROUP_CLASSES = ("NXcollection", "NXdata", "NXparameters", "NXnote", "NXprocess")
+WORDS = (
+    "sample",
+    "beam",
+    "detector",
+    "energy",
+    "angle",
+    "intensity",
+    "measured",
+    "value",
+    "of",
+    "the",
+    "in",
+    "along",
+    "axis",
+    "position",
+    "calibrated",
+    "signal",
+)
+XREF_SPECS = ("ISO 18115-1:2023", "ISO 80000-1:2022", "IUPAC Gold Book")
+
+
+def count_groups(width, depth):
+    """Return the number of groups of a definition of the given width and depth."""
+    return sum(width**level for level in range(1, depth + 1))
+
+
+class _DefinitionWriter:
+    """Writes the yaml lines of a synthetic definition with a seeded random."""
+
+    def __init__(self, rng, options):
+        self.rng = rng
+        self.options = options
+        self.lines: List[str] = []
+        self.symbols = [f"n_{ind}" for ind in range(options["symbols"])]
+
+    def sentence(self):
+        """Return a random sentence of six to twelve words."""
+        words = self.rng.choices(WORDS, k=self.rng.randint(6, 12))
+        return " ".join(words).capitalize() + "."
+
+    def comment(self, indent, what):
+        """Add a comment line before an element with the comment density."""
+        if self.rng.random() < self.options["comment_density"]:
+            self.lines.append(f"{indent}# Comment on {what}: {self.sentence()}")
+
+    def doc(self, indent):
+        """Add the doc of an element, with a xref with the xref density."""
+        text = [
+            f"{indent}  {self.sentence()}" for _ in range(self.options["doc_lines"])
+        ]
+        if self.rng.random() >= self.options["xref_density"]:
+            self.lines += [f"{indent}doc: |", *text]
+            return
+        spec = self.rng.choice(XREF_SPECS)
+        # Without a trailing zero, which yaml would drop from the float term
+        term = f"{self.rng.randint(1, 30)}.{self.rng.randint(1, 9)}{self.rng.randint(1, 9)}"
+        self.lines += [
+            f"{indent}doc:",
+            f"{indent}- |",
+            *text,
+            f"{indent}- |",
+            f"{indent}  xref:",
+            f"{indent}    spec: {spec}",
+            f"{indent}    term: {term}",
+            f"{indent}    url: https://example.org/{spec.split()[0].lower()}/{term}",
+        ]
+
+    def dimensions(self, indent):
+        """Add dimensions of rank one to three, made of the symbols if any."""
+        rank = self.rng.randint(1, 3)
+        if self.symbols:
+            dims = self.rng.choices(self.symbols, k=rank)
+        else:
+            dims = [str(self.rng.randint(1, 100)) for _ in range(rank)]
+        dim = f"({dims[0]},)" if rank == 1 else f"({', '.join(dims)})"
+        self.lines += [
+            f"{indent}dimensions:",
+            f"{indent}  rank: {rank}",
+            f"{indent}  dim: {dim}",
+        ]
+
+    def attributes(self, indent, owner):
+        """Add the attributes of a group or field."""
+        for ind in range(self.options["attributes"]):
+            self.comment(indent, f"attribute {ind} of {owner}")
+            self.lines.append(f"{indent}\\@attribute_{ind}:")
+            self.doc(indent + "  ")
+
+    def field(self, indent, name):
+        """Add a typed field with doc, attributes and maybe unit and dimensions."""
+        nx_type = self.rng.choice(NX_TYPES)
+        self.comment(indent, f"field {name}")
+        self.lines.append(f"{indent}{name}({nx_type}):")
+        inner = indent + "  "
+        if nx_type in NUMERIC_TYPES:
+            self.lines.append(f"{inner}unit: {self.rng.choice(NX_UNITS)}")
+        self.doc(inner)
+        if self.rng.random() < self.options["dimensions"]:
+            self.dimensions(inner)
+        self.attributes(inner, name)
+
+    def enumeration(self, indent, name):
+        """Add a field with an enumeration, with or without docs of the items."""
+        items = [f"item_{ind}" for ind in range(self.rng.randint(2, 5))]
+        self.comment(indent, f"enumeration {name}")
+        self.lines.append(f"{indent}{name}:")
+        if self.rng.random() < 0.5:
+            self.lines.append(f"{indent}  enumeration: [{', '.join(items)}]")
+            return
+        self.lines.append(f"{indent}  enumeration:")
+        for item in items:
+            self.lines.append(f"{indent}    {item}:")
+            self.doc(indent + "      ")
+
+    def group(self, indent, name, level):
+        """Add a group with its fields, enumerations, attributes and subgroups."""
+        nx_class = self.rng.choice(GROUP_CLASSES)
+        self.comment(indent, f"group {name}")
+        self.lines.append(f"{indent}{name}({nx_class}):")
+        self.doc(indent + "  ")
+        self.members(indent + "  ", name, level)
+
+    def members(self, indent, owner, level):
+        """Add the members of a group, recursing until the depth is reached."""
+        for ind in range(self.options["fields"]):
+            self.field(indent, f"{owner}_field_{ind}")
+        for ind in range(self.options["enumerations"]):
+            self.enumeration(indent, f"{owner}_mode_{ind}")
+        self.attributes(indent, owner)
+        if level < self.options["depth"]:
+            for ind in range(self.options["width"]):
+                self.group(indent, f"{owner}_group_{ind}", level + 1)
+
+    def definition(self, name, category):
+        """Return the yaml text of the whole definition."""
+        self.lines += ["category: " + category]
+        self.doc("")
+        if self.symbols:
+            self.lines += ["symbols:", f"  doc: {self.sentence()}"]
+            self.lines += [f"  {symbol}: {self.sentence()}" for symbol in self.symbols]
+        self.lines += ["type: group", f"{name}(NXobject):"]
+        self.members("  ", "entry", 0)
+        return "\n".join(self.lines) + "\n"
+
+
+def generate_yaml(
+    width=10,
+    depth=1,
+    fields=2,
+    attributes=1,
+    enumerations=1,
+    dimensions=0.5,
+    symbols=2,
+    xref_density=0.1,
+    comment_density=0.2,
+    doc_lines=2,
+    category="base",
+    name="NXsynthetic",
+    seed=0,
+):
+    """
+    Return the nyaml text of a synthetic definition.
+
+    Each group has `width` subgroups down to `depth` levels of nesting (see
+    count_groups). Every group, the root included, has `fields` fields, of which
+    the given fraction `dimensions` has dimensions, `enumerations` fields with an
+    enumeration and `attributes` attributes. Fields have `attributes` attributes
+    as well. The definition declares `symbols` symbols, which are used in the
+    dimensions. The fractions `xref_density` of the docs get a xref and
+    `comment_density` of the elements a comment. Each doc has `doc_lines` lines.
+    The same arguments always give the same definition.
+    """
+    options = {
+        "width": width,
+        "depth": depth,
+        "fields": fields,
+        "attributes": attributes,
+        "enumerations": enumerations,
+        "dimensions": dimensions,
+        "symbols": symbols,
+        "xref_density": xref_density,
+        "comment_density": comment_density,
+        "doc_lines": max(doc_lines, 1),
+    }
+    writer = _DefinitionWriter(random.Random(seed), options)
+    return writer.definition(name, category)
+
+
+def generate_nxdl(**kwargs):
+    """Return the nxdl text of the synthetic definition of generate_yaml."""
+    return yaml_to_nxdl(generate_yaml(**kwargs))
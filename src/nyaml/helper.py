@@ -23,18 +23,31 @@ The functions and variables are utilised in the converting tool
 to convert from nyaml to nxdl and vice versa.
 """
 
+import abc
 import hashlib
+import io
+import os
+import stat
+import threading
 from typing import Callable
 
 from yaml.composer import Composer
 from yaml.constructor import Constructor
 from yaml.loader import Loader
-from yaml.nodes import ScalarNode
-from yaml.resolver import BaseResolver
+
+try:
+    from yaml import CLoader
+except ImportError:  # PyYAML built without libyaml
+    CLoader = None
 
 # Yaml library does not except the keys (escape char "\t" and yaml separator ":")
 ESCAPE_CHAR_DICT_IN_YAML = {"\t": "    "}
 ESCAPE_CHAR_DICT_IN_XML = {val: key for key, val in ESCAPE_CHAR_DICT_IN_YAML.items()}
+# Lines as divider between yaml and the nxdl stored at the end of the yaml
+SHA_HASH_DIVIDER = (
+    "\n# ++++++++++++++++++++++++++++++++++ SHA HASH"
+    " ++++++++++++++++++++++++++++++++++\n"
+)
 
 # Set up attributes for nxdl version
 NXDL_GROUP_ATTRIBUTES = (
@@ -181,11 +194,60 @@ def check_for_proper_nameType(name, nameType, keyword_name):
             )
 
 
-class LineLoader(Loader):  # pylint: disable=too-many-ancestors
-    """Class to load yaml file with extra non yaml items.
+class LineDict(dict):
+    """
+    Dictionary of a yaml mapping, which knows the line of each of its keys in
+    the yaml file.
+
+    The lines are kept in the side table 'lines' (key -> line number), so that
+    the dictionary itself only holds the yaml content.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lines = {}
+
+    def without(self, keys):
+        """Return a new LineDict with the entries whose key is not in keys."""
+        remaining = LineDict((key, val) for key, val in self.items() if key not in keys)
+        remaining.lines = {key: self.lines[key] for key in remaining}
+        return remaining
+
+
+class LineDictConstructor(abc.ABC):
+    """
+    Construct the yaml mappings of a loader as LineDicts.
+
+    The loaders find the lines of the keys in their own way, see get_key_line.
+    """
+
+    @abc.abstractmethod
+    def get_key_line(self, key_node):
+        """Return the line number of a key node."""
 
-    LineLoader parses a yaml into a python dictionary extended with extra items.
-    The new items have as keys __line__<yaml_keyword> and as values the yaml file line number
+    def construct_mapping(self, node, deep=False):
+        """Construct mapping between node info and line info."""
+        mapping = LineDict(Constructor.construct_mapping(self, node, deep=deep))
+        for key_node, _ in node.value:
+            # The keys are already constructed, construct_object returns them
+            key = self.construct_object(key_node, deep=deep)
+            mapping.lines[key] = self.get_key_line(key_node)
+        return mapping
+
+    def construct_yaml_map(self, node):
+        """Construct a LineDict from a yaml map."""
+        data = LineDict()
+        yield data
+        mapping = self.construct_mapping(node)
+        data.update(mapping)
+        data.lines = mapping.lines
+
+
+class PyLineLoader(LineDictConstructor, Loader):  # pylint: disable=too-many-ancestors
+    """Class to load yaml file with line info.
+
+    LineLoader parses a yaml into a python dictionary, in which every mapping is a
+    LineDict that knows the yaml file line number of each of its keys.
     """
 
     def compose_node(self, parent, index):
@@ -195,23 +257,37 @@ class LineLoader(Loader):  # pylint: disable=too-many-ancestors
         node.__line__ = self.line + 1
         return node
 
-    def construct_mapping(self, node, deep=False):
-        """Construct mapping between node info and line info."""
-        node_pair_lst_for_appending = []
+    def get_key_line(self, key_node):
+        return key_node.__line__
 
-        # Visit through node-pair list
-        for key_node in node.value:
-            shadow_key_node = ScalarNode(
-                tag=BaseResolver.DEFAULT_SCALAR_TAG,
-                value="__line__" + key_node[0].value,
-            )
-            shadow_value_node = ScalarNode(
-                tag=BaseResolver.DEFAULT_SCALAR_TAG, value=key_node[0].__line__
-            )
-            node_pair_lst_for_appending.append((shadow_key_node, shadow_value_node))
 
-        node.value = node.value + node_pair_lst_for_appending
-        return Constructor.construct_mapping(self, node, deep=deep)
+PyLineLoader.add_constructor(
+    "tag:yaml.org,2002:map", LineDictConstructor.construct_yaml_map
+)
+
+if CLoader is not None:
+
+    class CLineLoader(LineDictConstructor, CLoader):  # pylint: disable=too-many-ancestors
+        """
+        Same as PyLineLoader, using the much faster libyaml parser.
+
+        The line of a key is taken from the start mark of its node. For block
+        mappings, the style of nyaml files, this is the line PyLineLoader finds.
+        Within a single line flow mapping ({a: 1, b: 2}) PyLineLoader may give
+        the line its reader has reached instead.
+        """
+
+        def get_key_line(self, key_node):
+            return key_node.start_mark.line + 1
+
+    CLineLoader.add_constructor(
+        "tag:yaml.org,2002:map", LineDictConstructor.construct_yaml_map
+    )
+    LineLoader = CLineLoader
+
+else:  # pragma: no cover
+    CLineLoader = None
+    LineLoader = PyLineLoader
 
 
 def get_yaml_escape_char_dict():
@@ -235,19 +311,6 @@ def type_check(nx_type):
     return nx_type
 
 
-def get_node_parent_info(tree, node):
-    """Return tuple of (parent, index).
-
-    parent = parent node is the first level node under tree node
-    index = index of grand child node of tree
-    """
-
-    # map from grand child to parent which is child of tree
-    parent_map = {c: p for p in tree.iter() for c in p}
-    parent = parent_map[node]
-    return parent, list(parent).index(node)
-
-
 def clean_empty_lines(line_list):
     """Clean up empty lines by top part and bottom and part."""
     if not isinstance(line_list, list):
@@ -316,63 +379,109 @@ def get_sha256_hash(file_name):
     return sha_hash.hexdigest()
 
 
-def extend_yamlfile_by_nxdl_as_comment(
-    yaml_file, file_to_be_appended, top_lines_list=None
-):
-    """Extend yaml file by the file_to_be_appended as comment."""
+def get_sha256_hash_from_text(text):
+    """Generate a sha256_hash for a text, as if it was stored in a utf-8 file."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
 
-    with open(yaml_file, mode="a+", encoding="utf-8") as f1_obj:
-        if top_lines_list:
-            for line in top_lines_list:
-                f1_obj.write(line)
 
-        with open(file_to_be_appended, encoding="utf-8") as f2_obj:
-            for line in f2_obj:
-                f1_obj.write(f"# {line}")
+def write_text_if_changed(file_path, text):
+    """
+    Write text into a (utf-8) file, unless the file already has this content.
 
+    The text is written into a temporary file next to file_path, which then
+    replaces file_path atomically. So an unchanged output keeps its modification
+    time, and an interrupted conversion never leaves a half-written file. Return
+    whether the file has been written.
+    """
+    if os.linesep != "\n":
+        # As written by a file opened in text mode
+        text = text.replace("\n", os.linesep)
+    data = text.encode("utf-8")
+    try:
+        file_stat = os.stat(file_path)
+    except FileNotFoundError:
+        file_stat = None
+    if (
+        file_stat is not None
+        and file_stat.st_size == len(data)
+        and get_sha256_hash(file_path) == hashlib.sha256(data).hexdigest()
+    ):
+        return False
+
+    tmp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "wb") as file_obj:
+            file_obj.write(data)
+        if file_stat is not None:
+            os.chmod(tmp_path, stat.S_IMODE(file_stat.st_mode))
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return True
+
+
+def extend_yaml_by_nxdl_as_comment(yaml_text, nxdl_text):
+    """
+    Extend yaml text by the nxdl text as comment, preceded by the SHA hash of the
+    yaml text.
+    """
+    top_lines = [
+        SHA_HASH_DIVIDER,
+        f"# {get_sha256_hash_from_text(yaml_text)}\n",
+    ]
+    nxdl_lines = [f"# {line}" for line in io.StringIO(nxdl_text)]
+    return "".join([yaml_text, *top_lines, *nxdl_lines])
+
+
+def split_lines(text):
+    """Split a text into lines, keeping the line ends (like file.readlines)."""
+    return io.StringIO(text).readlines()
 
-def separate_hash_yaml_and_nxdl(yaml_file, sep_yaml, sep_xml):
-    """Separate yaml, SHA hash and nxdl parts.
 
-    Separate the provided yaml file into yaml, nxdl and hash if yaml was extended with
-    nxdl at the end of yaml as
+def split_yaml_and_nxdl_lines(lines):
+    """Split the lines of a yaml text into yaml lines, SHA hash and nxdl lines.
+
+    The yaml text may have been extended with the nxdl text at the end of yaml as
 
                     <yaml part>
         '\n# ++++++++++++++++++++++++++++++++++ SHA HASH \
             ++++++++++++++++++++++++++++++++++\n'
          # <has value>'
                     <nxdl part>
+
+    Return the tuple (yaml lines, hash, nxdl lines), where hash is an empty string
+    and nxdl lines an empty list if the yaml has not been extended.
     """
+    if not lines:
+        return [], "", []
+    yaml_lines = []
+    nxdl_lines = []
     sha_hash = ""
-    with open(yaml_file, encoding="utf-8") as inp_file:
-        lines = inp_file.readlines()
-        # file to write yaml part
-        with open(sep_yaml, "w", encoding="utf-8") as yml_f_ob, open(
-            sep_xml, "w", encoding="utf-8"
-        ) as xml_f_ob:
-            write_on_yaml = True
-
-            last_line = lines[0]
-            for line in lines[1:]:
-                # Write in file when ensured that the next line is not with '++ SHA HASH ++'
-                if "++ SHA HASH ++" not in line and write_on_yaml:
-                    yml_f_ob.write(last_line)
-                    last_line = line
-                elif "++ SHA HASH ++" in line:
-                    write_on_yaml = False
-                    last_line = ""
-                elif not write_on_yaml and not last_line:
-                    # The first line of xml file has been found so in future write lines directly
-                    # into xml file.
-                    if not sha_hash:
-                        sha_hash = line.split("# ", 1)[-1].strip()
-                    else:
-                        xml_f_ob.write(line[2:])
-            # If the yaml fiile does not contain any hash for nxdl then we may have last line.
-            if last_line:
-                yml_f_ob.write(last_line)
-
-    return sha_hash
+    write_on_yaml = True
+
+    last_line = lines[0]
+    for line in lines[1:]:
+        # Keep the line when ensured that the next line is not with '++ SHA HASH ++'
+        if "++ SHA HASH ++" not in line and write_on_yaml:
+            yaml_lines.append(last_line)
+            last_line = line
+        elif "++ SHA HASH ++" in line:
+            write_on_yaml = False
+            last_line = ""
+        elif not write_on_yaml and not last_line:
+            # The first line of xml part has been found so in future collect lines
+            # directly into xml part.
+            if not sha_hash:
+                sha_hash = line.split("# ", 1)[-1].strip()
+            else:
+                nxdl_lines.append(line[2:])
+    # If the yaml does not contain any hash for nxdl then we may have last line.
+    if last_line:
+        yaml_lines.append(last_line)
+
+    return yaml_lines, sha_hash, nxdl_lines
 
 
 def is_copyright_comment(text):
@@ -0,0 +1,154 @@
+#
+# Copyright The NOMAD Authors.
+#
+# This file is part of NOMAD. See https://nomad-lab.eu for further info.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Build manifest for incremental conversions.
+
+The manifest is a small json file stored next to the generated files. For each
+converted input it records the hash of the input, the conversion options, the nyaml
+version and the hash of every generated output. A file whose input, options and
+tool version are unchanged, and whose outputs have not been touched since, does not
+need to be converted again.
+"""
+
+import json
+import os
+from importlib.metadata import PackageNotFoundError, version
+from pathlib import Path
+from typing import Dict, Iterable
+
+from nyaml.helper import get_sha256_hash
+
+__all__ = ["MANIFEST_NAME", "BuildManifest", "get_nyaml_version"]
+
+MANIFEST_NAME = ".nyaml_manifest.json"
+MANIFEST_FORMAT_VERSION = 1
+
+
+def get_nyaml_version():
+    """Return the installed nyaml version, which invalidates the manifest entries."""
+    try:
+        return version("nyaml")
+    except PackageNotFoundError:
+        return "unknown"
+
+
+def get_file_stat(file_path):
+    """Return (size, modification time in ns) of a file."""
+    stat = os.stat(file_path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+class BuildManifest:
+    """Manifest of the conversions whose outputs live in one directory."""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.path = self.directory / MANIFEST_NAME
+        self.nyaml_version = get_nyaml_version()
+        self.entries: Dict[str, Dict] = {}
+        self._modified = False
+        if self.path.is_file():
+            try:
+                with open(self.path, encoding="utf-8") as manifest_file:
+                    content = json.load(manifest_file)
+            except (OSError, ValueError):
+                # A broken manifest only means that everything is rebuilt
+                content = {}
+            if content.get("format_version") == MANIFEST_FORMAT_VERSION:
+                self.entries = content.get("files", {})
+
+    def _key(self, file_path):
+        """Key of a file in the manifest, relative to the manifest directory."""
+        try:
+            return Path(os.path.relpath(file_path, self.directory)).as_posix()
+        except ValueError:
+            # e.g. a different drive on Windows
+            return Path(file_path).resolve().as_posix()
+
+    def _file_is_unchanged(self, file_path, record):
+        """Check a file against its record, hashing it only if its stat changed."""
+        if not os.path.isfile(file_path):
+            return False
+        size, mtime_ns = get_file_stat(file_path)
+        if [size, mtime_ns] == record.get("stat"):
+            return True
+        if get_sha256_hash(file_path) != record.get("hash"):
+            return False
+        # Same content, e.g. after a fresh checkout: refresh the stat info
+        record["stat"] = [size, mtime_ns]
+        self._modified = True
+        return True
+
+    def is_up_to_date(self, input_file, output_files: Iterable[str], options: Dict):
+        """
+        Check whether the outputs of input_file can be reused.
+
+        The input is always hashed, the outputs are only hashed if their size or
+        modification time do not match the recorded ones.
+        """
+        entry = self.entries.get(self._key(input_file))
+        if not entry:
+            return False
+        if entry.get("nyaml_version") != self.nyaml_version:
+            return False
+        if entry.get("options") != options:
+            return False
+        if not os.path.isfile(input_file):
+            return False
+        if get_sha256_hash(input_file) != entry.get("input_hash"):
+            return False
+        outputs = entry.get("outputs", {})
+        output_keys = [self._key(output_file) for output_file in output_files]
+        if sorted(output_keys) != sorted(outputs):
+            return False
+        return all(
+            self._file_is_unchanged(output_file, outputs[key])
+            for output_file, key in zip(output_files, output_keys)
+        )
+
+    def record(self, input_file, output_files: Iterable[str], options: Dict):
+        """Record a successful conversion of input_file into output_files."""
+        outputs = {}
+        for output_file in output_files:
+            outputs[self._key(output_file)] = {
+                "hash": get_sha256_hash(output_file),
+                "stat": list(get_file_stat(output_file)),
+            }
+        self.entries[self._key(input_file)] = {
+            "input_hash": get_sha256_hash(input_file),
+            "options": options,
+            "nyaml_version": self.nyaml_version,
+            "outputs": outputs,
+        }
+        self._modified = True
+
+    def save(self):
+        """Write the manifest (atomically) if anything has changed."""
+        if not self._modified:
+            return
+        content = {
+            "format_version": MANIFEST_FORMAT_VERSION,
+            "files": dict(sorted(self.entries.items())),
+        }
+        tmp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as manifest_file:
+            json.dump(content, manifest_file, indent=2)
+            manifest_file.write("\n")
+        os.replace(tmp_path, self.path)
+        self._modified = False
@@ -22,9 +22,11 @@ This file collects the functions for conversion from nxdl.xml to yaml version.
 
 # pylint: disable=too-many-lines
 
+import copy
+import io
+import os
 import re
 import textwrap
-from pathlib import Path
 from typing import Callable, Dict, List
 
 import lxml.etree as ET
@@ -36,75 +38,169 @@ from nyaml.helper import (
     NXDL_LINK_ATTRIBUTES,
     check_for_proper_nameType,
     clean_empty_lines,
-    get_node_parent_info,
+    extend_yaml_by_nxdl_as_comment,
     get_yaml_escape_char_dict,
     is_copyright_comment,
     remove_namespace_from_tag,
+    write_text_if_changed,
 )
+from nyaml.profiling import counted, profile_phase
 
 DEPTH_SIZE = 2 * " "
 CMNT_TAG = "!--"
 CMNT_TAG_END = "--"
-CMNT_START = "<!--"
-CMNT_END = "-->"
 DEFINITION_CATEGORIES = ("category: application", "category: base")
 
 
-def separate_pi_comments(input_file):
-    """Separate PI comments from ProcessesInstruction (PI).
+def parse(filepath, huge_tree=False):
+    """Parse xml function.
 
-    ProcessesInstruction refers xml element process and version
-    Separate the comments that comes immediately after XML process instruction part,
-    i.e. copyright comment part.
+    Parse the nxdl file in a single pass (see parse_nxdl_stream) and return the
+    PI comments and the root element.
     """
-    comments_list = []
-    comment = []
+    return parse_nxdl_stream(filepath, huge_tree)
 
-    with open(input_file, encoding="utf-8") as file:
-        lines = file.readlines()
-        def_tag = "<definition"
-        for line in lines:
-            if CMNT_START in line:
-                line = line.replace(CMNT_START, "")
-                if CMNT_END in line:
-                    line = line.replace(CMNT_END, "")
-                    comments_list.append(line)
-                else:
-                    comment.append(line)
-            elif CMNT_END in line and len(comment) > 0:
-                comment.append(line.replace(CMNT_END, ""))
-                comments_list.append("".join(comment))
-                comment.clear()
-            elif len(comment) > 0:
-                comment.append(line)
-            elif def_tag in line:
-                break
-    return comments_list
-
-
-# Collected: https://dustinoprea.com/2019/01/22/python-parsing-xml-and-retaining-the-comments/
-class _CommentedTreeBuilder(ET.TreeBuilder):
-    def start(self, tag, attrs):
-        super().start(tag=tag, attrs=attrs)
-
-    def Comment(self, text):  # pylint: disable=invalid-name
-        """Defining comment builder in TreeBuilder"""
-        self.start(CMNT_TAG, {})
-        self.data(text)
-        self.end(CMNT_TAG_END)
-
-
-def parse(filepath):
-    """Parse xml function.
 
-    Construct parser function for modified tree builder for including modified TreeBuilder
-    and rebuilding XMLParser.
+def parse_text(nxdl_text, huge_tree=False):
+    """Same as parse, for a nxdl text."""
+    return parse_nxdl_stream(io.BytesIO(nxdl_text.encode("utf-8")), huge_tree)
+
+
+def parse_nxdl_stream(nxdl_source, huge_tree=False):
+    """
+    Parse a nxdl file (path or binary file-like object) with iterparse.
+
+    The comments in front of the definition, i.e. the copyright comment, are
+    collected from the comment events, while the tree with the comments inside
+    the definition is built in the same pass. Return the PI comments and the
+    root element.
+
+    libxml2 limits the nesting of the nxdl to 256 levels and the size of its
+    text nodes. huge_tree lifts these safety limits (up to 2048 levels), so it
+    is only meant for trusted nxdl files.
+    """
+    pi_comments = []
+    root = None
+    events = ET.iterparse(
+        nxdl_source,
+        events=("start", "comment"),
+        encoding="UTF-8",
+        huge_tree=huge_tree,
+    )
+    for event, node in events:
+        if root is not None:
+            continue
+        if event == "comment":
+            pi_comments.append(node.text)
+        else:
+            root = node
+    return pi_comments, events.root
+
+
+def stream_nxdl_to_yaml(nxdl_source, yaml_out, verbose=False, huge_tree=False):
+    """
+    Convert a nxdl file (path or binary file-like object) into yaml, written
+    into the file-like yaml_out while the nxdl is being parsed.
+
+    The root level part of the yaml is written with the first child of the
+    definition after the root level doc that is neither doc nor symbols. Each
+    following child is written and dropped as soon as it has been parsed, so that
+    the memory needed does not grow with the size of the nxdl. The root level
+    symbols must come before that child. The nxdl is not stored in the yaml.
+    For huge_tree, see parse_nxdl_stream.
+    """
+    converter = Nxdl2yaml([], [])
+    converter.pi_comments = []
+    root = None
+    # Children of the definition up to the first one after the doc that is
+    # neither doc nor symbols, None once the root level part has been written
+    root_level_children = []
+    found_doc = False
+    events = ET.iterparse(
+        nxdl_source,
+        events=("start", "end", "comment"),
+        encoding="UTF-8",
+        huge_tree=huge_tree,
+    )
+    for event, node in events:
+        if root is None:
+            if event == "comment":
+                converter.pi_comments.append(node.text)
+            elif event == "start":
+                root = node
+            continue
+        if event == "start" or node.getparent() is not root:
+            continue
+        tag = remove_namespace_from_tag(node.tag)
+        if root_level_children is None:
+            if tag in ("doc", "symbols"):
+                raise ValueError(
+                    f"The root level {tag} has to come right after the root level "
+                    "doc to convert the nxdl incrementally."
+                )
+            converter.xmlparse(yaml_out, {"tree": root, "node": node}, 1, verbose)
+        elif tag in ("doc", "symbols", CMNT_TAG) or not found_doc:
+            found_doc = found_doc or tag == "doc"
+            root_level_children.append(node)
+            continue
+        else:
+            root_level_children.append(copy.deepcopy(node))
+            write_root_level(converter, yaml_out, root, root_level_children, verbose)
+            root_level_children = None
+        # iterparse may have parsed ahead, so only drop what has been written
+        node.clear()
+        while node.getprevious() is not None:
+            del root[0]
+    if root_level_children is not None:
+        write_root_level(converter, yaml_out, root, root_level_children, verbose)
+
+
+def write_root_level(converter, yaml_out, root, children, verbose):
+    """
+    Write the definition with the given children only (see stream_nxdl_to_yaml).
+    """
+    definition = ET.Element(root.tag, attrib=dict(root.attrib), nsmap=root.nsmap)
+    # Moves the children out of root
+    definition.extend(children)
+    converter.xmlparse(yaml_out, {"tree": definition, "node": definition}, 0, verbose)
+
+
+def nxdl_to_yaml(
+    nxdl_text: str,
+    verbose: bool = False,
+    store_nxdl: bool = True,
+    huge_tree: bool = False,
+) -> str:
+    """
+    Convert a nxdl.xml text into nyaml text, without touching the file system.
+
+    With store_nxdl, the nxdl text is appended to the yaml as comment, under the
+    SHA hash of the yaml part (see yaml_to_nxdl). For huge_tree, see
+    parse_nxdl_stream.
+    """
+    with profile_phase("nxdl_parse"):
+        pi_comments, root = parse_text(nxdl_text, huge_tree)
+    yaml_text = nxdl_tree_to_yaml(root, pi_comments, verbose)
+    if store_nxdl:
+        return extend_yaml_by_nxdl_as_comment(yaml_text, nxdl_text)
+    return yaml_text
+
+
+def nxdl_tree_to_yaml(
+    root, pi_comments=(), verbose: bool = False, include_comment: bool = True
+) -> str:
+    """
+    Convert a parsed nxdl tree (see parse) into nyaml text.
+
+    The tree is only read, so that a tree parsed once can be converted again,
+    e.g. with and without the comments.
     """
-    comments = separate_pi_comments(filepath)
-    ctb = _CommentedTreeBuilder()
-    xp_parser = ET.XMLParser(target=ctb, encoding="UTF-8")
-    root = ET.parse(filepath, xp_parser)
-    return comments, root
+    converter = Nxdl2yaml([], [])
+    converter.pi_comments = list(pi_comments) if include_comment else []
+    converter.include_comment = include_comment
+    with profile_phase("yaml_emission"), io.StringIO() as yaml_out:
+        converter.xmlparse(yaml_out, {"tree": root, "node": root}, 0, verbose)
+        return yaml_out.getvalue()
 
 
 def handle_mapping_char(text, depth=-1, skip_n_line_on_top=False):
@@ -152,6 +248,9 @@ class Nxdl2yaml:
         self.symbol_list = symbol_list
         self.include_comment = True
         self.pi_comments = None
+        # Root level doc, symbols and their comments, that are written with the
+        # definition and skipped while descending into the tree
+        self.root_level_nodes = []
         # NOTE: Here is how root_level_comments organised for storing comments
         # root_level_comment= {'root_doc': comment,
         #                      'symbols': comment,
@@ -173,17 +272,26 @@ class Nxdl2yaml:
         self.choice_allowed_attr = ()
 
     def print_yml(self, input_file, output_yml, verbose):
-        """Parse an XML file provided as input and print a YML file."""
-        output_file_path = Path(output_yml)
-        if output_file_path.is_file():
-            output_file_path.unlink()
+        """
+        Parse an XML file provided as input and print a YML file.
 
+        The yaml is collected in memory and written at once into output_yml, which
+        is either a file path or a file-like object.
+        """
         depth = 0
 
-        self.pi_comments, root = parse(input_file)
+        with profile_phase("nxdl_parse"):
+            self.pi_comments, root = parse(input_file)
         xml_tree = {"tree": root, "node": root}
-        self.xmlparse(output_yml, xml_tree, depth, verbose)
+        with profile_phase("yaml_emission"), io.StringIO() as yaml_out:
+            self.xmlparse(yaml_out, xml_tree, depth, verbose)
+            yaml_text = yaml_out.getvalue()
+        if isinstance(output_yml, (str, os.PathLike)):
+            write_text_if_changed(output_yml, yaml_text)
+        else:
+            output_yml.write(yaml_text)
 
+    @counted
     def handle_symbols(self, depth, node):
         """Handle symbols field and its childs symbol"""
 
@@ -245,6 +353,7 @@ class Nxdl2yaml:
 
         self.root_level_comment[holder] = comment
 
+    @counted
     def handle_definition(self, node):
         """Handle definition group and its attributes.
 
@@ -273,6 +382,7 @@ class Nxdl2yaml:
                 self.root_level_definition.append(text)
         self.root_level_definition[keyword_order] = f"{keyword}:"
 
+    @counted
     def handle_root_level_doc(self, node):
         """
         Handle the documentation field found at root level.
@@ -381,6 +491,7 @@ class Nxdl2yaml:
         return text, False
 
     # pylint: disable=too-many-branches, too-many-locals
+    @counted
     def handle_not_root_level_doc(self, depth, text, tag="doc", file_out=None):
         """Handle docs field of group and field but not root.
 
@@ -552,6 +663,7 @@ class Nxdl2yaml:
             self.write_out(indent=0 * DEPTH_SIZE, text=nx_name, file_out=file_out)
         self.found_definition = False
 
+    @counted
     def handle_exists(self, exists_dict, key, val):
         """
         Create exist component as folows:
@@ -578,9 +690,10 @@ class Nxdl2yaml:
             exists_dict["required"] = ["required", val]
 
     # pylint: disable=too-many-branches
+    @counted
     def handle_group_or_field(self, depth, node, file_out):
         """Handle all the possible attributes that come along a field or group"""
-        node_attr = node.attrib
+        node_attr = dict(node.attrib)
         rm_key_list = []
         # Order: name and type in form name(type)
         name = node_attr.get("name", "")
@@ -666,6 +779,7 @@ class Nxdl2yaml:
                     )
 
     # pylint: disable=too-many-branches, too-many-locals, too-many-statements
+    @counted
     def handle_dimensions(self, depth, node, file_out):
         """
         Handle instances of dimensionsType and its child nodes.
@@ -702,7 +816,7 @@ class Nxdl2yaml:
         # individual dimensionsType dim elements - the individual dimensions - if present
         for child in list(node):
             tag = remove_namespace_from_tag(child.tag)
-            child_attrs = child.attrib
+            child_attrs = dict(child.attrib)
             # taking care of index and value attributes
             if tag == "dim":
                 # taking care of index and value in format [[index, value]]
@@ -794,6 +908,7 @@ class Nxdl2yaml:
                                         f"{indent}{' ' * 4}{attr_key}: {attr_val}\n"
                                     )
 
+    @counted
     def handle_enumeration(self, depth, node, file_out):
         """
         Handle the enumeration field parsed from the XML file.
@@ -866,12 +981,13 @@ class Nxdl2yaml:
                 # Short notation as list if there is no comment or open enum
                 file_out.write(f" [{', '.join(enum_list)}]\n")
 
+    @counted
     def handle_attributes(self, depth, node, file_out):
         """Handle the attributes parsed from the xml file"""
 
         name = ""
         nm_attr = "name"
-        node_attr = node.attrib
+        node_attr = dict(node.attrib)
 
         # Maintain order: name and type in form name(type) or (type)name that come first
         name = node_attr.pop(nm_attr, "")
@@ -940,10 +1056,11 @@ class Nxdl2yaml:
                 f"{handle_mapping_char(val, depth_ + 1, False)}\n"
             )
 
+    @counted
     def handle_link(self, depth, node, file_out):
         """Handle link elements of nxdl"""
 
-        node_attr = node.attrib
+        node_attr = dict(node.attrib)
         # Handle special cases
         name = node_attr.pop("name", "")
         if name:
@@ -965,12 +1082,13 @@ class Nxdl2yaml:
                     f"At this moment the allowed keys are {NXDL_LINK_ATTRIBUTES}"
                 )
 
+    @counted
     def handle_choice(self, depth, node, file_out):
         """
         Handle choice element which is a parent node of group.
         """
 
-        node_attr = node.attrib
+        node_attr = dict(node.attrib)
         name = node_attr.pop("name", "")
         # Handle special casees
         if name:
@@ -990,6 +1108,7 @@ class Nxdl2yaml:
                     f"At this moment allowed attributes for choice {self.choice_allowed_attr}"
                 )
 
+    @counted
     def handle_comment(self, depth, node, file_out):
         """
         Collect comment element and pass to write_out function
@@ -998,26 +1117,41 @@ class Nxdl2yaml:
         text = self.convert_to_yaml_comment(depth, node.text)
         self.write_out(indent, text, file_out)
 
-    def recursion_in_xml_tree(self, depth, xml_tree, output_yml, verbose):
-        """
-            Descend lower level in xml tree. If we are in the symbols branch, the recursive
-        behaviour is not triggered as we already handled the symbols' children.
+    def xmlparse(self, output_yml, xml_tree, depth, verbose):
         """
+        Main method of the nxdl2yaml converter.
+        It parses XML tree, then prints each level of the tree into output_yml,
+        which is either a file path or an (open) file-like object. A file path is
+        opened once for the whole tree.
 
-        tree = xml_tree["tree"]
-        node = xml_tree["node"]
-        for child in list(node):
-            xml_tree_children = {"tree": tree, "node": child}
-            self.xmlparse(output_yml, xml_tree_children, depth, verbose)
+        The tree is walked depth first with an explicit stack instead of
+        recursion, so that deeply nested definitions do not hit the recursion
+        limit. The nodes are written in document order (see parse_node).
+        """
+        if isinstance(output_yml, (str, os.PathLike)):
+            with open(output_yml, "a", encoding="utf-8") as file_out:
+                self.xmlparse(file_out, xml_tree, depth, verbose)
+            return
+        stack = [(xml_tree["node"], depth)]
+        while stack:
+            node, depth = stack.pop()
+            if not self.parse_node(output_yml, node, depth, verbose):
+                continue
+            # Descend lower level in xml tree. The root level doc and symbols
+            # have already been handled with the definition.
+            children = [
+                child
+                for child in node
+                if depth != 0 or child not in self.root_level_nodes
+            ]
+            stack.extend((child, depth + 1) for child in reversed(children))
 
     # pylint: disable=too-many-branches, too-many-statements
-    def xmlparse(self, output_yml, xml_tree, depth, verbose):
+    def parse_node(self, file_out, node, depth, verbose):
         """
-        Main method of the nxdl2yaml converter.
-        It parses XML tree, then prints recursively each level of the tree
+        Print a single node of the xml tree into the file-like file_out. Return
+        whether the children of the node have to be printed too.
         """
-        tree = xml_tree["tree"]
-        node = xml_tree["node"]
         if verbose:
             if isinstance(node.tag, Callable):
                 print(f"Node tag: {node.tag}\n")
@@ -1025,69 +1159,64 @@ class Nxdl2yaml:
             else:
                 print(f"Node tag: {remove_namespace_from_tag(node.tag)}\n")
                 print(f"Attributes: {node.attrib}\n")
-        with open(output_yml, "a", encoding="utf-8") as file_out:
-            # too much file I/O, this with statement is in the recursion build
-            # the entire yaml dictionary nest in main memory and dump thereafter
-            tag = remove_namespace_from_tag(node.tag)
-            if tag == "definition":
-                self.found_definition = True
-                self.handle_definition(node)
-                # Taking care of root level doc and symbols
-                remove_cmnt_n = None
-                last_comment = ""
-                for child in node:
-                    tag_tmp = remove_namespace_from_tag(child.tag)
-                    if tag_tmp == CMNT_TAG and self.include_comment:
-                        last_comment = self.convert_to_yaml_comment(depth, child.text)
-                        remove_cmnt_n = child
-                    if tag_tmp == "doc":
-                        self.store_root_level_comments("root_doc", last_comment)
-                        last_comment = ""
-                        self.handle_root_level_doc(child)
-                        node.remove(child)
-                        if remove_cmnt_n is not None:
-                            node.remove(remove_cmnt_n)
-                            remove_cmnt_n = None
-                    if tag_tmp == "symbols":
-                        self.store_root_level_comments("symbols", last_comment)
-                        last_comment = ""
-                        self.handle_symbols(depth, child)
-                        node.remove(child)
-                        if remove_cmnt_n is not None:
-                            node.remove(remove_cmnt_n)
-                            remove_cmnt_n = None
-
-            if tag == "doc" and depth != 1:
-                parent = get_node_parent_info(tree, node)[0]
-                doc_parent = remove_namespace_from_tag(parent.tag)
-                if doc_parent != "item":
-                    self.handle_not_root_level_doc(
-                        depth, text=node.text, tag=node.tag, file_out=file_out
-                    )
-
-            recurse_again = True
-            if self.found_definition is True and self.root_level_doc:
-                self.print_root_level_info(depth, file_out)
-            # End of print root-level definitions in file
-            if tag in ("field", "group") and depth != 0:
-                self.handle_group_or_field(depth, node, file_out)
-            if tag == ("attribute"):
-                self.handle_attributes(depth, node, file_out)
-            if tag == ("enumeration"):
-                self.handle_enumeration(depth, node, file_out)
-                recurse_again = False
-            if tag == ("dimensions"):
-                # self.handle_dimension(depth, node, file_out)
-                self.handle_dimensions(depth, node, file_out)
-                recurse_again = False
-            if tag == ("link"):
-                self.handle_link(depth, node, file_out)
-            if tag == ("choice"):
-                self.handle_choice(depth, node, file_out)
-            if tag == CMNT_TAG and self.include_comment:
-                self.handle_comment(depth, node, file_out)
+        tag = remove_namespace_from_tag(node.tag)
+        if tag == "definition":
+            self.found_definition = True
+            self.handle_definition(node)
+            # Taking care of root level doc and symbols
+            self.root_level_nodes = []
+            remove_cmnt_n = None
+            last_comment = ""
+            for child in node:
+                tag_tmp = remove_namespace_from_tag(child.tag)
+                if tag_tmp == CMNT_TAG and self.include_comment:
+                    last_comment = self.convert_to_yaml_comment(depth, child.text)
+                    remove_cmnt_n = child
+                if tag_tmp == "doc":
+                    self.store_root_level_comments("root_doc", last_comment)
+                    last_comment = ""
+                    self.handle_root_level_doc(child)
+                    self.root_level_nodes.append(child)
+                    if remove_cmnt_n is not None:
+                        self.root_level_nodes.append(remove_cmnt_n)
+                        remove_cmnt_n = None
+                if tag_tmp == "symbols":
+                    self.store_root_level_comments("symbols", last_comment)
+                    last_comment = ""
+                    self.handle_symbols(depth, child)
+                    self.root_level_nodes.append(child)
+                    if remove_cmnt_n is not None:
+                        self.root_level_nodes.append(remove_cmnt_n)
+                        remove_cmnt_n = None
+
+        if tag == "doc" and depth != 1:
+            parent = node.getparent()
+            doc_parent = remove_namespace_from_tag(parent.tag)
+            if doc_parent != "item":
+                self.handle_not_root_level_doc(
+                    depth, text=node.text, tag=node.tag, file_out=file_out
+                )
 
-        if recurse_again is True:
-            depth += 1
-            # Write nested nodes
-            self.recursion_in_xml_tree(depth, xml_tree, output_yml, verbose)
+        recurse_again = True
+        if self.found_definition is True and self.root_level_doc:
+            self.print_root_level_info(depth, file_out)
+        # End of print root-level definitions in file
+        if tag in ("field", "group") and depth != 0:
+            self.handle_group_or_field(depth, node, file_out)
+        if tag == ("attribute"):
+            self.handle_attributes(depth, node, file_out)
+        if tag == ("enumeration"):
+            self.handle_enumeration(depth, node, file_out)
+            recurse_again = False
+        if tag == ("dimensions"):
+            # self.handle_dimension(depth, node, file_out)
+            self.handle_dimensions(depth, node, file_out)
+            recurse_again = False
+        if tag == ("link"):
+            self.handle_link(depth, node, file_out)
+        if tag == ("choice"):
+            self.handle_choice(depth, node, file_out)
+        if tag == CMNT_TAG and self.include_comment:
+            self.handle_comment(depth, node, file_out)
+
+        return recurse_again
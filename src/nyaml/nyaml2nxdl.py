@@ -20,14 +20,16 @@
 Creates an instantiated NXDL schema XML tree by walking the dictionary nest
 """
 
+import contextlib
 import datetime
+import functools
+import io
 import os
-import pathlib
 import re
 import textwrap
 import warnings
-from typing import Optional, Union
-from urllib.parse import unquote
+from contextvars import ContextVar
+from typing import Callable, Dict, NamedTuple, Optional, Union
 
 import lxml.etree as ET
 import yaml
@@ -42,11 +44,16 @@ from nyaml.helper import (
     LineLoader,
     check_for_proper_nameType,
     clean_empty_lines,
+    get_sha256_hash_from_text,
     get_yaml_escape_char_reverter_dict,
     is_copyright_comment,
     nx_name_type_resolving,
     remove_namespace_from_tag,
+    split_lines,
+    split_yaml_and_nxdl_lines,
+    write_text_if_changed,
 )
+from nyaml.profiling import counted, profile_phase
 
 DOM_COMMENT = (
     "# NeXus - Neutron and X-ray Common Data Format\n"
@@ -70,77 +77,179 @@ DOM_COMMENT = (
     "#\n"
     "# For further information, see http://www.nexusformat.org\n"
 )
+DEFINITION_START_TAG = "<definition"
 DEPTH_SIZE = 4 * " "
-# Initialised in yml_reader() funtion
-COMMENT_BLOCKS: CommentCollector
-CATEGORY = ""  # Definition would be either 'base' or 'application'
+
+
+class ConversionContext:
+    """
+    State of a single yaml -> nxdl conversion.
+
+    The context of the running conversion lives in a context variable (see
+    get_conversion_context), so that conversions running concurrently in
+    different threads do not share any state.
+    """
+
+    def __init__(self):
+        # Initialised in yml_reader() funtion
+        self.comment_blocks: Optional[CommentCollector] = None
+        # Definition would be either 'base' or 'application'
+        self.category = ""
+        # Copyright text (see set_copyright_text)
+        self.dom_comment = ""
+
+
+_CONVERSION_CONTEXT: ContextVar[ConversionContext] = ContextVar(
+    "nyaml2nxdl_conversion_context"
+)
+
+
+@contextlib.contextmanager
+def new_conversion_context():
+    """Run the with block in a new ConversionContext, which it returns."""
+    context = ConversionContext()
+    token = _CONVERSION_CONTEXT.set(context)
+    try:
+        yield context
+    finally:
+        _CONVERSION_CONTEXT.reset(token)
+
+
+def get_conversion_context() -> ConversionContext:
+    """
+    Return the context of the running conversion. Raise RuntimeError outside of
+    a new_conversion_context, so that no state is kept between conversions.
+    """
+    context = _CONVERSION_CONTEXT.get(None)
+    if context is None:
+        raise RuntimeError(
+            "No yaml -> nxdl conversion is running, see new_conversion_context."
+        )
+    return context
+
+
+@contextlib.contextmanager
+def _running_or_new_conversion_context():
+    """
+    Run the with block in the context of the running conversion, or in a new
+    ConversionContext outside of a conversion.
+    """
+    context = _CONVERSION_CONTEXT.get(None)
+    if context is not None:
+        yield context
+        return
+    with new_conversion_context() as context:
+        yield context
 
 
 def get_nxdl_copyright_license(nxdl_file):
-    """Extract the license part from nxdl file if nxdl file as input."""
-    comment_start_sym = "^<!--"
-    comment_end_sym = "-->\n+$"
+    """Extract the license part from nxdl file if nxdl file as input.
+
+    Return None if there is no such file.
+    """
+    if not os.path.isfile(nxdl_file):
+        return None
+    with open(nxdl_file, encoding="utf-8") as nxdl_file_obj:
+        return get_nxdl_copyright_license_from_text(read_nxdl_prologue(nxdl_file_obj))
+
+
+def read_nxdl_prologue(nxdl_file_obj):
+    """
+    Read the lines of a nxdl text stream up to the start tag of the definition,
+    which end the part that may hold the license. The rest is not read.
+    """
+    lines = []
+    for line in iter(nxdl_file_obj.readline, ""):
+        lines.append(line)
+        if DEFINITION_START_TAG in line:
+            break
+    return "".join(lines)
+
+
+def get_nxdl_copyright_license_from_text(nxdl_text):
+    """Extract the license part from the comments in front of the definition
+    of a nxdl text."""
+    definition_ind = nxdl_text.find(DEFINITION_START_TAG)
+    if definition_ind >= 0:
+        nxdl_text = nxdl_text[:definition_ind]
     is_comment_start = False
-    is_comment_end = False
-
-    if os.path.isfile(nxdl_file):
-        with open(nxdl_file, encoding="utf-8") as nxdl_file_obj:
-            nxdl_lines = nxdl_file_obj.readlines()
-            comment = ""
-            for line in nxdl_lines:
-                # Find a single comment
-                if re.match(comment_start_sym, line):
-                    is_comment_start = True
-                elif is_comment_start:
-                    if re.match(comment_end_sym, line):
-                        is_comment_end = True
-                    else:
-                        comment += line
+
+    comment = ""
+    for line in io.StringIO(nxdl_text):
+        # Find a single comment
+        if line.startswith("<!--"):
+            is_comment_start = True
+        elif is_comment_start:
+            if line == "-->\n":
                 # Varifiy for copyright comment
-                if is_comment_start and is_comment_end:
-                    if is_copyright_comment(comment):
-                        return comment
-                    else:
-                        comment = ""
-                        is_comment_start = False
-                        is_comment_end = False
-        return ""
+                if is_copyright_comment(comment):
+                    return comment
+                comment = ""
+                is_comment_start = False
+            else:
+                comment += line
+    return ""
 
 
 # pylint: disable=too-many-lines
 def set_copyright_text(nxdl_copyright_license=""):
     """Set copyright text from nxdl file or create from current year."""
 
-    global DOM_COMMENT
+    context = get_conversion_context()
     if nxdl_copyright_license:
-        DOM_COMMENT = nxdl_copyright_license
+        context.dom_comment = nxdl_copyright_license
     else:
         copyright_year = (
             f"{datetime.datetime.now().year}-{datetime.datetime.now().year}"
         )
 
-        DOM_COMMENT = DOM_COMMENT.replace("__COPYRIGHT_YEAR__", copyright_year)
+        context.dom_comment = DOM_COMMENT.replace("__COPYRIGHT_YEAR__", copyright_year)
 
 
 def yml_reader(inputfile):
     """
     This function launches the LineLoader class.
-    It parses the yaml in a dict and extends it with line tag keys for each key of the dict.
+    It parses the yaml in a dict, in which each mapping knows the lines of its keys
+    (see LineDict).
     """
-    global COMMENT_BLOCKS
     with open(inputfile, encoding="utf-8") as plain_text_yaml:
-        loader = LineLoader(plain_text_yaml)
-        loaded_yaml = loader.get_single_data()
-    COMMENT_BLOCKS = CommentCollector(inputfile, loaded_yaml)
-    COMMENT_BLOCKS.extract_all_comment_blocks()
+        return yml_reader_from_text(plain_text_yaml.read(), name=inputfile)
+
+
+def yml_reader_from_text(yaml_text, name=None, yaml_lines=None):
+    """
+    Same as yml_reader, for a yaml text. The name (e.g. of the file) of the yaml
+    text is shown in yaml error messages. The lines of the yaml text are reused
+    for the comments, if they have been split already.
+
+    The comments and the category are kept in the context of the running
+    conversion. Outside of a conversion, they are dropped with the context
+    opened for the call.
+    """
+    with _running_or_new_conversion_context() as context:
+        return _read_yaml_text(context, yaml_text, name, yaml_lines)
+
+
+def _read_yaml_text(context, yaml_text, name, yaml_lines):
+    """Load the yaml text and keep its comments and category in the context."""
+    yaml_stream = io.StringIO(yaml_text)
+    if name is not None:
+        # Both the python and the libyaml loader take the name from the stream
+        yaml_stream.name = name
+    with profile_phase("yaml_load"):
+        loaded_yaml = LineLoader(yaml_stream).get_single_data()
+    with profile_phase("comment_extraction"):
+        context.comment_blocks = CommentCollector(
+            loaded_obj=loaded_yaml, input_text=yaml_text, input_lines=yaml_lines
+        )
+        context.comment_blocks.extract_all_comment_blocks()
 
     if "category" not in loaded_yaml.keys():
         raise ValueError(
             "All definitions should be either 'base' or 'application' category. "
             "No category has been found."
         )
-    global CATEGORY
-    CATEGORY = loaded_yaml["category"]
+    context.category = loaded_yaml["category"]
     return loaded_yaml
 
 
@@ -175,19 +284,20 @@ def check_for_default_attribute_and_value(xml_element):
             ):
                 xml_elem.set(deflt_attr, deflt_val)
 
+    category = get_conversion_context().category
     for child in list(xml_element):
         # skipping comment 'function' that mainly collect comment from yaml file.
         if not isinstance(child.tag, str):
             continue
         tag = remove_namespace_from_tag(child.tag)
 
-        if tag == "dim" and CATEGORY == "base":
+        if tag == "dim" and category == "base":
             set_default_attribute(child, base_dim_attr_to_val)
-        if tag == "dim" and CATEGORY == "application":
+        if tag == "dim" and category == "application":
             set_default_attribute(child, application_dim_attr_to_val)
-        if tag in eligible_tag and CATEGORY == "base":
+        if tag in eligible_tag and category == "base":
             set_default_attribute(child, base_attr_to_val)
-        if tag in eligible_tag and CATEGORY == "application":
+        if tag in eligible_tag and category == "application":
             set_default_attribute(child, application_attr_to_val)
         check_for_default_attribute_and_value(child)
 
@@ -211,11 +321,11 @@ def check_for_skipped_attributes(component, value, allowed_attr=None, verbose=Fa
         for attr, val in value.items():
             if attr == "doc":
                 continue
-            if "__line__" in attr or attr in block_tag:
+            if attr in block_tag:
                 continue
-            line_number = f"__line__{attr}"
+            line_loc = value.lines[attr]
             if verbose:
-                print(f"__line__ : {value[line_number]}")
+                print(f"__line__ : {line_loc}")
             if (
                 not isinstance(val, dict)
                 and "\\@" not in attr
@@ -225,7 +335,7 @@ def check_for_skipped_attributes(component, value, allowed_attr=None, verbose=Fa
             ):
                 raise ValueError(
                     f"An attribute '{attr}' in part '{component}' has been found"
-                    f". Please check around line '{value[line_number]}. At this "
+                    f". Please check around line '{line_loc}. At this "
                     f"time, the allowed attributes are {allowed_attr}."
                 )
 
@@ -333,6 +443,7 @@ def handle_each_part_doc(text):
     )
 
 
+@counted
 def xml_handle_doc(obj, value: Union[str, list], line_number=None, line_loc=None):
     """This function creates a 'doc' element instance, and appends it to an existing element"""
     # global comment_bolcks
@@ -349,20 +460,20 @@ def xml_handle_doc(obj, value: Union[str, list], line_number=None, line_loc=None
         xml_handle_comment(obj, line_number, line_loc, doc_elemt)
 
 
+@counted
 def xml_handle_units(obj, value):
     """This function creates a 'units' element instance, and appends it to an existing element"""
     obj.set("units", str(value))
 
 
 # pylint: disable=too-many-branches
+@counted
 def xml_handle_exists(dct, obj, keyword, value):
     """
     This function creates an 'exists' element instance, and appends it to an existing element
     """
-    line_number = f"__line__{keyword}"
-    assert value is not None, (
-        f"Line {dct[line_number]}: exists argument must not be None !"
-    )
+    line_loc = dct.lines[keyword]
+    assert value is not None, f"Line {line_loc}: exists argument must not be None !"
     if isinstance(value, list):
         if len(value) == 4:
             if value[0] == "min" and value[2] == "max":
@@ -379,7 +490,7 @@ def xml_handle_exists(dct, obj, keyword, value):
                 obj.set("minOccurs", str(value[3]))
             else:
                 raise ValueError(
-                    f"Line {dct[line_number]}: exists keyword"
+                    f"Line {line_loc}: exists keyword"
                     f"needs to go either with an optional [recommended] list with two "
                     f"entries either [min, <uint>] or [max, <uint>], or a list of four "
                     f"entries [min, <uint>, max, <uint>] !"
@@ -390,7 +501,7 @@ def xml_handle_exists(dct, obj, keyword, value):
             obj.set("maxOccurs", str(value[1]))
         else:
             raise ValueError(
-                f"Line {dct[line_number]}: exists keyword "
+                f"Line {line_loc}: exists keyword "
                 f"needs to go either with optional, recommended, a list with two "
                 f"entries either [min, <uint>] or [max, <uint>], or a list of four "
                 f"entries [min, <uint>, max, <uint>] !"
@@ -408,6 +519,7 @@ def xml_handle_exists(dct, obj, keyword, value):
             obj.set("minOccurs", "0")
 
 
+@counted
 def xml_handle_dimensions(dct, obj, keyword, value):
     """
     Create dimensionsType element instance, its childs, and append to an existing element.
@@ -415,19 +527,15 @@ def xml_handle_dimensions(dct, obj, keyword, value):
     tests/data/NXdimensionsType.yaml documents the syntax supported
     """
     line_number = f"__line__{keyword}"
-    line_loc = dct[line_number]
+    line_loc = dct.lines[keyword]
     dims: Optional[ET.Element] = None
     if isinstance(value, dict):
         # top-level docstring dealt with already by the caller
         n_idx_dicts = len(
             [key for key in value if re.match("^[0-9]+$", f"{key}") is not None]
         )
-        non_line_comment_keys = []
-        for key in value:
-            if isinstance(key, str):
-                if not key.startswith("__line__"):
-                    non_line_comment_keys.append(key)
-        if set(non_line_comment_keys) in [{"rank"}, {"rank", "doc"}]:
+        str_keys = {key for key in value if isinstance(key, str)}
+        if str_keys in [{"rank"}, {"rank", "doc"}]:
             # only rank
             dims = ET.SubElement(obj, "dimensions")
             dims.set("rank", f"{value['rank']}")
@@ -447,20 +555,19 @@ def xml_handle_dimensions(dct, obj, keyword, value):
                     dim = ET.SubElement(dims, "dim")
                     dim.set("index", str(dim_key))
                     for key, val in dim_obj.items():
-                        if not key.startswith("__line__"):
-                            if isinstance(val, bool):
-                                # boolean representations in yaml should not become
-                                # Python bool representations as otherwise roundtrips
-                                # otherwise yaml2nxdl false > False but nxdl2yaml will
-                                # keep it is as False > False
-                                if val is True:
-                                    dim.set(f"{key}", "true")
-                                else:
-                                    dim.set(f"{key}", "false")
-                            elif isinstance(val, int):
-                                dim.set(f"{key}", f"{val}")
+                        if isinstance(val, bool):
+                            # boolean representations in yaml should not become
+                            # Python bool representations as otherwise roundtrips
+                            # otherwise yaml2nxdl false > False but nxdl2yaml will
+                            # keep it is as False > False
+                            if val is True:
+                                dim.set(f"{key}", "true")
                             else:
-                                dim.set(f"{key}", val)
+                                dim.set(f"{key}", "false")
+                        elif isinstance(val, int):
+                            dim.set(f"{key}", f"{val}")
+                        else:
+                            dim.set(f"{key}", val)
         elif "dim" in value and not isinstance(value["dim"], list):
             # one of the short variants
             if re.match("^\\([A-Za-z0-9_, ]+\\)$", value["dim"]) is not None:
@@ -518,6 +625,7 @@ def xml_handle_dimensions(dct, obj, keyword, value):
     xml_handle_comment(obj, line_number, line_loc, dims)
 
 
+@counted
 def xml_handle_enumeration(dct, obj, keyword, value, verbose):
     """This function creates an 'enumeration' element instance.
 
@@ -531,7 +639,7 @@ def xml_handle_enumeration(dct, obj, keyword, value, verbose):
        and each items is a dict itself (with docs for each item).
     """
     line_number = f"__line__{keyword}"
-    line_loc = dct[line_number]
+    line_loc = dct.lines[keyword]
     xml_handle_comment(obj, line_number, line_loc)
     enum = ET.SubElement(obj, "enumeration")
 
@@ -539,25 +647,21 @@ def xml_handle_enumeration(dct, obj, keyword, value, verbose):
         f"Line {line_loc}: enumeration must \
 bear at least an argument !"
     )
-    assert len(value) >= 1, (
-        f"Line {dct[line_number]}: enumeration must not be an empty list!"
-    )
+    assert len(value) >= 1, f"Line {line_loc}: enumeration must not be an empty list!"
     if isinstance(value, list):
         for element in value:
             itm = ET.SubElement(enum, "item")
             itm.set("value", str(element))
     if isinstance(value, dict) and value != {}:
         if "open_enum" in value:
-            line_number = f"__line__{'open_enum'}"
-            line_loc = value[line_number]
+            line_number = "__line__open_enum"
+            line_loc = value.lines["open_enum"]
             xml_handle_comment(enum, line_number, line_loc)
             enum.set("open", check_for_mapping_char_other(str(value["open_enum"])))
 
-            del value["open_enum"]
-
         if "items" in value:
-            line_number = f"__line__{'items'}"
-            line_loc = value[line_number]
+            line_number = "__line__items"
+            line_loc = value.lines["items"]
             xml_handle_comment(enum, line_number, line_loc)
 
             if isinstance(value["items"], list):
@@ -567,25 +671,29 @@ bear at least an argument !"
             return
 
         for element, elmnt_value in value.items():
-            if "__line__" not in element:
-                itm = ET.SubElement(enum, "item")
-                itm.set("value", str(element))
+            if element == "open_enum":
+                continue
+            itm = ET.SubElement(enum, "item")
+            itm.set("value", str(element))
 
-                line_number = f"__line__{element}"
-                line_loc = value[line_number]
+            line_number = f"__line__{element}"
+            line_loc = value.lines[element]
 
-                xml_handle_comment(enum, line_number, line_loc, itm)
-                if isinstance(elmnt_value, dict):
-                    recursive_build(itm, elmnt_value, verbose)
+            xml_handle_comment(enum, line_number, line_loc, itm)
+            if isinstance(elmnt_value, dict):
+                recursive_build(itm, elmnt_value, verbose)
 
 
 # pylint: disable=unused-argument
+@counted
 def xml_handle_link(dct, obj, keyword, value, verbose):
     """
     If we have an NXDL link we decode the name attribute from <optional string>(link)[:-6]
+
+    Return the children left to build (see recursive_build).
     """
     line_number = f"__line__{keyword}"
-    line_loc = dct[line_number]
+    line_loc = dct.lines[keyword]
     xml_handle_comment(obj, line_number, line_loc)
     name = keyword[:-6]
     link_obj = ET.SubElement(obj, "link")
@@ -596,36 +704,35 @@ def xml_handle_link(dct, obj, keyword, value, verbose):
     if value:
         rm_key_list = []
         for attr, vval in value.items():
-            if "__line__" in attr:
-                continue
             line_number = f"__line__{attr}"
-            line_loc = value[line_number]
+            line_loc = value.lines[attr]
             if attr == "doc":
                 xml_handle_doc(link_obj, vval, line_number, line_loc)
                 rm_key_list.append(attr)
-                rm_key_list.append(line_number)
             elif attr in YAML_LINK_ATTRIBUTES and not isinstance(vval, dict):
                 if vval:
                     link_obj.set(attr, str(vval))
                 rm_key_list.append(attr)
-                rm_key_list.append(line_number)
                 xml_handle_comment(obj, line_number, line_loc, link_obj)
 
-        for key in rm_key_list:
-            del value[key]
+        value = value.without(rm_key_list)
         # Check for skipped attributes
         check_for_skipped_attributes("link", value, YAML_LINK_ATTRIBUTES, verbose)
 
     if isinstance(value, dict) and value != {}:
-        recursive_build(link_obj, value, verbose=None)
+        return link_obj, value, None
+    return None
 
 
+@counted
 def xml_handle_choice(dct, obj, keyword, value, verbose=False):
     """
     Build choice xml elements. That consists of groups.
+
+    Return the children left to build (see recursive_build).
     """
     line_number = f"__line__{keyword}"
-    line_loc = dct[line_number]
+    line_loc = dct.lines[keyword]
     xml_handle_comment(obj, line_number, line_loc)
     # Add to this tuple if new attributes have been added to nexus definition.
     possible_attr = ()
@@ -637,34 +744,31 @@ def xml_handle_choice(dct, obj, keyword, value, verbose=False):
     if value:
         rm_key_list = []
         for attr, vval in value.items():
-            if "__line__" in attr:
-                continue
             line_number = f"__line__{attr}"
-            line_loc = value[line_number]
+            line_loc = value.lines[attr]
             if attr == "doc":
                 xml_handle_doc(choice_obj, vval, line_number, line_loc)
                 rm_key_list.append(attr)
-                rm_key_list.append(line_number)
             elif attr in possible_attr and not isinstance(vval, dict):
                 if vval:
                     choice_obj.set(attr, str(vval))
                 rm_key_list.append(attr)
-                rm_key_list.append(line_number)
                 xml_handle_comment(obj, line_number, line_loc, choice_obj)
 
-        for key in rm_key_list:
-            del value[key]
+        value = value.without(rm_key_list)
         # Check for skipped attributes
         check_for_skipped_attributes("choice", value, possible_attr, verbose)
 
     if isinstance(value, dict) and value != {}:
-        recursive_build(choice_obj, value, verbose=None)
+        return choice_obj, value, None
+    return None
 
 
+@counted
 def xml_handle_symbols(dct, obj, keyword, value: dict):
     """Handle a set of NXDL symbols as a child to obj"""
     line_number = f"__line__{keyword}"
-    line_loc = dct[line_number]
+    line_loc = dct.lines[keyword]
     assert len(list(value.keys())) > 0, (
         f"Line {line_loc}: symbols table must not be empty !"
     )
@@ -672,17 +776,14 @@ def xml_handle_symbols(dct, obj, keyword, value: dict):
     syms = ET.SubElement(obj, "symbols")
     if "doc" in value.keys():
         line_number = "__line__doc"
-        line_loc = value[line_number]
+        line_loc = value.lines["doc"]
         xml_handle_comment(syms, line_number, line_loc)
         doctag = ET.SubElement(syms, "doc")
         doctag.text = "\n" + textwrap.fill(value["doc"], width=70) + "\n"
-    rm_key_list = []
     for kkeyword, vvalue in value.items():
-        if "__line__" in kkeyword:
-            continue
         if kkeyword != "doc":
             line_number = f"__line__{kkeyword}"
-            line_loc = value[line_number]
+            line_loc = value.lines[kkeyword]
             xml_handle_comment(syms, line_number, line_loc)
             assert vvalue is not None and isinstance(vvalue, str), (
                 f"Line {line_loc}: put a comment in doc string !"
@@ -690,10 +791,6 @@ def xml_handle_symbols(dct, obj, keyword, value: dict):
             sym = ET.SubElement(syms, "symbol")
             sym.set("name", kkeyword)
             xml_handle_doc(sym, vvalue)
-            rm_key_list.append(kkeyword)
-            rm_key_list.append(line_number)
-    for key in rm_key_list:
-        del value[key]
 
 
 def check_keyword_variable(verbose, dct, keyword, value):
@@ -701,12 +798,11 @@ def check_keyword_variable(verbose, dct, keyword, value):
     Check whether both keyword_name and keyword_type are empty,
         and complains if it is the case
     """
-    keyword_name, keyword_type = nx_name_type_resolving(keyword)
+    keyword_name, keyword_type, _, _ = classify_keyword(keyword)
     if verbose:
         print(f"{keyword_name}({keyword_type}): value type is {type(value)}\n")
     if keyword_name == "" and keyword_type == "":
-        line_number = f"__line__{keyword}"
-        raise ValueError(f"Line {dct[line_number]}: found an improper yaml key !")
+        raise ValueError(f"Line {dct.lines[keyword]}: found an improper yaml key !")
 
 
 def helper_keyword_type(kkeyword_type):
@@ -726,6 +822,7 @@ def verbose_flag(verbose, keyword, value):
         print(f"key:{keyword}; value type is {type(value)}\n")
 
 
+@counted
 def xml_handle_nametype(keyword, keyword_name, dct, obj):
     """
     Identify NeXus nameType attribute for field, group, attribute use hint if required.
@@ -740,19 +837,23 @@ def xml_handle_nametype(keyword, keyword_name, dct, obj):
         obj.set("nameType", name_type)
 
 
+@counted
 def xml_handle_attributes(dct, obj, keyword, value, verbose):
-    """Handle the attributes found connected to attribute field"""
+    """
+    Handle the attributes found connected to attribute field.
+
+    Return the children left to build (see recursive_build).
+    """
 
     line_number = f"__line__{keyword}"
-    line_loc = dct[line_number]
+    line_loc = dct.lines[keyword]
     xml_handle_comment(obj, line_number, line_loc)
     # as an attribute identifier
-    keyword_name, keyword_typ = nx_name_type_resolving(keyword)
-    line_number = f"__line__{keyword}"
+    keyword_name, keyword_typ, _, _ = classify_keyword(keyword)
     if verbose:
-        print(f"__line__ : {dct[line_number]}")
+        print(f"__line__ : {line_loc}")
     if keyword_name == "" and keyword_typ == "":
-        raise ValueError(f"Line {dct[line_number]}: found an improper yaml key !")
+        raise ValueError(f"Line {line_loc}: found an improper yaml key !")
     elemt_obj = ET.SubElement(obj, "attribute")
     elemt_obj.set("name", keyword_name[2:])
     if keyword_typ:
@@ -762,45 +863,39 @@ def xml_handle_attributes(dct, obj, keyword, value, verbose):
     if value and value:
         # taking care of attributes of attributes
         for attr, attr_val in value.items():
-            if "__line__" in attr:
-                continue
             line_number = f"__line__{attr}"
-            line_loc = value[line_number]
+            line_loc = value.lines[attr]
             if attr in ["doc", *YAML_ATTRIBUTES_ATTRIBUTES] and not isinstance(
                 attr_val, dict
             ):
                 if attr == "unit":
                     elemt_obj.set(f"{attr}s", str(attr_val))
                     rm_key_list.append(attr)
-                    rm_key_list.append(line_number)
                     xml_handle_comment(obj, line_number, line_loc, elemt_obj)
                 elif attr == "exists" and attr_val:
                     xml_handle_exists(value, elemt_obj, attr, attr_val)
                     rm_key_list.append(attr)
-                    rm_key_list.append(line_number)
                     xml_handle_comment(obj, line_number, line_loc, elemt_obj)
                 elif attr == "doc":
                     xml_handle_doc(
                         elemt_obj, format_nxdl_doc(attr_val), line_number, line_loc
                     )
                     rm_key_list.append(attr)
-                    rm_key_list.append(line_number)
                 elif attr == "nameType":
                     xml_handle_nametype(keyword, keyword_name, dct, elemt_obj)
                 else:
                     elemt_obj.set(attr, check_for_mapping_char_other(attr_val))
                     rm_key_list.append(attr)
-                    rm_key_list.append(line_number)
                     xml_handle_comment(obj, line_number, line_loc, elemt_obj)
 
-        for key in rm_key_list:
-            del value[key]
+        value = value.without(rm_key_list)
         # Check cor skipped attribute
         check_for_skipped_attributes(
             "Attribute", value, YAML_ATTRIBUTES_ATTRIBUTES, verbose
         )
     if value:
-        recursive_build(elemt_obj, value, verbose)
+        return elemt_obj, value, verbose
+    return None
 
 
 def validate_field_attribute_and_value(v_attr, vval, allowed_attribute, value):
@@ -810,10 +905,9 @@ def validate_field_attribute_and_value(v_attr, vval, allowed_attribute, value):
     """
 
     if not isinstance(vval, dict) and not str(vval):  # check for empty value
-        line_number = f"__line__{v_attr}"
         raise ValueError(
             f"In a field a valid attribute ('{v_attr}') found that is not stored."
-            f" Please check around line {value[line_number]}"
+            f" Please check around line {value.lines[v_attr]}"
         )
 
     # The below elements might come as child element
@@ -821,24 +915,27 @@ def validate_field_attribute_and_value(v_attr, vval, allowed_attribute, value):
     # check for invalid key or attributes
     if (
         v_attr not in [*skipped_child_name, *allowed_attribute]
-        and "__line__" not in v_attr
         and not isinstance(vval, dict)
         and "(" not in v_attr  # skip only groups and field that has name and type
         and "\\@" not in v_attr
     ):  # skip nexus attributes
-        line_number = f"__line__{v_attr}"
         raise ValueError(
             f"In a field or group a invalid attribute ('{v_attr}') or child has found."
-            f" Please check around line {value[line_number]}."
+            f" Please check around line {value.lines[v_attr]}."
         )
 
 
+@counted
 def xml_handle_fields_or_group(
     dct, obj, keyword, value, ele_type, allowed_attr, verbose=False
 ):
-    """Handle a field or group in yaml file."""
+    """
+    Handle a field or group in yaml file.
+
+    Return the children left to build (see recursive_build).
+    """
     line_annot = f"__line__{keyword}"
-    line_loc = dct[line_annot]
+    line_loc = dct.lines[keyword]
     xml_handle_comment(obj, line_annot, line_loc)
     l_bracket = -1
     r_bracket = -1
@@ -847,7 +944,7 @@ def xml_handle_fields_or_group(
     if keyword.count(")") == 1:
         r_bracket = keyword.index(")")
 
-    keyword_name, keyword_type = nx_name_type_resolving(keyword)
+    keyword_name, keyword_type, _, _ = classify_keyword(keyword)
     if ele_type == "field" and not keyword_name:
         raise ValueError(
             f"No name for NeXus {ele_type} has been found. Check around line:{line_loc}"
@@ -885,10 +982,8 @@ def xml_handle_fields_or_group(
         # In each each if clause apply xml_handle_comment(), to collect
         # comments on that yaml line.
         for attr, vval in value.items():
-            if "__line__" in attr:
-                continue
             line_number = f"__line__{attr}"
-            line_loc = value[line_number]
+            line_loc = value.lines[attr]
             if attr == "doc":
                 xml_handle_doc(
                     elemt_obj,
@@ -897,11 +992,9 @@ def xml_handle_fields_or_group(
                     line_loc,
                 )
                 rm_key_list.append(attr)
-                rm_key_list.append(line_number)
             elif attr == "exists" and vval:
                 xml_handle_exists(value, elemt_obj, attr, vval)
                 rm_key_list.append(attr)
-                rm_key_list.append(line_number)
                 xml_handle_comment(obj, line_number, line_loc, elemt_obj)
             elif attr == "nameType":
                 xml_handle_nametype(keyword, keyword_name, dct, elemt_obj)
@@ -918,18 +1011,18 @@ def xml_handle_fields_or_group(
                 validate_field_attribute_and_value(attr, vval, allowed_attr, value)
                 elemt_obj.set(attr, check_for_mapping_char_other(vval))
                 rm_key_list.append(attr)
-                rm_key_list.append(line_number)
                 xml_handle_comment(obj, line_number, line_loc, elemt_obj)
 
-        for key in rm_key_list:
-            del value[key]
+        value = value.without(rm_key_list)
         # Check for skipped attributes
         check_for_skipped_attributes(ele_type, value, allowed_attr, verbose)
 
         if value != {}:
-            recursive_build(elemt_obj, value, verbose)
+            return elemt_obj, value, verbose
+    return None
 
 
+@counted
 def xml_handle_comment(
     obj: ET._Element,
     line_annotation: str,
@@ -948,8 +1041,9 @@ def xml_handle_comment(
     """
 
     line_info = (line_annotation, int(line_loc_no))
-    if line_info in COMMENT_BLOCKS:  # noqa: F821
-        cmnt = COMMENT_BLOCKS.get_comment_by_line_info(line_info)  # noqa: F821
+    comment_blocks = get_conversion_context().comment_blocks
+    if line_info in comment_blocks:
+        cmnt = comment_blocks.get_comment_by_line_info(line_info)
         cmnt_text = cmnt.get_comment_text_list()
 
         # Check comment for definition element and return
@@ -969,6 +1063,85 @@ def xml_handle_comment(
     return []
 
 
+NX_CLASS_PATTERN = re.compile(r"NX[a-zA-Z]")
+
+
+class YamlKeyword(NamedTuple):
+    """A yaml key, parsed once by classify_keyword."""
+
+    name: str
+    type: str
+    # Key of the handler in KEYWORD_HANDLERS, "" if the keyword can not be resolved
+    kind: str
+    # Some but not all characters are upper case, e.g. nameType
+    mixed_case: bool
+
+
+@functools.lru_cache(maxsize=None)
+def classify_keyword(keyword) -> YamlKeyword:
+    """
+    Resolve the name and type of a yaml key and the kind of nxdl element it
+    stands for. The same keys (e.g. doc, (NXentry)) come again and again, so
+    that the result is cached.
+    """
+    keyword_name, keyword_type = nx_name_type_resolving(keyword)
+    if keyword[-6:] == "(link)":
+        kind = "link"
+    elif keyword[-8:] == "(choice)":
+        kind = "choice"
+    # symbols of fields or attributes, root level symbols dealt with by nyaml2nxdl()
+    elif keyword_type == "" and keyword_name == "symbols":
+        kind = "symbols"
+    elif NX_CLASS_PATTERN.match(keyword_type) is not None:
+        kind = "group"
+    elif keyword_name[0:2] == "\\@":  # check if obj qualifies as a NeXus attribute
+        kind = "attribute"
+    elif keyword in ("doc", "unit", "enumeration", "exists"):
+        kind = keyword
+    elif keyword in ("dimensions", "dim"):
+        kind = "dimensions"
+    # Handles fileds e.g. AXISNAME
+    elif keyword_name != "":
+        kind = "field"
+    else:
+        kind = ""
+    mixed_case = 0 < sum(1 for char in keyword if char.isupper()) < len(keyword)
+    return YamlKeyword(keyword_name, keyword_type, kind, mixed_case)
+
+
+# Handler of each kind of yaml keyword (see classify_keyword), all called with
+# (dct, obj, keyword, value, verbose). A handler returns the element, mapping and
+# verbose flag of the children left to build, or None.
+KEYWORD_HANDLERS: Dict[str, Callable] = {
+    "link": xml_handle_link,
+    "choice": lambda dct, obj, keyword, value, verbose: xml_handle_choice(
+        dct, obj, keyword, value
+    ),
+    "symbols": lambda dct, obj, keyword, value, verbose: xml_handle_symbols(
+        dct, obj, keyword, value
+    ),
+    # we can be sure we need to instantiate a new group
+    "group": lambda dct, obj, keyword, value, verbose: xml_handle_fields_or_group(
+        dct, obj, keyword, value, "group", YAML_GROUP_ATTRIBUTES, verbose=False
+    ),
+    "attribute": xml_handle_attributes,
+    "doc": lambda dct, obj, keyword, value, verbose: xml_handle_doc(
+        obj, value, f"__line__{keyword}", dct.lines[keyword]
+    ),
+    "unit": lambda dct, obj, keyword, value, verbose: xml_handle_units(obj, value),
+    "enumeration": xml_handle_enumeration,
+    "dimensions": lambda dct, obj, keyword, value, verbose: xml_handle_dimensions(
+        dct, obj, keyword, value
+    ),
+    "exists": lambda dct, obj, keyword, value, verbose: xml_handle_exists(
+        dct, obj, keyword, value
+    ),
+    "field": lambda dct, obj, keyword, value, verbose: xml_handle_fields_or_group(
+        dct, obj, keyword, value, "field", YAML_FIELD_ATTRIBUTES, verbose=False
+    ),
+}
+
+
 def recursive_build(obj, dct, verbose):
     """Walk through nested dictionary.
     Parameters:
@@ -980,74 +1153,45 @@ def recursive_build(obj, dct, verbose):
      its successors.
 
     Note: NXDL fields may contain attributes but trigger no recursion so attributes are leafs.
+
+    The nested dictionary is walked depth first with an explicit stack instead of
+    recursion, so that deeply nested definitions do not hit the recursion limit.
+    The children a handler returns are built before the next key of the parent.
     """
-    for keyword, value in iter(dct.items()):
-        if "__line__" in keyword:
-            continue
-        line_number = f"__line__{keyword}"
-        line_loc = dct[line_number]
-        keyword_name, keyword_type = nx_name_type_resolving(keyword)
-        # keyword's like nameType need proper escape character in the future
-        # to simplify their distinction from NX_CHAR fields and attributes
-        if 0 < sum(1 for char in keyword if char.isupper()) < len(keyword):
-            if isinstance(value, str):
+    stack = [(obj, iter(dct.items()), dct, verbose)]
+    while stack:
+        obj, items, dct, verbose = stack[-1]
+        for keyword, value in items:
+            keyword_info = classify_keyword(keyword)
+            # keyword's like nameType need proper escape character in the future
+            # to simplify their distinction from NX_CHAR fields and attributes
+            if keyword_info.mixed_case and isinstance(value, str):
                 continue
 
-        check_keyword_variable(verbose, dct, keyword, value)
-        if verbose:
-            print(f"keyword_name:{keyword_name} keyword_type {keyword_type}\n")
-
-        if keyword[-6:] == "(link)":
-            xml_handle_link(dct, obj, keyword, value, verbose)
-        elif keyword[-8:] == "(choice)":
-            xml_handle_choice(dct, obj, keyword, value)
-        # symbols of fields or attributes, root level symbols dealt with by nyaml2nxdl()
-        elif keyword_type == "" and keyword_name == "symbols":
-            xml_handle_symbols(dct, obj, keyword, value)
-        elif re.match(r"NX[a-zA-Z].*", keyword_type) is not None:
-            elem_type = "group"
-            # we can be sure we need to instantiate a new group
-            xml_handle_fields_or_group(
-                dct,
-                obj,
-                keyword,
-                value,
-                elem_type,
-                YAML_GROUP_ATTRIBUTES,
-                verbose=False,
-            )
-        elif keyword_name[0:2] == "\\@":  # check if obj qualifies as a NeXus attribute
-            xml_handle_attributes(dct, obj, keyword, value, verbose)
-        elif keyword == "doc":
-            xml_handle_doc(obj, value, line_number, line_loc)
-        elif keyword == "unit":
-            xml_handle_units(obj, value)
-        elif keyword == "enumeration":
-            xml_handle_enumeration(dct, obj, keyword, value, verbose)
-        elif keyword in ("dimensions", "dim"):
-            xml_handle_dimensions(dct, obj, keyword, value)
-        elif keyword == "exists":
-            xml_handle_exists(dct, obj, keyword, value)
-        # Handles fileds e.g. AXISNAME
-        elif keyword_name != "" and "__line__" not in keyword_name:
-            elem_type = "field"
-            xml_handle_fields_or_group(
-                dct,
-                obj,
-                keyword,
-                value,
-                elem_type,
-                YAML_FIELD_ATTRIBUTES,
-                verbose=False,
+            check_keyword_variable(verbose, dct, keyword, value)
+            if verbose:
+                print(
+                    f"keyword_name:{keyword_info.name} "
+                    f"keyword_type {keyword_info.type}\n"
+                )
+
+            if not keyword_info.kind:
+                raise ValueError(
+                    f"An unknown type of element {keyword} has been found which is "
+                    f"not be able to be resolved. Check around line "
+                    f"{dct.lines[keyword]}"
+                )
+            children = KEYWORD_HANDLERS[keyword_info.kind](
+                dct, obj, keyword, value, verbose
             )
+            if children is not None:
+                child_obj, child_dct, child_verbose = children
+                stack.append(
+                    (child_obj, iter(child_dct.items()), child_dct, child_verbose)
+                )
+                break
         else:
-            raise ValueError(
-                f"An unknown type of element {keyword} has been found which is "
-                f"not be able to be resolved. Check around line {dct[line_number]}"
-            )
-        if isinstance(value, dict):
-            if value in ("dimensions", "dim"):
-                xml_handle_dimensions(dct, obj, keyword, value)
+            stack.pop()
 
 
 def extend_doc_type(doc_type, new_component, comment=False):
@@ -1069,49 +1213,56 @@ def pretty_print_xml(xml_root, output_xml, def_comments=None):
     Print better human-readable indented and formatted xml file using
     built-in libraries and preceding XML processing instruction
     """
+    write_text_if_changed(output_xml, pretty_format_xml(xml_root, def_comments))
+
+
+def pretty_format_xml(xml_root, def_comments=None):
+    """Format the xml tree as human-readable nxdl.xml text (see pretty_print_xml)."""
     # Handle DOM as doc_type
     doc_type = f"""<?xml version="1.0" encoding="UTF-8"?>\n<?xml-stylesheet type="text/xsl" href="nxdlformat.xsl"?>"""
 
-    if DOM_COMMENT:
-        doc_type = extend_doc_type(doc_type, DOM_COMMENT, comment=True)
+    with _running_or_new_conversion_context() as context:
+        dom_comment = context.dom_comment
+    if dom_comment:
+        doc_type = extend_doc_type(doc_type, dom_comment, comment=True)
     if def_comments:
         for string in def_comments:
             doc_type = extend_doc_type(doc_type, string, comment=True)
 
-    tmp_xml = "tmp.xml"
     ET.indent(xml_root, space=DEPTH_SIZE)
-    xml_string = ET.tostring(
+    indent_doc_text(xml_root)
+    return ET.tostring(
         xml_root,
         pretty_print=True,
-        encoding="UTF-8",
+        encoding="unicode",
         xml_declaration=False,
         doctype=doc_type,
     )
-    with open(tmp_xml, "wb") as file_tmp:
-        file_tmp.write(xml_string)
-    flag = False
-    with open(tmp_xml, encoding="utf-8") as file_out:
-        with open(output_xml, "w", encoding="utf-8") as file_out_mod:
-            for i in file_out.readlines():
-                i = unquote(i)
-                if "<doc>" not in i and "</doc>" not in i and flag is False:
-                    file_out_mod.write(i)
-                elif "<doc>" in i and "</doc>" in i:
-                    file_out_mod.write(i)
-                elif "<doc>" in i and "</doc>" not in i:
-                    flag = True
-                    white_spaces = len(i) - len(i.lstrip())
-                    file_out_mod.write(i)
-                elif "<doc>" not in i and "</doc>" not in i and flag is True:
-                    file_out_mod.write((white_spaces + 4) * " " + i)
-                elif "<doc>" not in i and "</doc>" in i and flag is True:
-                    file_out_mod.write(white_spaces * " " + i)
-                    flag = False
-    tmp_xml_path = pathlib.Path(tmp_xml)
-    pathlib.Path.unlink(tmp_xml_path)
 
 
-# pylint: disable=too-many-statements
+def indent_doc_text(xml_root):
+    """Indent the lines of multi-line docs one level deeper than the doc tag.
+
+    The closing doc tag goes back to the level of the opening one. ET.indent
+    leaves the text of the doc elements as it is, so this runs after it.
+    """
+    # Depth of the element below xml_root, tracked while walking the tree
+    depth = -1
+    for event, doc in ET.iterwalk(xml_root, events=("start", "end")):
+        if event == "end":
+            depth -= 1
+            continue
+        depth += 1
+        if doc.tag != "doc" or not doc.text or "\n" not in doc.text:
+            continue
+        indent = DEPTH_SIZE * depth
+        first_line, *lines, last_line = doc.text.split("\n")
+        doc.text = "\n".join(
+            [first_line, *(indent + DEPTH_SIZE + line for line in lines)]
+            + [indent + last_line]
+        )
+
+
 def nyaml2nxdl(input_file: str, out_file, verbose: bool):
     """
     Main of the nyaml2nxdl converter, creates XML tree, namespace and
@@ -1119,7 +1270,107 @@ def nyaml2nxdl(input_file: str, out_file, verbose: bool):
     fields or (their) attributes as children of the groups
     """
     nxdl_copyright_license = get_nxdl_copyright_license(nxdl_file=out_file)
+    with open(input_file, encoding="utf-8") as plain_text_yaml:
+        yaml_text = plain_text_yaml.read()
+    nxdl_text = nyaml2nxdl_from_text(
+        yaml_text, verbose, nxdl_copyright_license, name=input_file
+    )
+    write_text_if_changed(out_file, nxdl_text)
+
+
+def yaml_to_nxdl(yaml_text: str, verbose: bool = False, name=None) -> str:
+    """
+    Convert a nyaml text into nxdl.xml text, without touching the file system.
+
+    If the yaml ends with the nxdl it was generated from (see nxdl_to_yaml) and
+    the yaml part has not been modified since, the stored nxdl is returned as is.
+    Otherwise, the stored nxdl only provides the copyright license. The name (e.g.
+    of the input file) is only used in messages.
+    """
+    # The text is split into lines once, for the stored nxdl and the comments
+    with profile_phase("footer_split"):
+        yaml_lines, sha_hash, nxdl_lines = split_yaml_and_nxdl_lines(
+            split_lines(yaml_text)
+        )
+    yaml_part = "".join(yaml_lines)
+    nxdl_part = "".join(nxdl_lines)
+    if sha_hash and sha_hash == get_sha256_hash_from_text(yaml_part):
+        return nxdl_part
+    return nyaml2nxdl_from_text(
+        yaml_part,
+        verbose,
+        get_nxdl_copyright_license_from_text(nxdl_part),
+        name=name,
+        yaml_lines=yaml_lines,
+    )
+
+
+def nyaml2nxdl_from_text(
+    yaml_text: str,
+    verbose: bool,
+    nxdl_copyright_license="",
+    name=None,
+    yaml_lines=None,
+) -> str:
+    """
+    Same as nyaml2nxdl, for a yaml text (without stored nxdl part) and returning
+    the nxdl.xml text. yaml_lines are the lines of the yaml text, if they have
+    been split already.
+
+    The conversion runs in its own ConversionContext, so that it can run in
+    parallel with other conversions in the same process.
+    """
+    with new_conversion_context():
+        return _build_nxdl_from_text(
+            yaml_text, verbose, nxdl_copyright_license, name, yaml_lines
+        )
+
+
+def nxdl_from_yaml_dict(
+    yml_appdef, comment_blocks, verbose: bool = False, nxdl_copyright_license=""
+) -> str:
+    """
+    Build the nxdl.xml text of a yaml dict and its comments, as loaded by
+    yml_reader in a new_conversion_context.
+
+    Neither the yaml dict nor the comments are modified, so that a yaml loaded
+    once can be converted several times.
+    """
+    with new_conversion_context() as context:
+        context.comment_blocks = comment_blocks
+        context.category = yml_appdef.get("category", "")
+        set_copyright_text(nxdl_copyright_license=nxdl_copyright_license)
+        return _build_nxdl_from_yaml_dict(yml_appdef, verbose)
+
+
+def _build_nxdl_from_text(yaml_text, verbose, nxdl_copyright_license, name, yaml_lines):
+    """Build the nxdl.xml text in the current conversion context."""
     set_copyright_text(nxdl_copyright_license=nxdl_copyright_license)
+    yml_appdef = yml_reader_from_text(yaml_text, name=name, yaml_lines=yaml_lines)
+    if verbose:
+        print(f"input-file: {name}\n")
+    return _build_nxdl_from_yaml_dict(yml_appdef, verbose)
+
+
+def _build_nxdl_from_yaml_dict(yml_appdef, verbose):
+    """Build the nxdl.xml text of a loaded yaml in the current conversion context."""
+    with profile_phase("tree_build"):
+        xml_root, def_cmnt_text = build_nxdl_tree(yml_appdef, verbose)
+    with profile_phase("serialization"):
+        nxdl_text = pretty_format_xml(xml_root, def_cmnt_text)
+    if verbose:
+        print("Parsed YAML to NXDL successfully\n")
+    return nxdl_text
+
+
+# pylint: disable=too-many-statements
+def build_nxdl_tree(yml_appdef, verbose=False):
+    """
+    Build the nxdl tree of a loaded yaml in the current conversion context.
+
+    Return the definition element and the comments that go in front of it (see
+    pretty_format_xml).
+    """
     def_attributes = [
         "deprecated",
         "ignoreExtraGroups",
@@ -1129,10 +1380,8 @@ def nyaml2nxdl(input_file: str, out_file, verbose: bool):
         "ignoreExtraAttributes",
         "restricts",
     ]
-    yml_appdef = yml_reader(input_file)
     def_cmnt_text = []
     if verbose:
-        print(f"input-file: {input_file}\n")
         print("application/base contains the following root-level entries:\n")
         print(str(yml_appdef.keys()))
     # etree does not allow to set namespace-map after root creation
@@ -1154,12 +1403,11 @@ application and base are valid categories!"
     assert "doc" in yml_appdef.keys(), "Required root-level keyword doc is missing!"
 
     name_extends = ""
-    yml_appdef_copy = yml_appdef.copy()
-    for kkey, vvalue in yml_appdef_copy.items():
-        if "__line__" in kkey:
-            continue
+    # Root level keys handled apart from the NX... one
+    handled_keys = ["doc", "symbols"]
+    for kkey, vvalue in yml_appdef.items():
         line_number = f"__line__{kkey}"
-        line_loc_no = yml_appdef[line_number]
+        line_loc_no = yml_appdef.lines[kkey]
         if not isinstance(vvalue, dict) and kkey in def_attributes:
             if isinstance(vvalue, bool):
                 xml_root.set(kkey, "true" if vvalue else "false")
@@ -1170,8 +1418,7 @@ application and base are valid categories!"
             )
             def_cmnt_text += cmnt_text
 
-            del yml_appdef[line_number]
-            del yml_appdef[kkey]
+            handled_keys.append(kkey)
         # Taking care of name and extends
         elif "NX" in kkey:
             # Taking the attribute order but the correct value will be stored later
@@ -1208,15 +1455,12 @@ application and base are valid categories!"
     # Fill nsmap variable here
     nsmap.update(namespaces)  # type: ignore
     xml_root.attrib["{http://www.w3.org/2001/XMLSchema-instance}schemaLocation"] = (
-        "http://definition.nexusformat.org/nxdl/3.1 ../nxdl.xsd".replace(" ", "%20")
+        "http://definition.nexusformat.org/nxdl/3.1 ../nxdl.xsd"
     )
 
     # Taking care of Symbols elements
     if "symbols" in yml_appdef.keys():
         xml_handle_symbols(yml_appdef, xml_root, "symbols", yml_appdef["symbols"])
-
-        del yml_appdef["symbols"]
-        del yml_appdef["__line__symbols"]
     if isinstance(yml_appdef["doc"], str):
         assert yml_appdef["doc"] != "", "Doc has to be a non-empty string!"
     elif isinstance(yml_appdef["doc"], list):
@@ -1225,16 +1469,13 @@ application and base are valid categories!"
         )
 
     line_number = "__line__doc"
-    line_loc_no = yml_appdef[line_number]
+    line_loc_no = yml_appdef.lines["doc"]
     xml_handle_doc(xml_root, yml_appdef["doc"], line_number, line_loc_no)
 
-    del yml_appdef["doc"]
-
     root_keys = 0
-    for key in yml_appdef.keys():
-        if "__line__" not in key:
-            root_keys += 1
-            extra_key = key
+    for key in yml_appdef.without(handled_keys):
+        root_keys += 1
+        extra_key = key
 
     assert root_keys == 1, (
         f"Accepting at most keywords: category, doc, symbols, and NX... "
@@ -1251,8 +1492,9 @@ keyword has an invalid pattern, or is too short!"
         recursive_build(xml_root, yml_appdef[name_extends], verbose)
     # Taking care of comments that comes at the end of file that is might not be intended for
     # any nxdl elements.
-    if COMMENT_BLOCKS[-1].has_post_comment:  # noqa: F821
-        post_comment = COMMENT_BLOCKS[-1]  # noqa: F821
+    comment_blocks = get_conversion_context().comment_blocks
+    if comment_blocks[-1].has_post_comment:
+        post_comment = comment_blocks[-1]
         (lin_annot, line_loc) = post_comment.get_line_info()
         xml_handle_comment(xml_root, lin_annot, line_loc)
 
@@ -1260,6 +1502,4 @@ keyword has an invalid pattern, or is too short!"
     default_attr = False
     if default_attr:
         check_for_default_attribute_and_value(xml_root)
-    pretty_print_xml(xml_root, out_file, def_cmnt_text)
-    if verbose:
-        print("Parsed YAML to NXDL successfully\n")
+    return xml_root, def_cmnt_text
@@ -0,0 +1,269 @@
+#
+# Copyright The NOMAD Authors.
+#
+# This file is part of NOMAD. See https://nomad-lab.eu for further info.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Time spent in the phases of the conversions and number of calls of the handlers.
+
+The conversions running inside profile_conversions are recorded in the returned
+ConversionProfile:
+
+    with profile_conversions() as profile:
+        nxdl_text = yaml_to_nxdl(yaml_text)
+    print(profile.format_table())
+
+Outside of it, the converters only look up the (unset) context variable of the
+profile at each phase and handler call.
+
+For a detailed picture, cpu_profile runs its with block under cProfile and writes
+a pstats dump, optionally together with a flame graph for speedscope
+(https://www.speedscope.app).
+"""
+
+import contextlib
+import cProfile
+import functools
+import json
+import pstats
+import time
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+__all__ = [
+    "ConversionProfile",
+    "counted",
+    "cpu_profile",
+    "get_profile",
+    "get_speedscope_file",
+    "profile_conversions",
+    "profile_phase",
+    "stats_to_speedscope",
+]
+
+SPEEDSCOPE_SCHEMA = "https://www.speedscope.app/file-format-schema.json"
+# Paths of the flame graph that take less than this fraction of the total time
+# are left out, which bounds the size of the speedscope file
+SPEEDSCOPE_MIN_FRACTION = 1e-4
+
+
+class ConversionProfile:
+    """Times of the phases and calls of the handlers of one or more conversions."""
+
+    def __init__(self):
+        # Phase name -> total time in seconds and number of times it ran
+        self.phase_times: Dict[str, float] = {}
+        self.phase_calls: Dict[str, int] = {}
+        # Qualified name of the handler -> number of calls
+        self.handler_calls: Dict[str, int] = {}
+
+    def add_phase_time(self, name, seconds):
+        """Add a run of the named phase, which took seconds."""
+        self.phase_times[name] = self.phase_times.get(name, 0.0) + seconds
+        self.phase_calls[name] = self.phase_calls.get(name, 0) + 1
+
+    def count_handler_call(self, name):
+        """Add a call of the named handler."""
+        self.handler_calls[name] = self.handler_calls.get(name, 0) + 1
+
+    def as_dict(self):
+        """Return the profile as json compatible dict."""
+        return {
+            "phases": {
+                name: {"time": seconds, "calls": self.phase_calls[name]}
+                for name, seconds in self.phase_times.items()
+            },
+            "handlers": dict(self.handler_calls),
+        }
+
+    def format_table(self):
+        """Format the phases in order of appearance and the handlers by calls."""
+        lines = [f"{'phase':<32} {'calls':>8} {'total [ms]':>12}"]
+        for name, seconds in self.phase_times.items():
+            lines.append(
+                f"{name:<32} {self.phase_calls[name]:>8} {seconds * 1e3:>12.3f}"
+            )
+        lines += ["", f"{'handler':<32} {'calls':>8}"]
+        for name, calls in sorted(
+            self.handler_calls.items(), key=lambda item: (-item[1], item[0])
+        ):
+            lines.append(f"{name:<32} {calls:>8}")
+        return "\n".join(lines)
+
+
+_PROFILE: ContextVar[Optional[ConversionProfile]] = ContextVar(
+    "nyaml_conversion_profile", default=None
+)
+# Returned by profile_phase when nothing is profiled
+_NO_PHASE = contextlib.nullcontext()
+
+
+@contextlib.contextmanager
+def profile_conversions(callback: Optional[Callable] = None):
+    """
+    Record the conversions of the with block (in the current thread) in a new
+    ConversionProfile, which it returns. The callback, if any, is called with
+    the profile at the end of the block.
+    """
+    profile = ConversionProfile()
+    token = _PROFILE.set(profile)
+    try:
+        yield profile
+    finally:
+        _PROFILE.reset(token)
+        if callback is not None:
+            callback(profile)
+
+
+def get_profile() -> Optional[ConversionProfile]:
+    """Return the profile of the running conversions, None if not profiled."""
+    return _PROFILE.get()
+
+
+class _PhaseTimer:
+    """Adds the time of its with block to a phase of a profile."""
+
+    def __init__(self, profile, name):
+        self.profile = profile
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profile.add_phase_time(self.name, time.perf_counter() - self.start)
+
+
+def profile_phase(name):
+    """Return a context manager that times its with block as the named phase."""
+    profile = _PROFILE.get()
+    if profile is None:
+        return _NO_PHASE
+    return _PhaseTimer(profile, name)
+
+
+def counted(func):
+    """Decorate a handler, so that its calls are counted in the profile."""
+    name = func.__qualname__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        profile = _PROFILE.get()
+        if profile is not None:
+            profile.count_handler_call(name)
+        return func(*args, **kwargs)
+
+    return wrapper
+
+
+def get_speedscope_file(profile_file):
+    """Return the path of the speedscope file that goes with a pstats dump."""
+    profile_file = Path(profile_file)
+    if profile_file.suffix == ".prof":
+        return profile_file.with_suffix(".speedscope.json")
+    return profile_file.with_name(profile_file.name + ".speedscope.json")
+
+
+@contextlib.contextmanager
+def cpu_profile(profile_file, speedscope=False, name=None):
+    """
+    Run the with block under cProfile and write the pstats dump into
+    profile_file. With speedscope, the flame graph (see stats_to_speedscope)
+    named name is written next to it as well (see get_speedscope_file).
+    """
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        profiler.dump_stats(str(profile_file))
+        if speedscope:
+            speedscope_json = stats_to_speedscope(
+                pstats.Stats(profiler), name or Path(profile_file).name
+            )
+            with open(get_speedscope_file(profile_file), "w", encoding="utf-8") as file:
+                json.dump(speedscope_json, file)
+
+
+def stats_to_speedscope(stats: pstats.Stats, name="nyaml"):
+    """
+    Convert the stats of cProfile into a speedscope (sampled) profile.
+
+    cProfile keeps the time spent in the calls from each caller, not the call
+    stacks. The stacks are rebuilt from the functions without caller, splitting
+    the time of a function between its callees as in the stats. Recursive calls
+    are not followed.
+    """
+    frames = []
+    frame_indices: Dict[tuple, int] = {}
+
+    def get_frame_index(func):
+        if func not in frame_indices:
+            file_name, line, func_name = func
+            frame = {"name": func_name}
+            # Builtins come with the file "~"
+            if file_name != "~":
+                frame.update(file=file_name, line=line)
+            frame_indices[func] = len(frames)
+            frames.append(frame)
+        return frame_indices[func]
+
+    callees: Dict[tuple, list] = {}
+    roots = []
+    for func, (*_, callers) in stats.stats.items():
+        if not callers:
+            roots.append(func)
+        for caller, (*_, cumulative_time) in callers.items():
+            callees.setdefault(caller, []).append((func, cumulative_time))
+
+    min_seconds = stats.total_tt * SPEEDSCOPE_MIN_FRACTION
+    samples = []
+    weights = []
+    stack = [((root,), stats.stats[root][3]) for root in reversed(roots)]
+    while stack:
+        path, seconds = stack.pop()
+        _, _, own_time, cumulative_time, _ = stats.stats[path[-1]]
+        scale = seconds / cumulative_time if cumulative_time else 0.0
+        if own_time * scale > 0:
+            samples.append([get_frame_index(func) for func in path])
+            weights.append(own_time * scale)
+        stack.extend(
+            (path + (callee,), callee_time * scale)
+            for callee, callee_time in reversed(callees.get(path[-1], []))
+            if callee not in path and callee_time * scale >= min_seconds
+        )
+    return {
+        "$schema": SPEEDSCOPE_SCHEMA,
+        "shared": {"frames": frames},
+        "profiles": [
+            {
+                "type": "sampled",
+                "name": name,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": samples,
+                "weights": weights,
+            }
+        ],
+        "name": name,
+        "activeProfileIndex": 0,
+        "exporter": "nyaml",
+    }
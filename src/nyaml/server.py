@@ -0,0 +1,330 @@
+#
+# Copyright The NOMAD Authors.
+#
+# This file is part of NOMAD. See https://nomad-lab.eu for further info.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Long-lived conversion server and its client.
+
+Converting a single file is dominated by starting the interpreter and importing
+lxml, yaml and click. The server keeps a warm process listening on a Unix domain
+socket and runs the conversions in a pool of worker processes.
+
+Each request is a single line of json naming the input file and the options of
+the command line tool:
+    {"input_file": "/abs/NXfoo.yaml", "output_file": null, "verbose": false,
+     "do_not_store_nxdl": false, "check_consistency": false}
+and is answered by a single line of json:
+    {"ok": true, "output_file": "/abs/NXfoo.nxdl.xml", "stdout": "..."}
+    {"ok": false, "error": "...", "error_type": "ValueError", "stdout": "..."}
+"""
+
+import contextlib
+import io
+import json
+import os
+import signal
+import socket
+import socketserver
+import stat
+import sys
+import tempfile
+import threading
+
+__all__ = [
+    "DEFAULT_SOCKET_PATH",
+    "ConversionServer",
+    "ServerUnavailableError",
+    "ensure_private_directory",
+    "get_default_socket_path",
+    "is_server_running",
+    "request_conversion",
+    "serve",
+]
+
+REQUEST_OPTIONS = ("output_file", "verbose", "do_not_store_nxdl", "check_consistency")
+# Time to wait for a server to accept a connection before falling back
+CONNECT_TIMEOUT = 0.5
+SOCKET_NAME = "nyaml2nxdl.sock"
+
+
+class ServerUnavailableError(ConnectionError):
+    """
+    No conversion server of the current user accepts connections on the socket.
+    Nothing has been sent to a server, so the conversion can run in-process.
+    """
+
+
+def get_default_socket_path():
+    """
+    Return the default socket path in a directory that only the current user
+    can access: the runtime directory of the user (XDG_RUNTIME_DIR) if there is
+    one, else a directory of the user in the temporary directory (see
+    ensure_private_directory).
+    """
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir and os.path.isdir(runtime_dir):
+        return os.path.join(runtime_dir, SOCKET_NAME)
+    user = f"nyaml2nxdl-{os.getuid()}" if hasattr(os, "getuid") else "nyaml2nxdl"
+    return os.path.join(tempfile.gettempdir(), user, SOCKET_NAME)
+
+
+DEFAULT_SOCKET_PATH = get_default_socket_path()
+
+
+def is_owned_by_current_user(path_stat):
+    """Check whether the file of the stat result belongs to the current user."""
+    return not hasattr(os, "getuid") or path_stat.st_uid == os.getuid()
+
+
+def ensure_private_directory(directory):
+    """
+    Create the directory only accessible by the current user, if it does not
+    exist. Raise PermissionError if it exists but other users can access it.
+    """
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    dir_stat = os.lstat(directory)
+    if (
+        not stat.S_ISDIR(dir_stat.st_mode)
+        or not is_owned_by_current_user(dir_stat)
+        or dir_stat.st_mode & 0o077
+    ):
+        raise PermissionError(
+            f"The socket directory {directory} has to be a directory only "
+            "accessible by the current user."
+        )
+
+
+def check_socket_owner(socket_path):
+    """
+    Raise PermissionError if the socket does not belong to the current user, so
+    that no request is sent to a server of another user.
+    """
+    if not is_owned_by_current_user(os.stat(socket_path)):
+        raise PermissionError(
+            f"The socket {socket_path} does not belong to the current user."
+        )
+
+
+def run_conversion_request(request):
+    """Run a single conversion request and return the response dict."""
+    # pylint: disable=import-outside-toplevel
+    from nyaml.cli import convert_file
+
+    options = {key: request[key] for key in REQUEST_OPTIONS if key in request}
+    stdout = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(stdout):
+            output_file = convert_file(request["input_file"], **options)
+    except Exception as exc:  # pylint: disable=broad-exception-caught
+        return {
+            "ok": False,
+            "error": str(exc),
+            "error_type": type(exc).__name__,
+            "stdout": stdout.getvalue(),
+        }
+    return {"ok": True, "output_file": output_file, "stdout": stdout.getvalue()}
+
+
+class _ConversionRequestHandler(socketserver.StreamRequestHandler):
+    """Answer every json line received on a connection."""
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict) or "input_file" not in request:
+                    raise ValueError("Request must be a json object with 'input_file'.")
+            except ValueError as exc:
+                response = {
+                    "ok": False,
+                    "error": f"Invalid request: {exc}",
+                    "error_type": "ValueError",
+                    "stdout": "",
+                }
+            else:
+                response = self.server.convert(request)
+            self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+
+if hasattr(socketserver, "ThreadingUnixStreamServer"):
+
+    class ConversionServer(socketserver.ThreadingUnixStreamServer):
+        """Unix socket server dispatching conversion requests to worker processes."""
+
+        daemon_threads = True
+
+        def __init__(self, socket_path, jobs=None):
+            self.socket_path = socket_path
+            self.jobs = jobs or os.cpu_count() or 1
+            self.executor = self.new_executor()
+            self.executor_lock = threading.Lock()
+            super().__init__(socket_path, _ConversionRequestHandler)
+
+        def server_bind(self):
+            # The socket is created accessible by the current user only
+            old_umask = os.umask(0o177)
+            try:
+                super().server_bind()
+            finally:
+                os.umask(old_umask)
+
+        def new_executor(self):
+            """Return a pool of jobs worker processes."""
+            # Imported here, as the clients do not need the process pool
+            # pylint: disable=import-outside-toplevel
+            from concurrent.futures import ProcessPoolExecutor
+
+            return ProcessPoolExecutor(max_workers=self.jobs)
+
+        def convert(self, request):
+            """
+            Run a conversion request in the worker processes and return the
+            response. If a worker process dies, the request is answered with an
+            error and the workers are restarted for the next requests.
+            """
+            # pylint: disable=import-outside-toplevel
+            from concurrent.futures.process import BrokenProcessPool
+
+            executor = self.executor
+            try:
+                return executor.submit(run_conversion_request, request).result()
+            except BrokenProcessPool as exc:
+                print(
+                    f"nyaml2nxdl server: a worker process died ({exc}), "
+                    "restarting the worker processes",
+                    file=sys.stderr,
+                )
+                self.restart_executor(executor)
+                return {
+                    "ok": False,
+                    "error": f"The worker process of the conversion died: {exc}",
+                    "error_type": type(exc).__name__,
+                    "stdout": "",
+                }
+
+        def restart_executor(self, broken_executor):
+            """Replace the broken executor, unless another request did already."""
+            with self.executor_lock:
+                if self.executor is broken_executor:
+                    self.executor = self.new_executor()
+            broken_executor.shutdown(wait=False)
+
+        def warm_up(self):
+            """Start the worker processes, so that the first request is fast."""
+            for future in [self.executor.submit(int) for _ in range(self.jobs)]:
+                future.result()
+
+        def server_close(self):
+            super().server_close()
+            self.executor.shutdown()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+else:  # pragma: no cover
+    ConversionServer = None
+
+
+def is_server_running(socket_path):
+    """
+    Check whether a server of the current user accepts connections on
+    socket_path.
+    """
+    if not hasattr(socket, "AF_UNIX"):
+        return False
+    try:
+        check_socket_owner(socket_path)
+    except OSError:
+        return False
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(CONNECT_TIMEOUT)
+        try:
+            sock.connect(socket_path)
+        except OSError:
+            return False
+    return True
+
+
+def serve(socket_path=DEFAULT_SOCKET_PATH, jobs=None):
+    """Run a conversion server on socket_path until it is interrupted."""
+    if ConversionServer is None:
+        raise ValueError("The conversion server needs Unix domain socket support.")
+    if socket_path == DEFAULT_SOCKET_PATH:
+        ensure_private_directory(os.path.dirname(socket_path))
+    if is_server_running(socket_path):
+        raise ValueError(f"A conversion server is already running on {socket_path}.")
+    if os.path.exists(socket_path):
+        # Left over from a server that has been killed
+        os.unlink(socket_path)
+
+    def stop(signum, frame):  # pylint: disable=unused-argument
+        raise KeyboardInterrupt
+
+    with ConversionServer(socket_path, jobs) as server:
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, stop)
+        server.warm_up()
+        print(f"nyaml2nxdl server listening on {socket_path}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+def request_conversion(socket_path, input_file, **options):
+    """
+    Send a conversion request to the server listening on socket_path.
+
+    Paths are made absolute, as the server does not share the working directory
+    of the client. Raise ServerUnavailableError if no server of the current user
+    accepts the connection, in which case nothing has been sent. Other OSErrors
+    come up once the server may have received the request.
+    """
+    if not hasattr(socket, "AF_UNIX"):
+        raise ServerUnavailableError(
+            "Unix domain sockets are not supported on this platform."
+        )
+    request = {"input_file": os.path.abspath(input_file)}
+    for key in REQUEST_OPTIONS:
+        if key in options:
+            request[key] = options[key]
+    if request.get("output_file") is not None:
+        request["output_file"] = os.path.abspath(request["output_file"])
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(CONNECT_TIMEOUT)
+        try:
+            check_socket_owner(socket_path)
+            sock.connect(socket_path)
+        except (
+            FileNotFoundError,
+            ConnectionRefusedError,
+            PermissionError,
+            socket.timeout,
+        ) as exc:
+            raise ServerUnavailableError(
+                f"No conversion server on {socket_path}: {exc}"
+            ) from exc
+        sock.settimeout(None)
+        sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        with sock.makefile("rb") as stream:
+            line = stream.readline()
+    if not line:
+        raise ConnectionError(f"The server on {socket_path} closed the connection.")
+    return json.loads(line)
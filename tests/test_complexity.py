@@ -0,0 +1,144 @@
+#
+# Copyright The NOMAD Authors.
+#
+# This file is part of NOMAD. See https://nomad-lab.eu for further info.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Tests that the run time and peak memory of both converters grow about linearly
+with the size of the definitions.
+
+The sizes are doubled from about 1k to 8k elements of synthetic definitions
+(see nyaml.generator), and the exponent of a power law is fitted to the
+measurements. A quadratic part (e.g. a search through all comments for each
+element) shows up as an exponent well above one.
+"""
+
+import math
+import time
+import tracemalloc
+
+import lxml.etree as ET
+import pytest
+
+from nyaml.generator import generate_yaml
+from nyaml.nxdl2nyaml import Nxdl2yaml
+from nyaml.nyaml2nxdl import nyaml2nxdl
+
+# About 25 nxdl elements per group of the synthetic definitions
+WIDTHS = (40, 80, 160, 320)
+REPEAT = 3
+MAX_TIME_EXPONENT = 1.4
+MAX_MEMORY_EXPONENT = 1.25
+
+
+def fit_exponent(sizes, values):
+    """Return the exponent of the least squares fit of values = c * sizes**k."""
+    log_sizes = [math.log(size) for size in sizes]
+    log_values = [math.log(value) for value in values]
+    mean_size = sum(log_sizes) / len(log_sizes)
+    mean_value = sum(log_values) / len(log_values)
+    covariance = sum(
+        (log_size - mean_size) * (log_value - mean_value)
+        for log_size, log_value in zip(log_sizes, log_values)
+    )
+    variance = sum((log_size - mean_size) ** 2 for log_size in log_sizes)
+    return covariance / variance
+
+
+def measure(func):
+    """Return the shortest run time of func and its peak of traced memory."""
+    times = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return min(times), peak
+
+
+@pytest.fixture(scope="module")
+def generated_definitions(tmp_path_factory):
+    """Write the yaml and nxdl files of the synthetic definitions of all sizes."""
+    tmp_path = tmp_path_factory.mktemp("complexity")
+    definitions = []
+    for width in WIDTHS:
+        yaml_file = tmp_path / f"NXsynthetic_{width}.yaml"
+        nxdl_file = tmp_path / f"NXsynthetic_{width}.nxdl.xml"
+        yaml_file.write_text(
+            generate_yaml(width=width, comment_density=0.5, seed=width),
+            encoding="utf-8",
+        )
+        nyaml2nxdl(str(yaml_file), str(nxdl_file), False)
+        n_elements = sum(1 for _ in ET.parse(str(nxdl_file)).iter())
+        definitions.append((n_elements, yaml_file, nxdl_file))
+    return definitions
+
+
+def check_growth(sizes, measurements):
+    """Check that the fitted exponents of time and memory are below the limits."""
+    times, peaks = zip(*measurements)
+    time_exponent = fit_exponent(sizes, times)
+    memory_exponent = fit_exponent(sizes, peaks)
+    details = ", ".join(
+        f"{size}: {run_time * 1e3:.1f} ms, {peak / 2**20:.1f} MiB"
+        for size, (run_time, peak) in zip(sizes, measurements)
+    )
+    assert time_exponent < MAX_TIME_EXPONENT, (
+        f"Run time grows with exponent {time_exponent:.2f} ({details})"
+    )
+    assert memory_exponent < MAX_MEMORY_EXPONENT, (
+        f"Peak memory grows with exponent {memory_exponent:.2f} ({details})"
+    )
+
+
+def test_fit_exponent():
+    """The fit recovers the exponent of a power law."""
+    sizes = [1000, 2000, 4000, 8000]
+    assert fit_exponent(sizes, [3 * size for size in sizes]) == pytest.approx(1)
+    assert fit_exponent(sizes, [size**2 / 7 for size in sizes]) == pytest.approx(2)
+
+
+def test_nyaml2nxdl_growth(generated_definitions, tmp_path):
+    """The yaml -> nxdl conversion runs in about linear time and memory."""
+    sizes = []
+    measurements = []
+    for n_elements, yaml_file, _ in generated_definitions:
+        out_file = str(tmp_path / yaml_file.name.replace(".yaml", ".nxdl.xml"))
+        sizes.append(n_elements)
+        measurements.append(
+            measure(lambda: nyaml2nxdl(str(yaml_file), out_file, False))
+        )
+    assert sizes[0] > 800 and sizes[-1] > 7 * sizes[0]
+    check_growth(sizes, measurements)
+
+
+def test_nxdl2nyaml_growth(generated_definitions, tmp_path):
+    """The nxdl -> yaml conversion runs in about linear time and memory."""
+    sizes = []
+    measurements = []
+    for n_elements, _, nxdl_file in generated_definitions:
+        out_file = str(tmp_path / nxdl_file.name.replace(".nxdl.xml", ".yaml"))
+        sizes.append(n_elements)
+        measurements.append(
+            measure(
+                lambda: Nxdl2yaml([], []).print_yml(str(nxdl_file), out_file, False)
+            )
+        )
+    check_growth(sizes, measurements)
@@ -19,11 +19,25 @@
 Tests for nyaml2nxdl tool
 """
 
+import copy
 import filecmp
+import importlib.util
+import io
+import json
 import os
+import pstats
 import re
+import shutil
+import socket
+import stat
+import subprocess
+import textwrap
 import yaml
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
 from pathlib import Path
 from collections import OrderedDict
@@ -32,11 +46,48 @@ import lxml.etree as ET
 import pytest
 from click.testing import CliRunner
 
+import nyaml
 from nyaml import cli as nyaml2nxdl
+from nyaml import generator
 from nyaml import nyaml2nxdl as nyaml2nxdl_forward_tools
-from nyaml.comment_collector import CommentCollector
-from nyaml.helper import LineLoader, remove_namespace_from_tag
-from nyaml.nyaml2nxdl import get_nxdl_copyright_license, handle_each_part_doc
+from nyaml import profiling
+from nyaml.comment_collector import CommentCollector, collect_yaml_line_info
+from nyaml.helper import (
+    CLineLoader,
+    LineDictConstructor,
+    LineLoader,
+    PyLineLoader,
+    remove_namespace_from_tag,
+    write_text_if_changed,
+)
+from nyaml.manifest import MANIFEST_NAME
+from nyaml.nxdl2nyaml import (
+    Nxdl2yaml,
+    nxdl_tree_to_yaml,
+    parse,
+    stream_nxdl_to_yaml,
+)
+from nyaml.client import parse_server_request
+from nyaml.server import (
+    ConversionServer,
+    ServerUnavailableError,
+    ensure_private_directory,
+    get_default_socket_path,
+    is_server_running,
+    request_conversion,
+)
+from nyaml.nyaml2nxdl import (
+    YamlKeyword,
+    classify_keyword,
+    get_conversion_context,
+    get_nxdl_copyright_license,
+    get_nxdl_copyright_license_from_text,
+    handle_each_part_doc,
+    new_conversion_context,
+    nxdl_from_yaml_dict,
+    read_nxdl_prologue,
+    yml_reader_from_text,
+)
 
 LATEST_COPYRIGHT_YEAR = f"{datetime.now().year}-{datetime.now().year}"
 LATEST_COPYRIGHT = rf"# Copyright \(C\) {LATEST_COPYRIGHT_YEAR} NeXus International Advisory Committee \(NIAC\)"
@@ -402,8 +453,9 @@ def test_fileline_error():
     result = CliRunner().invoke(nyaml2nxdl.launch_tool, [test_yml_file])
     assert result.exit_code == 1
     assert "13" in str(result.exception)
-    os.remove(out_nxdl)
-    os.remove(out_yaml)
+    # No (temporary or partial) output is left behind
+    assert not os.path.exists(out_nxdl)
+    assert not os.path.exists(out_yaml)
 
     test_yml_file = "tests/data/NXfilelineError2.yaml"
     out_nxdl = "tests/data/NXfilelineError2.nxdl.xml"
@@ -411,8 +463,9 @@ def test_fileline_error():
     result = CliRunner().invoke(nyaml2nxdl.launch_tool, [test_yml_file])
     assert result.exit_code == 1
     assert "21" in str(result.exception)
-    os.remove(out_nxdl)
-    os.remove(out_yaml)
+    # No (temporary or partial) output is left behind
+    assert not os.path.exists(out_nxdl)
+    assert not os.path.exists(out_yaml)
 
     test_yml_file = "tests/data/NXfilelineError3.yaml"
     out_nxdl = "tests/data/NXfilelineError3.nxdl.xml"
@@ -420,8 +473,9 @@ def test_fileline_error():
     result = CliRunner().invoke(nyaml2nxdl.launch_tool, [test_yml_file])
     assert result.exit_code == 1
     assert "25" in str(result.exception)
-    os.remove(out_nxdl)
-    os.remove(out_yaml)
+    # No (temporary or partial) output is left behind
+    assert not os.path.exists(out_nxdl)
+    assert not os.path.exists(out_yaml)
 
     sys.stdout.write("Test on xml -> yml fileline error handling okay.\n")
 
@@ -567,6 +621,54 @@ has not the same root entries!!"
     sys.stdout.write("Test on yml -> xml -> yml okay.\n")
 
 
+@pytest.mark.skipif(CLineLoader is None, reason="PyYAML is built without libyaml")
+def test_libyaml_line_loader():
+    """
+    Check that the libyaml loader finds the same line numbers as the python one.
+    """
+    yaml_files = sorted(Path(__file__).parent.glob("data/**/*.yaml"))
+    assert yaml_files
+    for yaml_file in yaml_files:
+        text = yaml_file.read_text(encoding="utf-8")
+        try:
+            expected = PyLineLoader(text).get_single_data()
+        except yaml.YAMLError:
+            with pytest.raises(yaml.YAMLError):
+                CLineLoader(text).get_single_data()
+            continue
+        loaded = CLineLoader(text).get_single_data()
+        assert loaded == expected, yaml_file
+        assert collect_yaml_line_info(loaded) == collect_yaml_line_info(expected)
+
+
+def test_line_numbers_side_table():
+    """
+    Check that the line numbers of the yaml keys are kept out of the loaded data.
+    """
+    yaml_text = textwrap.dedent(
+        """\
+        category: base
+        doc: A doc.
+        NXlines(NXobject):
+
+          data(NX_NUMBER):
+            unit: NX_ANY
+        """
+    )
+    loaded = LineLoader(yaml_text).get_single_data()
+
+    assert loaded == yaml.safe_load(yaml_text)
+    assert loaded.lines == {"category": 1, "doc": 2, "NXlines(NXobject)": 3}
+    assert loaded["NXlines(NXobject)"].lines == {"data(NX_NUMBER)": 5}
+    assert loaded["NXlines(NXobject)"]["data(NX_NUMBER)"].lines == {"unit": 6}
+
+    class LinelessLoader(LineDictConstructor, yaml.Loader):
+        """Loader that does not say how to find the lines of the keys."""
+
+    with pytest.raises(TypeError):
+        LinelessLoader(yaml_text)
+
+
 def test_yml_consistency_comment_parsing():
     """Test comments parsing from yaml. Convert 'yaml' input file to '.nxdl.xml' and
     '.nxdl.xml' to '.yaml'
@@ -620,6 +722,269 @@ def test_conversion():
     Path.unlink(new_root)
 
 
+def test_in_memory_conversion(tmp_path, monkeypatch):
+    """
+    Check that the string API converts NXentry back and forth without creating
+    any file and agrees with the command line tool.
+    """
+    monkeypatch.chdir(tmp_path)
+    nxdl_text = (Path(__file__).parent / "data" / "NXentry.nxdl.xml").read_text(
+        encoding="utf-8"
+    )
+
+    yaml_text = nyaml.nxdl_to_yaml(nxdl_text)
+    assert "++ SHA HASH ++" in yaml_text
+    # The stored nxdl is used as long as the yaml part is unchanged
+    assert nyaml.yaml_to_nxdl(yaml_text) == nxdl_text
+    plain_yaml_text = nyaml.nxdl_to_yaml(nxdl_text, store_nxdl=False)
+    assert yaml_text.startswith(plain_yaml_text)
+    plain_nxdl_text = nyaml.yaml_to_nxdl(plain_yaml_text)
+    assert not list(tmp_path.iterdir())
+
+    nxdl_file = tmp_path / "NXentry.nxdl.xml"
+    nxdl_file.write_text(nxdl_text, encoding="utf-8")
+    result = CliRunner().invoke(nyaml2nxdl.launch_tool, [str(nxdl_file)])
+    assert result.exit_code == 0
+    yaml_file = tmp_path / "NXentry_parsed.yaml"
+    assert yaml_file.read_text(encoding="utf-8") == yaml_text
+
+    yaml_file.write_text(plain_yaml_text, encoding="utf-8")
+    result = CliRunner().invoke(nyaml2nxdl.launch_tool, [str(yaml_file)])
+    assert result.exit_code == 0
+    out_file = tmp_path / "NXentry_parsed.nxdl.xml"
+    assert out_file.read_text(encoding="utf-8") == plain_nxdl_text
+
+
+def test_parallel_conversions_in_threads():
+    """
+    Check that conversions running concurrently in a thread pool give the same
+    results as the same conversions running one after the other.
+    """
+    data = Path(__file__).parent / "data"
+    nxdl_text = (data / "NXentry.nxdl.xml").read_text(encoding="utf-8")
+    jobs = [(nyaml.nxdl_to_yaml, nxdl_text)]
+    # Yaml without license (copyright of the current year) and with the license
+    # of NXentry, with and without stored nxdl
+    jobs.append((nyaml.yaml_to_nxdl, nyaml.nxdl_to_yaml(nxdl_text, store_nxdl=False)))
+    for yaml_file in sorted((data / "yaml2nxdl").glob("NX*.yaml")):
+        jobs.append((nyaml.yaml_to_nxdl, yaml_file.read_text(encoding="utf-8")))
+    jobs = jobs * (200 // len(jobs) + 1)
+
+    expected = [convert(text) for convert, text in jobs]
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        futures = [executor.submit(convert, text) for convert, text in jobs]
+        results = [future.result() for future in futures]
+
+    assert len(results) >= 200
+    assert results == expected
+
+
+def test_print_yml_single_write(tmp_path, monkeypatch):
+    """
+    Check that print_yml writes into a file-like object and opens the output
+    file only once, however many nodes the nxdl has.
+    """
+    nxdl_file = Path(__file__).parent / "data" / "NXentry.nxdl.xml"
+    yaml_file = tmp_path / "NXentry.yaml"
+    buffer = io.StringIO()
+    Nxdl2yaml([], []).print_yml(str(nxdl_file), buffer, False)
+
+    opened_files = []
+    builtin_open = open
+
+    def counting_open(file, *args, **kwargs):
+        opened_files.append(str(file))
+        return builtin_open(file, *args, **kwargs)
+
+    monkeypatch.setattr("builtins.open", counting_open)
+    Nxdl2yaml([], []).print_yml(str(nxdl_file), str(yaml_file), False)
+    monkeypatch.undo()
+
+    # Written through a single temporary file (see write_text_if_changed)
+    written_files = [name for name in opened_files if name.startswith(str(tmp_path))]
+    assert len(written_files) == 1
+    assert written_files[0].startswith(str(yaml_file))
+    assert yaml_file.read_text(encoding="utf-8") == buffer.getvalue()
+    assert os.listdir(tmp_path) == [yaml_file.name]
+
+
+def test_stream_nxdl_to_yaml():
+    """
+    Check that the incremental nxdl -> yaml conversion gives the same yaml as the
+    conversion of the whole tree, and that it drops the written subtrees.
+    """
+    data = Path(__file__).parent / "data"
+    for nxdl_file in [
+        data / "NXentry.nxdl.xml",
+        data / "Ref_NXtest_links.nxdl.xml",
+        data / "Ref_NXentry.nxdl.xml",
+        data / "yaml2nxdl" / "ref_enumerations.nxdl.xml",
+    ]:
+        nxdl_text = nxdl_file.read_text(encoding="utf-8")
+        yaml_out = io.StringIO()
+        stream_nxdl_to_yaml(str(nxdl_file), yaml_out)
+        assert yaml_out.getvalue() == nyaml.nxdl_to_yaml(nxdl_text, store_nxdl=False)
+
+    # A definition with many children, parsed by iterparse in several chunks
+    fields = "".join(
+        f'<field name="field_{ind}"><doc>Field {ind}.</doc></field><!-- {ind} -->'
+        for ind in range(5000)
+    )
+    nxdl_text = (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<definition xmlns="http://definition.nexusformat.org/nxdl/3.1" '
+        'name="NXstream" extends="NXobject" type="group" category="base">'
+        f"<doc>Streaming test.</doc>{fields}</definition>\n"
+    )
+    root_sizes = []
+    parse_node = Nxdl2yaml.parse_node
+
+    def recording_parse_node(self, file_out, node, depth, verbose):
+        if depth == 1:
+            root_sizes.append(len(node.getparent()))
+        return parse_node(self, file_out, node, depth, verbose)
+
+    yaml_out = io.StringIO()
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(Nxdl2yaml, "parse_node", recording_parse_node)
+        stream_nxdl_to_yaml(io.BytesIO(nxdl_text.encode("utf-8")), yaml_out)
+    assert yaml_out.getvalue() == nyaml.nxdl_to_yaml(nxdl_text, store_nxdl=False)
+    # The definition only holds the children that iterparse has read ahead
+    assert len(root_sizes) == 10000
+    assert max(root_sizes) < 2000
+
+    late_symbols = nxdl_text.replace(
+        "</definition>", "<symbols><doc>Too late.</doc></symbols></definition>"
+    )
+    with pytest.raises(ValueError, match="root level symbols"):
+        stream_nxdl_to_yaml(io.BytesIO(late_symbols.encode("utf-8")), io.StringIO())
+
+
+def test_single_read_conversion(tmp_path, monkeypatch):
+    """
+    Check that the converter reads each input file once, and splits a yaml into
+    lines only once for the stored nxdl and the comments.
+    """
+    nxdl_file = tmp_path / "NXentry.nxdl.xml"
+    shutil.copy(Path(__file__).parent / "data" / "NXentry.nxdl.xml", nxdl_file)
+    yaml_file = tmp_path / "NXentry_plain.yaml"
+    yaml_file.write_text(
+        nyaml.nxdl_to_yaml(nxdl_file.read_text(encoding="utf-8"), store_nxdl=False),
+        encoding="utf-8",
+    )
+
+    opened_files = []
+    builtin_open = open
+
+    def counting_open(file, *args, **kwargs):
+        opened_files.append(str(file))
+        return builtin_open(file, *args, **kwargs)
+
+    def fail_split_lines(text):
+        raise AssertionError("The yaml has been split into lines twice.")
+
+    monkeypatch.setattr("builtins.open", counting_open)
+    monkeypatch.setattr("nyaml.comment_collector.split_lines", fail_split_lines)
+    nyaml2nxdl.convert_file(str(yaml_file))
+    nyaml2nxdl.convert_file(str(nxdl_file), output_file=str(tmp_path / "out.yaml"))
+    monkeypatch.undo()
+
+    assert opened_files.count(str(yaml_file)) == 1
+    assert opened_files.count(str(nxdl_file)) == 1
+
+
+def best_conversion_time(convert, text, repeat=3):
+    """Return the best of several timings of convert(text) in seconds."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        convert(text)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def make_nxdl_with_docs(n_fields):
+    """Return a base class with n_fields documented fields."""
+    fields = "".join(
+        f'<field name="field_{ind}" type="NX_FLOAT"><doc>Field {ind}.</doc></field>'
+        for ind in range(n_fields)
+    )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<definition xmlns="http://definition.nexusformat.org/nxdl/3.1" '
+        'name="NXscaling" extends="NXobject" type="group" category="base">'
+        f'<doc>Scaling test.</doc><group type="NXentry">{fields}</group>'
+        "</definition>\n"
+    )
+
+
+def test_nxdl2yaml_scales_linearly():
+    """
+    Check that the nxdl -> yaml conversion time grows linearly with the number of
+    doc elements (8 times the docs must take far less than 64 times as long).
+    """
+    small, large = make_nxdl_with_docs(250), make_nxdl_with_docs(2000)
+    convert = lambda text: nyaml.nxdl_to_yaml(text, store_nxdl=False)
+    ratio = best_conversion_time(convert, large) / best_conversion_time(convert, small)
+    assert ratio < 20, f"Conversion time grows {ratio:.1f} times for 8 times the docs."
+
+
+def make_commented_yaml(n_fields):
+    """Return a base class with n_fields fields, each preceded by a comment."""
+    fields = "".join(
+        f"  # Comment on field {ind}.\n  field_{ind}:\n    doc: Field {ind}.\n"
+        for ind in range(n_fields)
+    )
+    return f"category: base\ndoc: Scaling test.\nNXscaling:\n{fields}"
+
+
+def test_comment_lookup_scales_linearly():
+    """
+    Check that the time to build the nxdl tree from a heavily commented yaml grows
+    linearly with the number of comments.
+    """
+
+    def build_time(n_fields, repeat=3):
+        timings = []
+        for _ in range(repeat):
+            with new_conversion_context():
+                yaml_dict = nyaml2nxdl_forward_tools.yml_reader_from_text(
+                    make_commented_yaml(n_fields)
+                )
+                start = time.perf_counter()
+                nyaml2nxdl_forward_tools.recursive_build(
+                    ET.Element("definition"), yaml_dict["NXscaling"], False
+                )
+                timings.append(time.perf_counter() - start)
+        return min(timings)
+
+    ratio = build_time(800) / build_time(100)
+    assert ratio < 20, f"Build time grows {ratio:.1f} times for 8 times the comments."
+
+
+def test_comment_extraction_scales_linearly():
+    """
+    Check that the time to extract the comments of a yaml grows linearly with the
+    length of the file.
+    """
+
+    def extraction_time(n_fields, repeat=3):
+        yaml_text = make_commented_yaml(n_fields)
+        loaded_yaml = LineLoader(yaml_text).get_single_data()
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            comment_blocks = CommentCollector(
+                loaded_obj=loaded_yaml, input_text=yaml_text
+            )
+            comment_blocks.extract_all_comment_blocks()
+            timings.append(time.perf_counter() - start)
+        return min(timings)
+
+    ratio = extraction_time(2000) / extraction_time(250)
+    assert ratio < 20, f"Extraction time grows {ratio:.1f} times for 8 times the lines."
+
+
 def test_yaml2nxdl_doc():
     """To test the doc style from yaml to nxdl."""
     pwd = Path(__file__).parent
@@ -718,6 +1083,38 @@ def test_yaml2nxdl_no_tabs(tmp_path):
     compare_nxdl_doc(ref_nxdl, out_nxdl)
 
 
+def test_yaml2nxdl_doc_serialization():
+    """
+    Check that multi-line docs are indented below their tag, and that the docs
+    are written as they are (e.g. urls with escapes).
+    """
+    yaml_text = textwrap.dedent(
+        """\
+        category: base
+        doc: |
+          First line.
+          See https://example.org/a%20b?x=%2F.
+        NXescape(NXobject):
+          data(NX_NUMBER):
+            doc: |
+              First line of data.
+              Second line of data.
+        """
+    )
+    nxdl_text = nyaml.yaml_to_nxdl(yaml_text)
+
+    assert 'xsi:schemaLocation="http://definition.nexusformat.org/nxdl/3.1 ' in (
+        nxdl_text
+    )
+    assert "\n        See https://example.org/a%20b?x=%2F.\n    </doc>" in nxdl_text
+    assert (
+        "        <doc>\n"
+        "            First line of data.\n"
+        "            Second line of data.\n"
+        "        </doc>"
+    ) in nxdl_text
+
+
 # the copyright-year needs to be a part of the yaml file as not necessarily
 # every yaml file that gets a yaml2nxdl conversion is necessarily a new definition
 # namely the current use case does not allow people to recover accidentally
@@ -921,6 +1318,7 @@ def test_forward_conversion(test_input):
     runner = CliRunner()
     result = runner.invoke(nyaml2nxdl.launch_tool, [test_yml_input_file])
     assert result.exit_code == 0
+    check_and_replace_latest_copyright(Path(test_xml_output_file))
 
     with open(test_xml_output_file, "r", encoding="utf-8") as logfile:
         log = logfile.readlines()
@@ -957,3 +1355,699 @@ def test_backward_conversion(test_input):
     assert log == ref
 
     os.remove(test_yml_output_file)
+
+
+def test_batch_conversion(tmp_path):
+    """
+    Convert a directory and a glob pattern in parallel and check that a broken
+    definition is reported without stopping the other conversions.
+    """
+    data = Path(__file__).parent / "data"
+    yaml_dir = tmp_path / "nyaml"
+    xml_dir = tmp_path / "nxdl"
+    yaml_dir.mkdir()
+    xml_dir.mkdir()
+    for name in ("NXtest_links.yaml", "NXnested_symbols.yaml", "NXfilelineError1.yaml"):
+        shutil.copy(data / name, yaml_dir / name)
+    shutil.copy(data / "NXentry.nxdl.xml", xml_dir / "NXentry.nxdl.xml")
+    (yaml_dir / "README.md").write_text("Not a NeXus definition.")
+
+    result = CliRunner().invoke(
+        nyaml2nxdl.launch_tool,
+        [str(yaml_dir), str(xml_dir / "*.nxdl.xml"), "--jobs", "2"],
+    )
+    assert result.exit_code == 1
+    assert "1 of 4 file(s) failed to convert" in result.output
+    assert "NXfilelineError1.yaml" in result.output
+    for name in ("NXtest_links", "NXnested_symbols"):
+        ref = data / f"Ref_{name}.nxdl.xml"
+        out = yaml_dir / f"{name}.nxdl.xml"
+        assert find_matches(out, ["<doc>"]) == find_matches(ref, ["<doc>"])
+    assert (xml_dir / "NXentry_parsed.yaml").is_file()
+
+    result = CliRunner().invoke(
+        nyaml2nxdl.launch_tool,
+        [str(yaml_dir / "NXtest_links.yaml"), str(yaml_dir / "NXnested_symbols.yaml")],
+    )
+    assert result.exit_code == 0, result.output
+
+    result = CliRunner().invoke(
+        nyaml2nxdl.launch_tool,
+        [str(yaml_dir), "--output-file", str(tmp_path / "out.nxdl.xml")],
+    )
+    assert result.exit_code != 0
+    assert "--output-file can only be used" in result.output
+
+
+def test_incremental_conversion(tmp_path):
+    """
+    Check that the build manifest skips unchanged definitions without touching
+    their outputs, and converts them again once input, output or options change.
+    """
+    data = Path(__file__).parent / "data"
+    yaml_file = tmp_path / "NXtest_links.yaml"
+    xml_file = tmp_path / "NXentry.nxdl.xml"
+    shutil.copy(data / "NXtest_links.yaml", yaml_file)
+    shutil.copy(data / "NXentry.nxdl.xml", xml_file)
+    nxdl_out = tmp_path / "NXtest_links.nxdl.xml"
+    yaml_out = tmp_path / "NXentry_parsed.yaml"
+    inputs = [str(yaml_file), str(xml_file)]
+
+    result = CliRunner().invoke(
+        nyaml2nxdl.launch_tool, [*inputs, "--incremental", "--jobs", "1"]
+    )
+    assert result.exit_code == 0, result.output
+    assert (tmp_path / MANIFEST_NAME).is_file()
+    stats = {out: out.stat().st_mtime_ns for out in (nxdl_out, yaml_out)}
+
+    result = CliRunner().invoke(
+        nyaml2nxdl.launch_tool, [*inputs, "--incremental", "--jobs", "1"]
+    )
+    assert result.exit_code == 0, result.output
+    assert result.output.count("Up to date") == 2
+    assert stats == {out: out.stat().st_mtime_ns for out in (nxdl_out, yaml_out)}
+
+    # Modified input, deleted output and changed options are converted again
+    yaml_file.write_text(yaml_file.read_text() + "\n")
+    yaml_out.unlink()
+    result = CliRunner().invoke(
+        nyaml2nxdl.launch_tool, [*inputs, "--incremental", "--jobs", "1"]
+    )
+    assert result.exit_code == 0, result.output
+    assert "Up to date" not in result.output
+    assert yaml_out.is_file()
+
+    result = CliRunner().invoke(
+        nyaml2nxdl.launch_tool, [str(xml_file), "--incremental"]
+    )
+    assert result.output.startswith("Up to date")
+    result = CliRunner().invoke(
+        nyaml2nxdl.launch_tool, [str(xml_file), "--incremental", "--do-not-store-nxdl"]
+    )
+    assert result.exit_code == 0, result.output
+    assert "Up to date" not in result.output
+    assert "SHA HASH" not in yaml_out.read_text()
+
+
+@pytest.mark.skipif(
+    ConversionServer is None, reason="Needs Unix domain socket support."
+)
+def test_conversion_server(tmp_path):
+    """
+    Check that conversions are sent to a running server and that the client falls
+    back to converting in-process when no server is listening.
+    """
+    data = Path(__file__).parent / "data"
+    yaml_file = tmp_path / "NXtest_links.yaml"
+    shutil.copy(data / "NXtest_links.yaml", yaml_file)
+    xml_file = tmp_path / "NXentry.nxdl.xml"
+    shutil.copy(data / "NXentry.nxdl.xml", xml_file)
+    error_file = tmp_path / "NXfilelineError1.yaml"
+    shutil.copy(data / "NXfilelineError1.yaml", error_file)
+    socket_path = str(tmp_path / "nyaml.sock")
+
+    server = ConversionServer(socket_path, jobs=1)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        assert is_server_running(socket_path)
+        response = request_conversion(socket_path, str(yaml_file))
+        assert response["ok"], response
+        assert Path(response["output_file"]) == tmp_path / "NXtest_links.nxdl.xml"
+
+        response = request_conversion(socket_path, str(error_file))
+        assert not response["ok"]
+        assert "13" in response["error"]
+
+        result = CliRunner().invoke(
+            nyaml2nxdl.launch_tool,
+            [str(xml_file), str(yaml_file), "--socket", socket_path],
+        )
+        assert result.exit_code == 0, result.output
+        assert (tmp_path / "NXentry_parsed.yaml").is_file()
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+    assert not Path(socket_path).exists()
+
+    (tmp_path / "NXtest_links.nxdl.xml").unlink()
+    result = CliRunner().invoke(
+        nyaml2nxdl.launch_tool, [str(yaml_file), "--socket", socket_path]
+    )
+    assert result.exit_code == 0, result.output
+    assert (tmp_path / "NXtest_links.nxdl.xml").is_file()
+
+
+def test_conversion_server_access(tmp_path, monkeypatch):
+    """
+    Check that the socket of the server and its default directory are private to
+    the user and that clients refuse sockets of other users.
+    """
+    private_dir = tmp_path / "private"
+    ensure_private_directory(str(private_dir))
+    assert stat.S_IMODE(private_dir.stat().st_mode) == 0o700
+    private_dir.chmod(0o755)
+    with pytest.raises(PermissionError):
+        ensure_private_directory(str(private_dir))
+
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmp_path))
+    assert get_default_socket_path() == str(tmp_path / "nyaml2nxdl.sock")
+    monkeypatch.delenv("XDG_RUNTIME_DIR")
+    assert Path(get_default_socket_path()).parent.name == f"nyaml2nxdl-{os.getuid()}"
+
+    socket_path = str(tmp_path / "nyaml.sock")
+    server = ConversionServer(socket_path, jobs=1)
+    try:
+        assert server.jobs == 1
+        assert stat.S_IMODE(os.stat(socket_path).st_mode) == 0o600
+        assert is_server_running(socket_path)
+        monkeypatch.setattr(os, "getuid", lambda: os.stat(socket_path).st_uid + 1)
+        assert not is_server_running(socket_path)
+        with pytest.raises(ServerUnavailableError, match="current user"):
+            request_conversion(socket_path, str(tmp_path / "NXtest.yaml"))
+    finally:
+        monkeypatch.undo()
+        server.server_close()
+
+
+# Converts the file of its arguments through nyaml.client and prints which of
+# the heavy modules have been imported
+CLIENT_SCRIPT = """
+import sys
+from nyaml.client import main
+assert main(sys.argv[1:]) == 0
+print(sorted({"click", "lxml", "nyaml.cli", "yaml"} & set(sys.modules)))
+"""
+
+
+def test_conversion_server_client(tmp_path, monkeypatch):
+    """
+    Check that the command line client sends single files to the server without
+    importing the converters, and leaves all other command lines to launch_tool.
+    """
+    monkeypatch.delenv("NYAML_SOCKET", raising=False)
+    yaml_file = tmp_path / "NXtest_links.yaml"
+    shutil.copy(Path(__file__).parent / "data" / "NXtest_links.yaml", yaml_file)
+    socket_path = str(tmp_path / "nyaml.sock")
+
+    flags = {"verbose": False, "do_not_store_nxdl": False, "check_consistency": False}
+    assert parse_server_request([str(yaml_file), "--socket", socket_path]) == (
+        socket_path,
+        str(yaml_file),
+        {**flags, "output_file": None},
+    )
+    assert (
+        parse_server_request(
+            ["--verbose", str(yaml_file), "--output-file=out.nxdl.xml"]
+        )
+        is None
+    )
+    monkeypatch.setenv("NYAML_SOCKET", socket_path)
+    assert parse_server_request(
+        ["--verbose", str(yaml_file), "--output-file=out.nxdl.xml"]
+    ) == (
+        socket_path,
+        str(yaml_file),
+        {**flags, "verbose": True, "output_file": "out.nxdl.xml"},
+    )
+    for args in [
+        [str(yaml_file), "--incremental"],
+        [str(yaml_file), str(yaml_file)],
+        [str(tmp_path)],
+        ["--serve"],
+        [str(yaml_file), "--socket"],
+    ]:
+        assert parse_server_request(args) is None, args
+    monkeypatch.delenv("NYAML_SOCKET")
+
+    server = ConversionServer(socket_path, jobs=1)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        result = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                CLIENT_SCRIPT,
+                str(yaml_file),
+                "--socket",
+                socket_path,
+            ],
+            capture_output=True,
+            text=True,
+            check=False,
+        )
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.splitlines()[-1] == "[]"
+    assert (tmp_path / "NXtest_links.nxdl.xml").is_file()
+
+
+def test_conversion_server_broken_worker(tmp_path, capsys):
+    """
+    Check that the server restarts its worker processes when one of them dies,
+    and that a client does not convert a file again once the server accepted it.
+    """
+    yaml_file = tmp_path / "NXtest_links.yaml"
+    shutil.copy(Path(__file__).parent / "data" / "NXtest_links.yaml", yaml_file)
+    socket_path = str(tmp_path / "nyaml.sock")
+
+    server = ConversionServer(socket_path, jobs=1)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        # A worker process dies, e.g. killed when running out of memory
+        with pytest.raises(BrokenProcessPool):
+            server.executor.submit(os._exit, 1).result()
+        response = request_conversion(socket_path, str(yaml_file))
+        assert not response["ok"]
+        assert response["error_type"] == "BrokenProcessPool"
+        assert "worker process died" in capsys.readouterr().err
+        response = request_conversion(socket_path, str(yaml_file))
+        assert response["ok"], response
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+    (tmp_path / "NXtest_links.nxdl.xml").unlink()
+    # A server which accepts the request, but closes the connection
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as listener:
+        listener.bind(socket_path)
+        listener.listen()
+
+        def drop_request():
+            connection, _ = listener.accept()
+            with connection:
+                connection.recv(4096)
+
+        thread = threading.Thread(target=drop_request, daemon=True)
+        thread.start()
+        with pytest.raises(ConnectionError) as exc_info:
+            nyaml2nxdl.convert_file_with_server(socket_path, str(yaml_file))
+        thread.join()
+    assert not isinstance(exc_info.value, ServerUnavailableError)
+    assert not (tmp_path / "NXtest_links.nxdl.xml").exists()
+
+
+def test_nxdl_tree_reuse():
+    """
+    Check that the nxdl -> yaml conversion leaves the parsed tree untouched, so
+    that it can be converted several times.
+    """
+    data = Path(__file__).parent / "data"
+    for nxdl_file in [
+        data / "Ref_NXentry.nxdl.xml",
+        data / "nxdl2yaml" / "NXdimensionsType.nxdl.xml",
+        data / "Ref_NXtest_links.nxdl.xml",
+    ]:
+        nxdl_text = nxdl_file.read_text(encoding="utf-8")
+        pi_comments, root = parse(str(nxdl_file))
+        tree_before = ET.tostring(root)
+
+        yaml_text = nxdl_tree_to_yaml(root, pi_comments)
+        assert ET.tostring(root) == tree_before
+        assert yaml_text == nyaml.nxdl_to_yaml(nxdl_text, store_nxdl=False)
+        assert nxdl_tree_to_yaml(root, pi_comments) == yaml_text
+
+        yaml_no_comments = nxdl_tree_to_yaml(root, pi_comments, include_comment=False)
+        assert ET.tostring(root) == tree_before
+        assert not [
+            line for line in yaml_no_comments.splitlines() if line.startswith("#")
+        ]
+        assert nxdl_tree_to_yaml(root, pi_comments) == yaml_text
+
+
+def test_yaml_dict_reuse():
+    """
+    Check that the yaml -> nxdl conversion leaves the loaded yaml untouched, so
+    that it can be converted several times.
+    """
+    data = Path(__file__).parent / "data"
+    for yaml_file in [
+        data / "NXnested_symbols.yaml",
+        data / "yaml2nxdl" / "enumerations.yaml",
+        data / "yaml2nxdl" / "NXcomment.yaml",
+        data / "yaml2nxdl" / "NXattributes.yaml",
+        data / "yaml2nxdl" / "NXdimensionsType.yaml",
+    ]:
+        yaml_text = yaml_file.read_text(encoding="utf-8")
+        with new_conversion_context() as context:
+            yml_appdef = yml_reader_from_text(yaml_text)
+        comment_blocks = context.comment_blocks
+        yaml_before = copy.deepcopy(yml_appdef)
+
+        nxdl_text = nxdl_from_yaml_dict(yml_appdef, comment_blocks)
+        assert yml_appdef == yaml_before
+        assert collect_yaml_line_info(yml_appdef) == collect_yaml_line_info(yaml_before)
+        assert nxdl_text == nyaml.yaml_to_nxdl(yaml_text)
+        assert nxdl_from_yaml_dict(yml_appdef, comment_blocks) == nxdl_text
+
+
+def test_conversion_context_scope():
+    """
+    Check that no conversion context is left behind by the readers and the
+    conversions, so that no state is shared between conversions.
+    """
+    yaml_text = generator.generate_yaml(width=2)
+    with pytest.raises(RuntimeError):
+        get_conversion_context()
+    assert yml_reader_from_text(yaml_text)["category"] == "base"
+    nxdl_text = nyaml.yaml_to_nxdl(yaml_text)
+    with pytest.raises(RuntimeError):
+        get_conversion_context()
+
+    with new_conversion_context() as context:
+        yml_reader_from_text(yaml_text)
+        assert get_conversion_context() is context
+        assert context.category == "base"
+        assert context.comment_blocks is not None
+        assert nyaml.yaml_to_nxdl(yaml_text) == nxdl_text
+        assert get_conversion_context() is context
+
+
+@pytest.mark.parametrize(
+    "keyword, expected",
+    [
+        ("(NXentry)", YamlKeyword("", "NXentry", "group", True)),
+        ("entry(NXentry)", YamlKeyword("entry", "NXentry", "group", True)),
+        ("data(NX_NUMBER)", YamlKeyword("data", "NX_NUMBER", "field", True)),
+        ("AXISNAME", YamlKeyword("AXISNAME", "", "field", False)),
+        ("\\@units", YamlKeyword("\\@units", "", "attribute", False)),
+        ("target(link)", YamlKeyword("target", "link", "link", False)),
+        ("detector(choice)", YamlKeyword("detector", "choice", "choice", False)),
+        ("symbols", YamlKeyword("symbols", "", "symbols", False)),
+        ("doc", YamlKeyword("doc", "", "doc", False)),
+        ("unit", YamlKeyword("unit", "", "unit", False)),
+        ("dim", YamlKeyword("dim", "", "dimensions", False)),
+        ("nameType", YamlKeyword("nameType", "", "field", True)),
+        ("(NX_CHAR)", YamlKeyword("", "NX_CHAR", "", True)),
+    ],
+)
+def test_classify_keyword(keyword, expected):
+    """Check the kind of nxdl element a yaml key is resolved to."""
+    assert classify_keyword(keyword) == expected
+    hits = classify_keyword.cache_info().hits
+    assert classify_keyword(keyword) is classify_keyword(keyword)
+    assert classify_keyword.cache_info().hits == hits + 2
+
+
+def test_deeply_nested_definition():
+    """
+    Check that definitions nested deeper than the recursion limit convert in both
+    directions. With huge_tree, libxml2 parses nxdl nested up to 2048 levels,
+    otherwise up to 256 levels only.
+    """
+    depth = 2000
+    assert depth > sys.getrecursionlimit()
+    lines = ["category: base", "doc: Deep.", "type: group", "NXdeep(NXobject):"]
+    for level in range(depth):
+        indent = "  " * (level + 1)
+        lines.append(f"{indent}level_{level}(NXcollection):")
+        lines.append(f"{indent}  doc: Level {level}.")
+    yaml_text = "\n".join(lines) + "\n"
+
+    nxdl_text = nyaml.yaml_to_nxdl(yaml_text)
+    assert f'<group name="level_{depth - 1}" type="NXcollection">' in nxdl_text
+    with pytest.raises(ET.XMLSyntaxError):
+        nyaml.nxdl_to_yaml(nxdl_text)
+    yaml_out = nyaml.nxdl_to_yaml(nxdl_text, store_nxdl=False, huge_tree=True)
+    assert f"level_{depth - 1}(NXcollection):" in yaml_out
+    assert nyaml.yaml_to_nxdl(yaml_out) == nxdl_text
+
+    with pytest.raises(ET.XMLSyntaxError):
+        stream_nxdl_to_yaml(io.BytesIO(nxdl_text.encode("utf-8")), io.StringIO())
+    streamed_yaml = io.StringIO()
+    stream_nxdl_to_yaml(
+        io.BytesIO(nxdl_text.encode("utf-8")), streamed_yaml, huge_tree=True
+    )
+    assert streamed_yaml.getvalue() == yaml_out
+
+
+def test_nxdl_copyright_license_from_prologue(tmp_path):
+    """
+    Check that the license is taken from the part of the nxdl in front of the
+    definition only.
+    """
+    nxdl_text = (Path(__file__).parent / "data/NXentry.nxdl.xml").read_text(
+        encoding="utf-8"
+    )
+    nxdl_file = tmp_path / "NXentry.nxdl.xml"
+    nxdl_file.write_text(nxdl_text, encoding="utf-8")
+    license_text = get_nxdl_copyright_license(nxdl_file)
+    assert "Copyright (C) 2010-2020" in license_text
+
+    class PrologueOnlyStream(io.StringIO):
+        """Stream that fails when read past the definition start tag."""
+
+        def readline(self, *args):
+            if self.tell() > nxdl_text.index("<definition"):
+                raise AssertionError("The nxdl has been read past its prologue.")
+            return super().readline(*args)
+
+    prologue = read_nxdl_prologue(PrologueOnlyStream(nxdl_text))
+    assert prologue.startswith(nxdl_text[: nxdl_text.index("<definition")])
+    assert prologue.endswith("\n") and "<definition" in prologue.splitlines()[-1]
+    assert get_nxdl_copyright_license_from_text(prologue) == license_text
+
+    # A copyright comment after the definition start tag is not a license
+    body_license = f"<!--\n{license_text}-->\n"
+    nxdl_file.write_text(
+        nxdl_text.replace(license_text, "").replace(
+            "</definition>", f"{body_license}</definition>"
+        ),
+        encoding="utf-8",
+    )
+    assert get_nxdl_copyright_license(nxdl_file) == ""
+    assert get_nxdl_copyright_license(tmp_path / "NXmissing.nxdl.xml") is None
+
+
+def test_write_text_if_changed(tmp_path):
+    """
+    Check that an output is only replaced if its content changes, atomically and
+    keeping its permissions.
+    """
+    output = tmp_path / "NXtest.nxdl.xml"
+    assert write_text_if_changed(output, "<definition/>\n")
+    output.chmod(0o640)
+    first_stat = output.stat()
+
+    assert not write_text_if_changed(output, "<definition/>\n")
+    assert output.stat().st_mtime_ns == first_stat.st_mtime_ns
+    assert output.stat().st_ino == first_stat.st_ino
+
+    assert write_text_if_changed(output, "<definition>\n</definition>\n")
+    assert output.read_text(encoding="utf-8") == "<definition>\n</definition>\n"
+    # Replaced by a new file, with the permissions of the old one
+    assert output.stat().st_ino != first_stat.st_ino
+    assert oct(output.stat().st_mode & 0o777) == oct(0o640)
+    assert os.listdir(tmp_path) == [output.name]
+
+
+def test_unchanged_output_keeps_mtime(tmp_path):
+    """Check that converting a file again leaves its unchanged output untouched."""
+    yaml_file = tmp_path / "NXentry.yaml"
+    shutil.copy(Path(__file__).parent / "data/Ref_NXentry.yaml", yaml_file)
+    output = tmp_path / "NXentry.nxdl.xml"
+    args = [str(yaml_file), "--output-file", str(output)]
+    result = CliRunner().invoke(nyaml2nxdl.launch_tool, args)
+    assert result.exit_code == 0, result.output
+    first_stat = output.stat()
+
+    result = CliRunner().invoke(nyaml2nxdl.launch_tool, args)
+    assert result.exit_code == 0, result.output
+    assert output.stat().st_mtime_ns == first_stat.st_mtime_ns
+    assert output.stat().st_ino == first_stat.st_ino
+
+
+def load_bench():
+    """Import the benchmark suite, which is not part of the nyaml package."""
+    bench_file = Path(__file__).resolve().parents[1] / "benchmarks" / "bench.py"
+    spec = importlib.util.spec_from_file_location("bench", bench_file)
+    bench = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(bench)
+    return bench
+
+
+def test_bench(tmp_path):
+    """Check the json results of the benchmarks and their comparison."""
+    bench = load_bench()
+    data = Path(__file__).parent / "data"
+    inputs = [str(data / "Ref_NXentry.yaml"), str(data / "NXentry.nxdl.xml")]
+    output = tmp_path / "bench.json"
+    result = CliRunner().invoke(
+        bench.main,
+        [*inputs, "--repeat", "2", "--synthetic", "3", "--output", str(output)],
+    )
+    assert result.exit_code == 0, result.output
+    results = json.loads(output.read_text(encoding="utf-8"))
+    assert results["format_version"] == bench.BENCH_FORMAT_VERSION
+    assert results["repeat"] == 2
+    phases = {
+        entry["name"]: (entry["direction"], list(entry["phases"]))
+        for entry in results["benchmarks"]
+    }
+    yaml_phases = [
+        "footer_split",
+        "yaml_load",
+        "comment_extraction",
+        "recursive_build",
+        "pretty_format_xml",
+    ]
+    assert phases == {
+        "Ref_NXentry.yaml": ("yaml2nxdl", yaml_phases),
+        "NXentry.nxdl.xml": ("nxdl2yaml", ["nxdl_parse", "xmlparse"]),
+        "synthetic-3.yaml": ("yaml2nxdl", yaml_phases),
+        "synthetic-3.nxdl.xml": ("nxdl2yaml", ["nxdl_parse", "xmlparse"]),
+    }
+    for entry in results["benchmarks"]:
+        for phase_times in entry["phases"].values():
+            assert 0 <= phase_times["min"] <= phase_times["median"]
+
+    result = CliRunner().invoke(
+        bench.main,
+        [inputs[0], "--repeat", "1", "--synthetic", "1", "--compare", str(output)],
+    )
+    assert result.exit_code == 0, result.output
+    assert "ratio" in result.output
+    assert json.loads(result.output[result.output.index("{") :])["repeat"] == 1
+
+    result = CliRunner().invoke(bench.main, [str(tmp_path), "--synthetic", "1"])
+    assert result.exit_code == 2
+    assert "No yaml or nxdl files found" in result.output
+
+
+@pytest.mark.parametrize(
+    "options",
+    [
+        {"width": 3, "depth": 3, "xref_density": 0.5, "comment_density": 0.5},
+        {"width": 4, "symbols": 0, "attributes": 0, "enumerations": 0},
+        {"width": 20, "category": "application", "seed": 7},
+    ],
+)
+def test_generated_definition_round_trip(options):
+    """
+    The synthetic definitions are deterministic and convert to nxdl and back to
+    yaml giving the same nxdl again.
+    """
+    yaml_text = generator.generate_yaml(**options)
+    assert yaml_text == generator.generate_yaml(**options)
+    assert yaml_text != generator.generate_yaml(**{**options, "seed": 1})
+
+    nxdl_text = generator.generate_nxdl(**options)
+    root = ET.fromstring(nxdl_text.encode("utf-8"))
+    groups = root.findall(".//{*}group")
+    assert len(groups) == generator.count_groups(
+        options["width"], options.get("depth", 1)
+    )
+    assert nyaml.yaml_to_nxdl(nyaml.nxdl_to_yaml(nxdl_text)) == nxdl_text
+
+
+def test_profile_conversions():
+    """
+    The phases and handler calls of the conversions inside profile_conversions
+    are recorded, and nothing is recorded outside of it.
+    """
+    yaml_text = generator.generate_yaml(width=3)
+    profiles = []
+    with profiling.profile_conversions(callback=profiles.append) as profile:
+        assert profiling.get_profile() is profile
+        nxdl_text = nyaml.yaml_to_nxdl(yaml_text)
+        nyaml.nxdl_to_yaml(nxdl_text)
+    assert profiles == [profile]
+    assert profiling.get_profile() is None
+
+    assert list(profile.phase_times) == [
+        "footer_split",
+        "yaml_load",
+        "comment_extraction",
+        "tree_build",
+        "serialization",
+        "nxdl_parse",
+        "yaml_emission",
+    ]
+    assert set(profile.phase_calls.values()) == {1}
+    n_groups = len(ET.fromstring(nxdl_text.encode("utf-8")).findall(".//{*}group"))
+    assert profile.handler_calls["Nxdl2yaml.handle_group_or_field"] >= n_groups
+    assert profile.handler_calls["xml_handle_fields_or_group"] >= n_groups
+    assert profile.handler_calls["xml_handle_doc"] > 0
+    assert profile.as_dict()["handlers"] == profile.handler_calls
+
+    nyaml.yaml_to_nxdl(yaml_text)
+    assert profile.phase_calls["tree_build"] == 1
+
+
+def test_profile_option(tmp_path):
+    """--profile prints the phases and handler calls of the conversions."""
+    yaml_file = tmp_path / "NXsynthetic.yaml"
+    yaml_file.write_text(generator.generate_yaml(width=3), encoding="utf-8")
+    result = CliRunner().invoke(nyaml2nxdl.launch_tool, [str(yaml_file), "--profile"])
+    assert result.exit_code == 0, result.output
+    assert (tmp_path / "NXsynthetic.nxdl.xml").is_file()
+    for name in ("yaml_load", "tree_build", "serialization", "xml_handle_doc"):
+        assert name in result.output
+    assert "nxdl_parse" not in result.output
+
+    result = CliRunner().invoke(
+        nyaml2nxdl.launch_tool, [str(tmp_path), "--profile", "--jobs", "2"]
+    )
+    assert result.exit_code == 0, result.output
+    assert "Nxdl2yaml.handle_group_or_field" in result.output
+    assert "yaml_emission" in result.output
+
+
+def test_cpu_profile_option(tmp_path):
+    """
+    --cpu-profile writes the pstats dump of a single conversion and, with
+    --speedscope, its flame graph. --cpu-profile-dir writes one per input file.
+    """
+    for name in ("NXfirst", "NXsecond"):
+        (tmp_path / f"{name}.yaml").write_text(
+            generator.generate_yaml(width=3, name=name), encoding="utf-8"
+        )
+    profile_file = tmp_path / "out.prof"
+    result = CliRunner().invoke(
+        nyaml2nxdl.launch_tool,
+        [
+            str(tmp_path / "NXfirst.yaml"),
+            "--cpu-profile",
+            str(profile_file),
+            "--speedscope",
+        ],
+    )
+    assert result.exit_code == 0, result.output
+    functions = {func[2] for func in pstats.Stats(str(profile_file)).stats}
+    assert "build_nxdl_tree" in functions
+
+    speedscope = json.loads(
+        (tmp_path / "out.speedscope.json").read_text(encoding="utf-8")
+    )
+    frames = speedscope["shared"]["frames"]
+    (profile,) = speedscope["profiles"]
+    assert profile["type"] == "sampled"
+    assert len(profile["samples"]) == len(profile["weights"]) > 0
+    assert profile["endValue"] == pytest.approx(sum(profile["weights"]))
+    stacks = [[frames[ind]["name"] for ind in sample] for sample in profile["samples"]]
+    assert any("build_nxdl_tree" in stack for stack in stacks)
+
+    profile_dir = tmp_path / "profiles"
+    result = CliRunner().invoke(
+        nyaml2nxdl.launch_tool,
+        [str(tmp_path / "*.yaml"), "--cpu-profile-dir", str(profile_dir), "-j", "2"],
+    )
+    assert result.exit_code == 0, result.output
+    assert sorted(path.name for path in profile_dir.iterdir()) == [
+        "NXfirst.yaml.prof",
+        "NXsecond.yaml.prof",
+    ]
+
+    result = CliRunner().invoke(
+        nyaml2nxdl.launch_tool,
+        [str(tmp_path / "*.yaml"), "--cpu-profile", str(profile_file)],
+    )
+    assert result.exit_code != 0
+    assert "--cpu-profile-dir" in result.output